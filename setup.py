@@ -50,6 +50,7 @@ setup(name='talos',
       [console_scripts]
       talos = talos.run_tests:main
       talos-results = talos.results:main
+      talos-symbol-server = talos.profiler.symbolServer:main
       """,
       test_suite = "tests"
       )
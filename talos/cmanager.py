@@ -2,8 +2,10 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import time
 import mozinfo
 import threading
+from array import array
 
 
 class CounterManager(object):
@@ -31,9 +33,22 @@ class CounterManager(object):
     def getCounterValue(self, counterName):
         """Returns the last value of the counter 'counterName'"""
 
+    def getCounterValues(self):
+        """Returns a dict of the last values of all registered counters"""
+        return dict([(counter, self.getCounterValue(counter))
+                     for counter in self.registeredCounters])
+
+    def getPidCounterValues(self):
+        """Returns a dict of the last values of the counters for each PID,
+        for the managers that can tell them apart"""
+        return {}
+
     def updatePidList(self):
         """Updates the list of PIDs we're interested in"""
 
+    def close(self):
+        """Releases the resources used to read the counters"""
+
 
 if mozinfo.os == 'linux':
     from talos.cmanager_linux import LinuxCounterManager \
@@ -46,6 +61,25 @@ else:  # mac
         as DefaultCounterManager
 
 
+class CounterSeries(object):
+    """timestamps (in seconds since the epoch) and values of a counter"""
+
+    def __init__(self):
+        self.timestamps = array('d')
+        self.values = array('d')
+
+    def append(self, timestamp, value):
+        self.timestamps.append(timestamp)
+        self.values.append(value)
+
+    def __len__(self):
+        return len(self.values)
+
+    def to_dict(self):
+        return {'timestamps': self.timestamps.tolist(),
+                'values': self.values.tolist()}
+
+
 class CounterManagement(object):
     def __init__(self, process, counters, resolution):
         """
@@ -61,6 +95,9 @@ class CounterManagement(object):
         self._process = process
         self._counter_results = \
             dict([(counter, []) for counter in self._raw_counters])
+        self._counter_series = dict([(counter, CounterSeries())
+                                     for counter in self._raw_counters])
+        self._pid_series = {}  # counter: {pid: CounterSeries}
 
         self._resolution = resolution
         self._stop = threading.Event()
@@ -68,12 +105,32 @@ class CounterManagement(object):
 
     def _collect(self):
         manager = DefaultCounterManager(self._process, self._raw_counters)
-        while not self._stop.wait(self._resolution):
-            # Get the output from all the possible counters
-            for count_type in self._raw_counters:
-                val = manager.getCounterValue(count_type)
-                if val:
-                    self._counter_results[count_type].append(val)
+        next_time = time.time()
+        try:
+            while True:
+                # wait for the next tick, not counting the time spent
+                # collecting the counters
+                next_time = max(next_time + self._resolution, time.time())
+                if self._stop.wait(next_time - time.time()):
+                    break
+                timestamp = time.time()
+                # Get the output from all the possible counters
+                values = manager.getCounterValues()
+                for count_type in self._raw_counters:
+                    val = values.get(count_type)
+                    if val:
+                        self._counter_results[count_type].append(val)
+                    if val is not None:
+                        self._counter_series[count_type].append(timestamp,
+                                                                val)
+                for pid, pid_values in \
+                        manager.getPidCounterValues().items():
+                    for count_type, val in pid_values.items():
+                        self._pid_series.setdefault(count_type, {})\
+                            .setdefault(pid, CounterSeries())\
+                            .append(timestamp, val)
+        finally:
+            manager.close()
 
     def start(self):
         self._thread.start()
@@ -85,3 +142,20 @@ class CounterManagement(object):
     def results(self):
         assert not self._thread.is_alive()
         return self._counter_results
+
+    def time_series(self):
+        """
+        return the timestamped values of each counter, and of each of the
+        browser processes when available:
+        {counter: {'timestamps': [...], 'values': [...],
+                   'pids': {pid: {'timestamps': [...], 'values': [...]}}}}
+        """
+        assert not self._thread.is_alive()
+        series = {}
+        for counter, counter_series in self._counter_series.items():
+            series[counter] = counter_series.to_dict()
+            series[counter]['pids'] = dict(
+                [(pid, pid_series.to_dict()) for pid, pid_series in
+                 self._pid_series.get(counter, {}).items()]
+            )
+        return series
@@ -4,10 +4,25 @@
 
 import os
 import re
+import time
+import platform
 import subprocess
+import psutil
 from cmanager import CounterManager
 from mozprocess import pid as mozpid
 
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def _kernel_version():
+    match = re.match(r'(\d+)\.(\d+)', platform.release())
+    return tuple(int(i) for i in match.groups()) if match else (0, 0)
+
+
+# since linux 4.7, the data field of /proc/<pid>/statm counts all the
+# private writeable mappings, i.e. what GetPrivateBytes sums from maps
+STATM_PRIVATE_BYTES = _kernel_version() >= (4, 7)
+
 
 def xrestop(binary='xrestop'):
     """
@@ -122,6 +137,44 @@ def GetResidentSize(pids):
     return RSS
 
 
+class StatmSampler(object):
+    """
+    Reads the memory of processes from /proc/<pid>/statm.
+
+    The files are kept open between samples and read again from their
+    start, which is much cheaper than parsing /proc/<pid>/maps or
+    /proc/<pid>/status each time.
+    """
+
+    def __init__(self):
+        self._fds = {}
+        self.last = {}  # pid: (resident, private) bytes of the last sample
+
+    def _read(self, pid):
+        fd = self._fds.get(pid)
+        if fd is None:
+            fd = os.open('/proc/%s/statm' % pid, os.O_RDONLY)
+            self._fds[pid] = fd
+        os.lseek(fd, 0, os.SEEK_SET)
+        return [int(i) for i in os.read(fd, 256).split()]
+
+    def sample(self, pids):
+        """Returns the total (resident, private) bytes of the processes"""
+        self.last = {}
+        for pid in pids:
+            # size resident shared text lib data dt, in pages
+            statm = self._read(pid)
+            self.last[pid] = (statm[1] * PAGE_SIZE, statm[5] * PAGE_SIZE)
+        return (sum(i[0] for i in self.last.values()),
+                sum(i[1] for i in self.last.values()))
+
+    def forget(self, pids=()):
+        """Closes the files of the processes not in pids"""
+        for pid in self._fds.keys():
+            if pid not in pids:
+                os.close(self._fds.pop(pid))
+
+
 def GetXRes(pids):
     """Returns the total bytes used by X or raises an error if total bytes
     is not available"""
@@ -155,6 +208,9 @@ class LinuxCounterManager(CounterManager):
                    "RSS": GetResidentSize,
                    "XRes": GetXRes}
 
+    # seconds between two updates of the child processes
+    pidListInterval = 5
+
     def __init__(self, process, counters=None,
                  childProcess="plugin-container"):
         """Args:
@@ -165,27 +221,74 @@ class LinuxCounterManager(CounterManager):
         CounterManager.__init__(self)
         self.childProcess = childProcess
         self.pidList = []
+        self.pidListTime = None
         self.primaryPid = mozpid.get_pids(process)[-1]
         os.stat('/proc/%s' % self.primaryPid)
+        self.sampler = StatmSampler()
 
         self._loadCounters()
         self.registerCounters(counters)
 
     def getCounterValue(self, counterName):
         """Returns the last value of the counter 'counterName'"""
+        return self.getCounterValues().get(counterName)
+
+    def getCounterValues(self):
+        """Returns the last values of all registered counters, reading the
+        memory of each process once"""
+        values = {}
         try:
             self.updatePidList()
-            return self.registeredCounters[counterName][0](self.pidList)
-        except:
-            return None
+            resident, private = self.sampler.sample(self.pidList)
+        except Exception:
+            # a process exited, find the remaining ones on the next sample
+            self.pidListTime = None
+            return values
+        for counter, (func, _) in self.registeredCounters.items():
+            if func is GetResidentSize:
+                values[counter] = resident
+            elif func is GetPrivateBytes and STATM_PRIVATE_BYTES:
+                values[counter] = private
+            else:
+                try:
+                    values[counter] = func(self.pidList)
+                except Exception:
+                    values[counter] = None
+        return values
+
+    def getPidCounterValues(self):
+        """Returns the values of the last sample of the RSS and Private Bytes
+        counters for each process"""
+        values = {}
+        for counter, (func, _) in self.registeredCounters.items():
+            if func is GetResidentSize:
+                index = 0
+            elif func is GetPrivateBytes and STATM_PRIVATE_BYTES:
+                index = 1
+            else:
+                continue
+            for pid, sample in self.sampler.last.items():
+                values.setdefault(pid, {})[counter] = sample[index]
+        return values
 
     def updatePidList(self):
-        """Updates the list of PIDs we're interested in"""
+        """Updates the list of PIDs we're interested in, at most every
+        pidListInterval seconds"""
+        now = time.time()
+        if self.pidListTime is not None and \
+                now - self.pidListTime < self.pidListInterval:
+            return
+        self.pidListTime = now
         try:
             self.pidList = [self.primaryPid]
-            childPids = mozpid.get_pids(self.childProcess)
-            for pid in childPids:
-                os.stat('/proc/%s' % pid)
-                self.pidList.append(pid)
+            children = psutil.Process(self.primaryPid).children(
+                recursive=True)
+            for child in children:
+                if child.name() == self.childProcess:
+                    self.pidList.append(child.pid)
         except:
             print "WARNING: problem updating child PID's"
+        self.sampler.forget(self.pidList)
+
+    def close(self):
+        self.sampler.forget()
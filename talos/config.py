@@ -4,7 +4,10 @@
 
 import argparse
 import os
+import sys
 import copy
+import psutil
+import subprocess
 
 from talos import utils, test
 
@@ -35,6 +38,21 @@ class _ListTests(argparse.Action):
         parser.exit()
 
 
+def cpu_list(value):
+    """parse a list of cpus like '0,2-3' into [0, 2, 3]"""
+    cpus = []
+    try:
+        for part in value.split(','):
+            if '-' in part:
+                first, last = part.split('-', 1)
+                cpus.extend(range(int(first), int(last) + 1))
+            else:
+                cpus.append(int(part))
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid cpu list: %r" % value)
+    return cpus
+
+
 def parse_args(argv=None):
     parser = argparse.ArgumentParser()
     add_arg = parser.add_argument
@@ -67,6 +85,10 @@ def parse_args(argv=None):
             help="How frequently to take samples (ms)")
     add_arg('--spsProfileEntries', dest="sps_profile_entries", type=int,
             help="How many samples to take with the profiler")
+    add_arg('--spsProfilePipeline', action="store_true",
+            dest="sps_profile_pipeline",
+            help="Symbolicate and archive the profiles of a cycle in a"
+                 " background process while the next cycle runs")
     add_arg('--extension', dest='extensions', action='append',
             default=['${talos}/talos-powers', '${talos}/pageloader'],
             help="Extension to install while running")
@@ -74,6 +96,13 @@ def parse_args(argv=None):
             help="Run tp tests as tp_fast")
     add_arg('--symbolsPath', dest='symbols_path',
             help="Path to the symbols for the build we are testing")
+    add_arg('--symbolServer', dest='symbol_server',
+            default='http://symbolapi.mozilla.org:80/talos/',
+            help="Symbol server asked for the symbols we don't have, e.g. a"
+                 " local talos-symbol-server")
+    add_arg('--symbolCache', dest='symbol_cache',
+            help="File keeping the symbols resolved while symbolicating"
+                 " profiles, to reuse them in later talos runs")
     add_arg('--xperf_path',
             help="Path to windows performance tool xperf.exe")
     add_arg('--test_timeout', type=int, default=1200,
@@ -82,6 +111,31 @@ def parse_args(argv=None):
             default=os.path.abspath('browser_failures.txt'),
             help="Filename to store the errors found during the test."
                  " Currently used for xperf only.")
+    add_arg('--browserOutputLines', dest='output_lines', type=int,
+            help="Only keep the last N lines of the browser output in"
+                 " memory, for timeout diagnostics")
+    add_arg('--browserOutputLog', dest='output_log',
+            help="gzip file the whole browser output is appended to")
+    add_arg('--profileCache', dest='profile_cache',
+            help="Directory where initialized profiles are cached and"
+                 " reused across tests and talos runs")
+    add_arg('--parallel', type=int, default=1,
+            help="Number of tests to run at the same time, each on its own"
+                 " set of cpus. Only use it for tests that are not"
+                 " sensitive to cpu contention")
+    add_arg('--browserCpus', dest='cpu_affinity', type=cpu_list,
+            help="cpus (e.g. '2-3') the browser processes are pinned to")
+    add_arg('--harnessCpus', dest='harness_cpus', type=cpu_list,
+            help="cpus (e.g. '0') talos itself and its counter collection"
+                 " are pinned to")
+    add_arg('--browserNice', dest='nice', type=int,
+            help="niceness of the browser processes")
+    add_arg('--browserSchedPolicy', dest='sched_policy',
+            choices=('other', 'batch', 'idle', 'fifo', 'rr'),
+            help="linux scheduling policy of the browser processes")
+    add_arg('--counterSeries', dest='counter_series', action='store_true',
+            help="Attach the timestamped values of the counters to the"
+                 " Perfherder output")
     add_arg('--noShutdown', dest='shutdown', action='store_true',
             help="Record time browser takes to shutdown after testing")
     add_arg('--setPref', action='append', default=[], dest="extraPrefs",
@@ -97,6 +151,13 @@ def parse_args(argv=None):
             help="turn on responsiveness collection")
     add_arg("--cycles", type=int,
             help="number of browser cycles to run")
+    add_arg("--minCycles", type=int, dest="min_cycles",
+            help="stop running browser cycles once at least this number"
+                 " have run and the results have converged (see --ciWidth)")
+    add_arg("--ciWidth", type=float, dest="ci_width",
+            help="with --minCycles, width of the 95%% confidence interval"
+                 " of the cycle results, relative to their mean, below"
+                 " which the results have converged")
     add_arg("--tpmanifest",
             help="manifest file to test")
     add_arg('--tpcycles', type=int,
@@ -138,6 +199,7 @@ DEFAULTS = dict(
     # base data for all tests
     basetest=dict(
         cycles=1,
+        ci_width=0.02,
         test_name_extension='',
         profile_path='${talos}/base_profile',
         responsiveness=False,
@@ -302,6 +364,8 @@ DEFAULTS = dict(
 # keys to generated self.config that are global overrides to tests
 GLOBAL_OVERRIDES = (
     'cycles',
+    'min_cycles',
+    'ci_width',
     'responsiveness',
     'sps_profile',
     'sps_profile_interval',
@@ -370,6 +434,33 @@ def check_webserver(config):
         config['webserver'] = 'localhost:15707'
 
 
+@validator
+def check_isolation(config):
+    if config['sched_policy'] and not sys.platform.startswith('linux'):
+        raise ConfigurationError(
+            "the scheduling policy can only be set on linux")
+    if config['sched_policy']:
+        # fail now rather than when starting the browser: chrt may be
+        # missing, and the real time policies need privileges
+        try:
+            with open(os.devnull, 'w') as devnull:
+                status = subprocess.call(
+                    utils.chrt_command(config['sched_policy'], ['true']),
+                    stdout=devnull, stderr=devnull)
+        except OSError:
+            status = None
+        if status != 0:
+            raise ConfigurationError(
+                "chrt could not set the %s scheduling policy%s" % (
+                    config['sched_policy'],
+                    " (real time policies need root or CAP_SYS_NICE)"
+                    if config['sched_policy'] in ('fifo', 'rr') else ""))
+    if (config['cpu_affinity'] or config['harness_cpus']) and \
+            not hasattr(psutil.Process, 'cpu_affinity'):
+        raise ConfigurationError(
+            "the cpu affinity can not be set on this platform")
+
+
 @validator
 def update_prefs(config):
     # if e10s is enabled, set prefs accordingly
@@ -528,11 +619,23 @@ def get_browser_config(config):
                 'repository': None,
                 'sourcestamp': None,
                 'symbols_path': None,
+                'symbol_cache': None,
+                'symbol_server': 'http://symbolapi.mozilla.org:80/talos/',
+                'sps_profile_pipeline': False,
                 'test_name_extension': '',
                 'test_timeout': 1200,
                 'webserver': '',
                 'xperf_path': None,
                 'error_filename': None,
+                'output_lines': None,
+                'output_log': None,
+                'parallel': 1,
+                'counter_series': False,
+                'cpu_affinity': None,
+                'harness_cpus': None,
+                'nice': None,
+                'sched_policy': None,
+                'profile_cache': None,
                 }
     browser_config = dict(title=config['title'])
     browser_config.update(dict([(i, config[i]) for i in required]))
@@ -8,6 +8,10 @@ Set up a browser environment before running a test.
 
 import os
 import re
+import json
+import errno
+import shutil
+import hashlib
 import tempfile
 import logging
 import mozfile
@@ -18,6 +22,112 @@ from talos import utils
 from talos.utils import TalosError
 from talos.sps_profile import SpsProfile
 
+# files where the add-on manager keeps the absolute path of the profile
+# (prefs.js through the extensions.xpiState pref)
+PROFILE_PATH_FILES = ('extensions.json', 'extensions.ini', 'prefs.js')
+# stand-ins for the profile path in cached profiles, as returned by
+# path_forms
+PROFILE_PATH_TOKENS = ('@TALOS_PROFILE_JSON2@', '@TALOS_PROFILE_JSON@',
+                       '@TALOS_PROFILE@')
+
+
+def hash_path(sha, path):
+    """update the sha hash object with the contents of a file or directory"""
+    if not os.path.isdir(path):
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), ''):
+                sha.update(chunk)
+        return
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            filename = os.path.join(root, name)
+            sha.update(os.path.relpath(filename, path))
+            hash_path(sha, filename)
+
+
+def path_forms(path):
+    """return path escaped twice as a JSON string, once, and as is"""
+    escaped = json.dumps(path)[1:-1]
+    return (json.dumps(escaped)[1:-1], escaped, path)
+
+
+def replace_profile_path(profile, old_forms, new_forms):
+    """
+    replace the forms of the profile path (see path_forms) in the files
+    of the profile which keep it
+    """
+    for name in PROFILE_PATH_FILES:
+        filename = os.path.join(profile, name)
+        if not os.path.isfile(filename):
+            continue
+        with open(filename, 'rb') as f:
+            data = f.read()
+        for old, new in zip(old_forms, new_forms):
+            data = data.replace(old, new)
+        with open(filename, 'wb') as f:
+            f.write(data)
+
+
+def copy_profile(src, dest):
+    """
+    copy a cached profile.
+
+    Files of the installed add-ons are never modified by the browser, so
+    they are hardlinked to the cache when possible. Everything else is
+    copied, as the browser updates some files (e.g. sqlite databases) in
+    place. The add-on manager state is updated with the new profile path,
+    otherwise the browser rebuilds it on its next start.
+    """
+    for root, dirs, files in os.walk(src):
+        relpath = os.path.relpath(root, src)
+        dest_dir = os.path.normpath(os.path.join(dest, relpath))
+        os.makedirs(dest_dir)
+        link = relpath.split(os.sep)[0] == 'extensions'
+        for name in files:
+            src_file = os.path.join(root, name)
+            dest_file = os.path.join(dest_dir, name)
+            if link and hasattr(os, 'link'):
+                try:
+                    os.link(src_file, dest_file)
+                    continue
+                except OSError:
+                    pass
+            shutil.copy2(src_file, dest_file)
+    replace_profile_path(dest, PROFILE_PATH_TOKENS, path_forms(dest))
+
+
+def store_profile(src, cache_dir):
+    """
+    store an initialized profile in the cache.
+
+    The profile is copied to a temporary directory next to cache_dir and
+    renamed into place, so other talos processes never see a partial
+    cache entry. The copy is removed if anything fails.
+    """
+    parent = os.path.dirname(cache_dir)
+    try:
+        os.makedirs(parent)
+    except OSError, e:
+        if e.errno != errno.EEXIST:
+            raise
+    tmp_dir = tempfile.mkdtemp(dir=parent)
+    profile = os.path.join(tmp_dir, 'profile')
+    try:
+        shutil.copytree(src, profile,
+                        symlinks=True,
+                        ignore=shutil.ignore_patterns('.parentlock',
+                                                      'lock',
+                                                      'parent.lock'))
+        replace_profile_path(profile, path_forms(src), PROFILE_PATH_TOKENS)
+        os.rename(profile, cache_dir)
+    except OSError, e:
+        # another talos process may have stored it first
+        if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+            raise
+    finally:
+        mozfile.remove(tmp_dir)
+
 
 class FFSetup(object):
     """
@@ -35,6 +145,11 @@ class FFSetup(object):
     this is basically working and negate any performance noise with the
     real test run (installing the profile the first time takes time).
 
+    When the browser config has a *profile_cache* directory, the initialized
+    profile is stored there once, keyed by the base profile contents, the
+    preferences, the extensions and the browser build. Later tests with the
+    same key get a copy of it instead of being initialized and run once.
+
     This class should be used as a context manager::
 
       with FFSetup(browser_config, test_config) as setup:
@@ -73,7 +188,8 @@ class FFSetup(object):
         self.env["LD_LIBRARY_PATH"] = \
             os.path.dirname(self.browser_config['browser_path'])
 
-    def _init_profile(self):
+    def _profile_settings(self):
+        """return the preferences and extensions of the profile"""
         preferences = dict(self.browser_config['preferences'])
         if self.test_config.get('preferences'):
             test_prefs = dict(
@@ -93,7 +209,10 @@ class FFSetup(object):
         extensions = self.browser_config['extensions'][:]
         if self.test_config.get('extensions'):
             extensions.append(self.test_config['extensions'])
+        return preferences, extensions
 
+    def _init_profile(self):
+        preferences, extensions = self._profile_settings()
         profile = Profile.clone(
             os.path.normpath(self.test_config['profile_path']),
             self.profile_dir,
@@ -130,6 +249,22 @@ class FFSetup(object):
             logging.info("Raw results:%s", results_raw)
             raise TalosError("browser failed to close after being initialized")
 
+    def _profile_cache_dir(self):
+        """return the cache directory of the initialized profile, or None"""
+        cache = self.browser_config.get('profile_cache')
+        if not cache:
+            return None
+        preferences, extensions = self._profile_settings()
+        sha = hashlib.sha1()
+        hash_path(sha, os.path.normpath(self.test_config['profile_path']))
+        sha.update(json.dumps(preferences, sort_keys=True))
+        for extension in extensions:
+            hash_path(sha, extension)
+        sha.update(self.browser_config['browser_path'])
+        sha.update(self.browser_config['buildid'])
+        sha.update(self.browser_config['init_url'])
+        return os.path.join(cache, sha.hexdigest())
+
     def _init_sps_profile(self):
         upload_dir = os.getenv('MOZ_UPLOAD_DIR')
         if self.test_config.get('sps_profile') and not upload_dir:
@@ -150,12 +285,26 @@ class FFSetup(object):
         logging.info('Initialising browser for %s test...',
                      self.test_config['name'])
         self._init_env()
-        self._init_profile()
+        cache_dir = self._profile_cache_dir()
+        cached = cache_dir and os.path.isdir(cache_dir)
         try:
-            self._run_profile()
+            if cached:
+                logging.info('Using cached profile %s', cache_dir)
+                copy_profile(cache_dir, self.profile_dir)
+            else:
+                self._init_profile()
+                self._run_profile()
         except:
+            # __exit__ is not called when __enter__ fails
             self.clean()
             raise
+        if cache_dir and not cached:
+            try:
+                store_profile(self.profile_dir, cache_dir)
+            except (OSError, IOError, shutil.Error), e:
+                # the profile is initialized, only the cache is missed
+                logging.warning('Failed to cache the profile in %s: %s',
+                                cache_dir, e)
         self._init_sps_profile()
         logging.info('Browser initialized.')
         return self
@@ -1,5 +1,11 @@
 import math
 
+try:
+    import numpy
+except ImportError:
+    # fall back to the pure python filters
+    numpy = None
+
 """
 data filters:
 takes a series of run data and applies statistical transforms to it
@@ -14,6 +20,10 @@ Each filter is a simple function, but it also have attached a special
   for filter in filters:
       data = filter(data)
   # data is filtered
+
+When numpy is available, :func:`summarize` computes the common summary
+numbers (min, max, mean, median, std) of many series at once on an array.
+The result is identical to calling the scalar filters on each series.
 """
 
 
@@ -88,6 +98,31 @@ def stddev(series):
     return variance(series)**0.5
 
 
+# two-sided 95% critical values of the Student's t distribution,
+# indexed by degrees of freedom - 1
+_t_95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262,
+         2.228, 2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101,
+         2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052,
+         2.048, 2.045, 2.042]
+
+
+@define_filter
+def confidence_interval(series):
+    """
+    half width of the 95% confidence interval of the mean:
+    http://en.wikipedia.org/wiki/Confidence_interval
+    needs at least two data points
+    """
+    _mean = mean(series)
+    sample_variance = sum([(i-_mean)**2 for i in series]) / \
+        float(len(series) - 1)
+    if len(series) - 1 <= len(_t_95):
+        t = _t_95[len(series) - 2]
+    else:
+        t = 1.96
+    return t * (sample_variance / len(series))**0.5
+
+
 @define_filter
 def dromaeo(series):
     """
@@ -120,6 +155,70 @@ def geometric_mean(series):
         total += math.log(i+1)
     return math.exp(total / len(series)) - 1
 
+# summaries of several series
+
+
+# scalar filters whose value is part of a summary, and their summary key
+summary_keys = {'mean': 'mean',
+                'median': 'median',
+                'stddev': 'std'}
+
+
+def summarize(series_list):
+    """
+    return a list of dicts with the 'min', 'max', 'mean', 'median' and 'std'
+    of each series of series_list; each series needs at least one data point
+    """
+    if numpy is not None and series_list:
+        lengths = set(len(series) for series in series_list)
+        if len(lengths) == 1:
+            return _summarize_array(series_list)
+    return [{'min': min(series),
+             'max': max(series),
+             'mean': mean(series),
+             'median': median(series),
+             'std': stddev(series)}
+            for series in series_list]
+
+
+def _summarize_array(series_list):
+    """
+    summarize series of the same length in one pass over a
+    (runs x series) matrix.
+
+    Reductions are done along the first (non contiguous) axis so that numpy
+    accumulates the values in the same order as the scalar filters do, which
+    keeps the results bit-for-bit identical.
+    """
+    matrix = numpy.array(series_list, dtype=numpy.float64).T
+    length = matrix.shape[0]
+
+    _sum = matrix[0].copy()
+    for row in matrix[1:]:
+        _sum += row
+    _mean = _sum / float(length)
+
+    _variance = numpy.zeros(matrix.shape[1])
+    for row in matrix:
+        _variance += (row - _mean) ** 2
+    _variance /= float(length)
+
+    ordered = numpy.sort(matrix, axis=0)
+    middle = length / 2
+    if length % 2:
+        _median = ordered[middle]
+    else:
+        _median = 0.5 * (ordered[middle - 1] + ordered[middle])
+
+    _min = ordered[0]
+    _max = ordered[-1]
+    return [{'min': float(_min[i]),
+             'max': float(_max[i]),
+             'mean': float(_mean[i]),
+             'median': float(_median[i]),
+             'std': float(_variance[i]) ** 0.5}
+            for i in xrange(matrix.shape[1])]
+
 # filters that return a list
 
 
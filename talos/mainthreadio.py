@@ -4,6 +4,7 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import json
 import os
 import utils
 import whitelist
@@ -45,61 +46,67 @@ def parse(logfilename, data):
         with open(logfilename, 'r') as logfile:
             if not logfile:
                 return False
-            stage = STAGE_STARTUP
-            for line in logfile:
-                prev_filename = str()
-                entries = line.strip().split(',')
-                if len(entries) == LENGTH_IO_ENTRY:
-                    if stage == STAGE_STARTUP:
-                        continue
-                    if entries[INDEX_FILENAME] == KEY_NO_FILENAME:
-                        continue
-                    # Format 1: I/O entry
-
-                    # Temporary hack: logs are leaking Windows NT symlinks.
-                    # We need to ignore those.
-                    if entries[INDEX_FILENAME]\
-                            .startswith(LEAKED_SYMLINK_PREFIX):
-                        continue
-
-                    # We'll key each entry on (stage, event source,
-                    # filename, operation)
-                    key_tuple = (STAGE_STRINGS[stage],
-                                 entries[INDEX_EVENT_SOURCE],
-                                 entries[INDEX_FILENAME],
-                                 entries[INDEX_OPERATION])
-                    if key_tuple not in data:
-                        data[key_tuple] = {
-                            KEY_COUNT: 1,
-                            KEY_RUN_COUNT: 1,
-                            KEY_DURATION: float(entries[INDEX_DURATION])
-                        }
-                    else:
-                        if prev_filename != entries[INDEX_FILENAME]:
-                            data[key_tuple][KEY_RUN_COUNT] += 1
-                        data[key_tuple][KEY_COUNT] += 1
-                        data[key_tuple][KEY_DURATION] += \
-                            float(entries[INDEX_DURATION])
-                    prev_filename = entries[INDEX_FILENAME]
-                elif len(entries) == LENGTH_NEXT_STAGE_ENTRY and \
-                        entries[1] == TOKEN_NEXT_STAGE:
-                    # Format 2: next stage
-                    stage = stage + 1
+            parse_lines(logfile, data)
             return True
     except IOError as e:
         print "%s: %s" % (e.filename, e.strerror)
         return False
 
 
+def parse_lines(lines, data):
+    """Aggregate the IO entries of the log lines into data, one at a time"""
+    stage = STAGE_STARTUP
+    for line in lines:
+        prev_filename = str()
+        entries = line.strip().split(',')
+        if len(entries) == LENGTH_IO_ENTRY:
+            if stage == STAGE_STARTUP:
+                continue
+            if entries[INDEX_FILENAME] == KEY_NO_FILENAME:
+                continue
+            # Format 1: I/O entry
+
+            # Temporary hack: logs are leaking Windows NT symlinks.
+            # We need to ignore those.
+            if entries[INDEX_FILENAME].startswith(LEAKED_SYMLINK_PREFIX):
+                continue
+
+            # We'll key each entry on (stage, event source,
+            # filename, operation)
+            key_tuple = (STAGE_STRINGS[stage],
+                         entries[INDEX_EVENT_SOURCE],
+                         entries[INDEX_FILENAME],
+                         entries[INDEX_OPERATION])
+            if key_tuple not in data:
+                data[key_tuple] = {
+                    KEY_COUNT: 1,
+                    KEY_RUN_COUNT: 1,
+                    KEY_DURATION: float(entries[INDEX_DURATION])
+                }
+            else:
+                if prev_filename != entries[INDEX_FILENAME]:
+                    data[key_tuple][KEY_RUN_COUNT] += 1
+                data[key_tuple][KEY_COUNT] += 1
+                data[key_tuple][KEY_DURATION] += \
+                    float(entries[INDEX_DURATION])
+            prev_filename = entries[INDEX_FILENAME]
+        elif len(entries) == LENGTH_NEXT_STAGE_ENTRY and \
+                entries[1] == TOKEN_NEXT_STAGE:
+            # Format 2: next stage
+            stage = stage + 1
+
+
 def write_output(outfilename, data):
     # Write the data out so that we can track it
     try:
         with open(outfilename, 'w') as outfile:
             outfile.write("[\n")
             for idx, (key, value) in utils.indexed_items(data.iteritems()):
-                output = "    [\"%s\", \"%s\", \"%s\", \"%s\", %d, %d, %f]" % (
-                    key[0], key[1], key[2], key[3], value[KEY_COUNT],
-                    value[KEY_RUN_COUNT], value[KEY_DURATION])
+                output = "    [%s, %s, %s, %s, %d, %d, %f]" % (
+                    json.dumps(key[0]), json.dumps(key[1]),
+                    json.dumps(key[2]), json.dumps(key[3]),
+                    value[KEY_COUNT], value[KEY_RUN_COUNT],
+                    value[KEY_DURATION])
                 outfile.write(output)
                 if idx >= 0:
                     outfile.write(",\n")
@@ -112,45 +119,74 @@ def write_output(outfilename, data):
         return False
 
 
-def main(argv):
-    if len(argv) < 4:
-        print ("Usage: %s <main_thread_io_log_file> <output_file> <xre_path>"
-               % argv[0])
-        return 1
-    if not os.path.exists(argv[3]):
-        print "XRE Path \"%s\" does not exist" % argv[3]
-        return 1
-    data = {}
-    if not parse(argv[1], data):
-        print "Log parsing failed"
-        return 1
+def get_rows(data):
+    """The entries of data, as written by write_output"""
+    return [[key[0], key[1], key[2], key[3], value[KEY_COUNT],
+             value[KEY_RUN_COUNT], value[KEY_DURATION]]
+            for key, value in data.iteritems()]
+
 
+def load_whitelist(xre_path):
+    """Return the whitelist for the browser in xre_path, None on failure"""
     wl = whitelist.Whitelist(test_name='mainthreadio',
-                             paths={"{xre}": argv[3]},
+                             paths={"{xre}": xre_path},
                              path_substitutions=PATH_SUBSTITUTIONS,
                              name_substitutions=NAME_SUBSTITUTIONS)
     if not wl.load(WHITELIST_FILENAME):
-        print "Failed to load whitelist"
-        return 1
+        return None
+    return wl
+
+
+def analyze(logfilename, wl, outfilename=None):
+    """
+    Aggregate the IO of a main thread IO log and check it against wl, the
+    whitelist from load_whitelist, which can be reused for several logs.
+    The aggregates are also written to outfilename, if given.
+
+    Returns (rows, errors, warnings): the rows of get_rows for the files
+    that are not ignored, None if the log couldn't be parsed, the error
+    messages and the messages for the files with a long IO duration, which
+    are informational only.
+    """
+    if wl is None:
+        return None, ["Failed to load whitelist"], []
+    data = {}
+    if not parse(logfilename, data):
+        return None, ["Log parsing failed"], []
 
     wl.filter(data, TUPLE_FILENAME_INDEX)
 
-    if not write_output(argv[2], data):
-        return 1
+    errors = []
+    if outfilename and not write_output(outfilename, data):
+        errors.append("Failed to write %s" % outfilename)
 
     # Disabled until we enable TBPL oranges
     # search for unknown filenames
-    errors = wl.check(data, TUPLE_FILENAME_INDEX)
-    if errors:
-        strs = wl.get_error_strings(errors)
-        wl.print_errors(strs)
+    errors += wl.format_errors(wl.get_error_strings(
+        wl.check(data, TUPLE_FILENAME_INDEX)))
 
     # search for duration > 1.0
-    errors = wl.checkDuration(data, TUPLE_FILENAME_INDEX, 'Duration')
-    if errors:
-        strs = wl.get_error_strings(errors)
-        wl.print_errors(strs)
+    warnings = wl.format_errors(wl.get_error_strings(
+        wl.checkDuration(data, TUPLE_FILENAME_INDEX, KEY_DURATION)),
+        status="TEST-INFO")
+
+    return get_rows(data), errors, warnings
+
 
+def main(argv):
+    if len(argv) < 4:
+        print ("Usage: %s <main_thread_io_log_file> <output_file> <xre_path>"
+               % argv[0])
+        return 1
+    if not os.path.exists(argv[3]):
+        print "XRE Path \"%s\" does not exist" % argv[3]
+        return 1
+    rows, errors, warnings = analyze(argv[1], load_whitelist(argv[3]),
+                                     argv[2])
+    for line in errors + warnings:
+        print line
+    if rows is None:
+        return 1
     return 0
 
 if __name__ == "__main__":
@@ -446,6 +446,13 @@ class PerfherderOutput(Output):
             if option not in test.test_config:
                 continue
             options[option] = test.test_config[option]
+        if test.cycles_run is not None:
+            # the cycles adapted to the results
+            options['min_cycles'] = test.test_config['min_cycles']
+            options['ci_width'] = test.test_config['ci_width']
+            options['cycles_run'] = test.cycles_run
+        if test.topology:
+            options['topology'] = test.topology
         if test.extensions is not None:
             options['extensions'] = [{'name': extension}
                                      for extension in test.extensions]
@@ -565,6 +572,10 @@ class PerfherderOutput(Output):
                             "max": counter_max
                         }
 
+            if test.all_counter_series:
+                # one dict of counter time series per cycle
+                test_result['talos_counter_series'] = test.all_counter_series
+
             if browser_config['develop'] and not browser_config['sourcestamp']:
                 browser_config['sourcestamp'] = ''
 
@@ -0,0 +1,302 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Client forwarding symbolication requests to a remote symbol server.
+
+Requests made at about the same time, from any thread, are merged into a
+single v4 request sent over a pooled keep-alive connection. Symbols of
+modules known to the server are kept in a SymbolMemo, optionally persisted
+to a file, so the same addresses are never forwarded twice.
+"""
+
+from symbolMemo import SymbolMemo
+from symLogging import LogTrace, LogError
+
+import cStringIO
+import gzip
+import httplib
+import json
+import os
+import Queue
+import socket
+import threading
+import time
+import urlparse
+
+
+class ForwardingError(Exception):
+    pass
+
+
+class PendingRequest:
+
+    def __init__(self, symbolSources, forwarded, modules, stack):
+        self.key = (tuple(symbolSources), forwarded)
+        self.modules = modules
+        self.stack = stack
+        self.symbols = None
+        self.knownModules = None
+        self.done = threading.Event()
+
+
+class ForwardingClient:
+
+    def __init__(self, url, cachePath=None, batchDelay=0.02, compress=False,
+                 timeout=30):
+        parsed = urlparse.urlsplit(url)
+        self.scheme = parsed.scheme
+        self.netloc = parsed.netloc
+        self.path = parsed.path or "/"
+        if parsed.query:
+            self.path += "?" + parsed.query
+        self.batchDelay = batchDelay
+        self.compress = compress
+        self.timeout = timeout
+        # request formats, as (version, compress), from the preferred one;
+        # requests start from the last one the server accepted
+        self.formats = [(4, False), (3, False)]
+        if compress:
+            self.formats.insert(0, (4, True))
+        self.formatIndex = 0
+        self.connections = Queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.pending = []
+        self.cache = SymbolMemo(cachePath)
+        # modules the server told us it has, or doesn't have, symbols for
+        self.knownModuleSet = set(self.cache.modules)
+        self.unknownModuleSet = set()
+        self.stats = {"requests": 0, "cacheHits": 0, "forwarded": 0}
+
+    def Symbolicate(self, symbolSources, forwarded, modules, stack):
+        """
+        Symbolicate stack, a list of [moduleIndex, offset] into modules, a
+        list of [libName, breakpadId]. Returns (symbols, knownModules);
+        knownModules is None when the server did not tell. Returns None if
+        the request failed.
+        """
+        symbols = [None] * len(stack)
+        knownModules = [False] * len(modules)
+        missing = []
+        with self.lock:
+            for index, (moduleIndex, offset) in enumerate(stack):
+                libName, breakpadId = modules[moduleIndex]
+                symbol = self.cache.Get((libName, breakpadId, offset))
+                if symbol is None:
+                    missing.append(index)
+                else:
+                    symbols[index] = symbol
+            undecided = False
+            for moduleIndex, module in enumerate(modules):
+                module = tuple(module)
+                if module in self.knownModuleSet:
+                    knownModules[moduleIndex] = True
+                elif module not in self.unknownModuleSet:
+                    undecided = True
+            self.stats["cacheHits"] += len(stack) - len(missing)
+        if not missing and not undecided:
+            return symbols, knownModules
+
+        request = PendingRequest(symbolSources, forwarded, modules,
+                                 [stack[index] for index in missing])
+        with self.lock:
+            self.pending.append(request)
+            leader = len(self.pending) == 1
+        if leader:
+            # give other threads a chance to join this batch
+            time.sleep(self.batchDelay)
+            with self.lock:
+                batch, self.pending = self.pending, []
+            self.SendBatch(batch)
+        request.done.wait()
+
+        if request.symbols is None:
+            return None
+        for index, symbol in zip(missing, request.symbols):
+            symbols[index] = symbol
+        if request.knownModules is None:
+            return symbols, None
+        for moduleIndex, known in enumerate(request.knownModules):
+            knownModules[moduleIndex] = knownModules[moduleIndex] or known
+        return symbols, knownModules
+
+    def SendBatch(self, batch):
+        groups = {}
+        for request in batch:
+            groups.setdefault(request.key, []).append(request)
+        for (symbolSources, forwarded), requests in groups.items():
+            try:
+                self.SendRequests(list(symbolSources), forwarded, requests)
+            except Exception as e:
+                LogError("Exception while forwarding request: " + str(e))
+            finally:
+                for request in requests:
+                    request.done.set()
+
+    def SendRequests(self, symbolSources, forwarded, requests):
+        # merge the memory maps of all requests
+        rawModules = []
+        moduleToIndex = {}
+        stacks = []
+        for request in requests:
+            newIndexes = []
+            for module in request.modules:
+                module = tuple(module)
+                if module not in moduleToIndex:
+                    moduleToIndex[module] = len(rawModules)
+                    rawModules.append(list(module))
+                newIndexes.append(moduleToIndex[module])
+            request.newIndexes = newIndexes
+            stacks.append([[newIndexes[moduleIndex], offset]
+                           for moduleIndex, offset in request.stack])
+
+        LogTrace("Forwarding " + str(sum(len(s) for s in stacks)) +
+                 " PCs from " + str(len(requests)) +
+                 " requests for symbolication")
+        version, response = self.Post({
+            "symbolSources": symbolSources,
+            "stacks": stacks,
+            "memoryMap": rawModules,
+            "forwarded": forwarded
+        })
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["forwarded"] += sum(len(s) for s in stacks)
+
+        if version == 4:
+            responseKnownModules = response["knownModules"]
+            responseStacks = response["symbolicatedStacks"]
+        else:
+            responseKnownModules = None
+            responseStacks = response
+        if len(responseStacks) != len(stacks):
+            raise ForwardingError(str(len(responseStacks)) +
+                                  " stacks in response, " +
+                                  str(len(stacks)) + " in request!")
+
+        if responseKnownModules is not None:
+            with self.lock:
+                for module, known in zip(rawModules, responseKnownModules):
+                    if known:
+                        self.knownModuleSet.add(tuple(module))
+                    else:
+                        self.unknownModuleSet.add(tuple(module))
+
+        cacheEntries = []
+        for request, symbols in zip(requests, responseStacks):
+            if len(symbols) != len(request.stack):
+                LogError(str(len(symbols)) + " symbols in response, " +
+                         str(len(request.stack)) + " PCs in request!")
+                continue
+            request.symbols = symbols
+            if responseKnownModules is None:
+                continue
+            request.knownModules = [
+                bool(responseKnownModules[newIndex])
+                for newIndex in request.newIndexes]
+            for (moduleIndex, offset), symbol in zip(request.stack, symbols):
+                if request.knownModules[moduleIndex]:
+                    libName, breakpadId = request.modules[moduleIndex]
+                    cacheEntries.append(
+                        ((libName, breakpadId, offset), symbol))
+        self.cache.Update(cacheEntries)
+
+    def Post(self, requestObj):
+        """
+        Post requestObj in the last format the server accepted, falling
+        back to uncompressed and then version 3 requests if it fails.
+        Network errors are raised without falling back. Returns (version,
+        response).
+        """
+        with self.lock:
+            start = self.formatIndex
+        for index in range(start, len(self.formats)):
+            version, compress = self.formats[index]
+            body = json.dumps(dict(requestObj, version=version))
+            try:
+                response = self.PostJson(body, compress)
+            except ForwardingError as e:
+                if index == len(self.formats) - 1:
+                    raise
+                LogTrace("Version " + str(version) +
+                         (" compressed" if compress else "") +
+                         " request failed, retrying: " + str(e))
+                continue
+            with self.lock:
+                self.formatIndex = max(self.formatIndex, index)
+            return version, response
+
+    def PostJson(self, body, compress):
+        headers = {"Content-Type": "application/json",
+                   "Accept-Encoding": "gzip"}
+        if compress:
+            body = gzipData(body)
+            headers["Content-Encoding"] = "gzip"
+
+        try:
+            connection = self.connections.get_nowait()
+        except Queue.Empty:
+            connection = self.NewConnection()
+        # A pooled keep-alive connection may have been closed by the server
+        # in the meantime: retry once on a fresh connection.
+        for attempt in range(2):
+            try:
+                connection.request("POST", self.path, body, headers)
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (httplib.HTTPException, socket.error):
+                connection.close()
+                if attempt:
+                    raise
+        self.connections.put(connection)
+
+        if response.status != 200:
+            raise ForwardingError("HTTP status " + str(response.status))
+        try:
+            if response.getheader("Content-Encoding") == "gzip":
+                data = gunzipData(data)
+            return json.loads(data)
+        except (IOError, ValueError) as e:
+            raise ForwardingError("Bad response: " + str(e))
+
+    def NewConnection(self):
+        if self.scheme == "https":
+            return httplib.HTTPSConnection(self.netloc, timeout=self.timeout)
+        return httplib.HTTPConnection(self.netloc, timeout=self.timeout)
+
+    def Close(self):
+        while True:
+            try:
+                self.connections.get_nowait().close()
+            except Queue.Empty:
+                break
+
+
+def gzipData(data):
+    buf = cStringIO.StringIO()
+    with gzip.GzipFile(fileobj=buf, mode="wb") as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+def gunzipData(data):
+    with gzip.GzipFile(fileobj=cStringIO.StringIO(data)) as f:
+        return f.read()
+
+
+# One client per (server, cache file), shared by all requests
+gClients = {}
+gClientsLock = threading.Lock()
+
+
+def GetForwardingClient(url, cachePath=None):
+    if cachePath:
+        cachePath = os.path.abspath(cachePath)
+    with gClientsLock:
+        client = gClients.get((url, cachePath))
+        if client is None:
+            client = gClients[(url, cachePath)] = \
+                ForwardingClient(url, cachePath)
+        return client
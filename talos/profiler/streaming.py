@@ -0,0 +1,206 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Streaming JSON rewriting, to process profiles without loading them.
+
+A schema tells which parts of the document matter:
+
+ - a dict applies its values to the members of an object, by key;
+ - a list applies its only item to every element of an array;
+ - a callable is called with the raw JSON text of a string, number or
+   literal, and returns the raw text to write instead, or None to keep it;
+ - a tuple of the above picks the one matching the kind of the value;
+ - None copies the value unchanged.
+
+Everything else is copied through (whitespace outside strings is dropped).
+"""
+
+import re
+
+STRING = 's'
+SCALAR = 'v'
+
+_STRING = r'"[^"\\]*(?:\\.[^"\\]*)*"'
+TOKEN_RE = re.compile(r'[ \t\n\r]*(?:(%s)|([{}\[\]:,])|([^ \t\n\r{}\[\]:,"]+))'
+                      % _STRING, re.S)
+# A string or scalar array element, with the separator following it
+ELEMENT_RE = re.compile(r'[ \t\n\r]*(%s|[^ \t\n\r{}\[\]:,"]+)[ \t\n\r]*([,\]])'
+                        % _STRING, re.S)
+WHITESPACE_RE = re.compile(r'[ \t\n\r]*')
+# Used to skip whole values
+STRING_RE = re.compile(_STRING, re.S)
+BRACKET_RE = re.compile(r'[{}\[\]]')
+
+
+class NullWriter(object):
+
+    def write(self, data):
+        pass
+
+
+class JSONStream(object):
+    """Incremental tokenizer reading from a file object."""
+
+    def __init__(self, f, chunk_size=1 << 20):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        # read at least as much as is pending, so long tokens are matched
+        # in a number of steps logarithmic in their size
+        data = self.f.read(max(self.chunk_size, len(self.buf) - self.pos))
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        if not data:
+            self.eof = True
+
+    def _match(self, regex):
+        while True:
+            m = regex.match(self.buf, self.pos)
+            if self.eof or (m and m.end() < len(self.buf)):
+                if m:
+                    self.pos = m.end()
+                return m
+            self._fill()
+
+    def next_token(self):
+        """Return the next (kind, raw text) token, or None at the end."""
+        m = self._match(TOKEN_RE)
+        if m is None:
+            if self.buf[self.pos:].strip():
+                raise ValueError("Invalid JSON at %r" %
+                                 self.buf[self.pos:self.pos + 20])
+            return None
+        if m.group(1):
+            return STRING, m.group(1)
+        if m.group(2):
+            return m.group(2), m.group(2)
+        return SCALAR, m.group(3)
+
+    def expect(self, *kinds):
+        token = self.next_token()
+        if token is None or token[0] not in kinds:
+            raise ValueError("Expected %s, got %r" % ('/'.join(kinds), token))
+        return token
+
+    def map_scalars(self, out, fn):
+        """
+        Apply fn to the next elements of the current array, as transform
+        does, while they are strings or scalars. Returns True once the
+        closing bracket is written, False at an element that is an object
+        or an array.
+        """
+        match = ELEMENT_RE.match
+        write = out.write
+        while True:
+            buf, pos = self.buf, self.pos
+            end = len(buf)
+            m = match(buf, pos)
+            while m and m.end() < end:
+                raw = m.group(1)
+                replacement = fn(raw)
+                write(raw if replacement is None else replacement)
+                write(m.group(2))
+                pos = m.end()
+                if m.group(2) == ']':
+                    self.pos = pos
+                    return True
+                m = match(buf, pos)
+            self.pos = pos
+            if m is None:
+                start = WHITESPACE_RE.match(buf, pos).end()
+                if start < end and buf[start] in '{[':
+                    return False
+            if self.eof:
+                raise ValueError("Invalid JSON array at %r" %
+                                 buf[pos:pos + 20])
+            self._fill()
+
+    def copy_value(self, token, out):
+        """Copy the value starting with token to out."""
+        out.write(token[1])
+        if token[0] not in ('{', '['):
+            return
+        depth = 1
+        while True:
+            if self.pos == len(self.buf):
+                self._fill()
+                if self.eof and self.pos == len(self.buf):
+                    raise ValueError("Unterminated JSON value")
+                continue
+            if self.buf[self.pos] == '"':
+                m = self._match(STRING_RE)
+                if m is None:
+                    raise ValueError("Unterminated JSON string")
+                out.write(m.group(0))
+                continue
+            # copy everything up to the next string at once, unless the
+            # value ends before
+            end = self.buf.find('"', self.pos)
+            if end < 0:
+                end = len(self.buf)
+            for m in BRACKET_RE.finditer(self.buf, self.pos, end):
+                if m.group(0) in ('{', '['):
+                    depth += 1
+                    continue
+                depth -= 1
+                if not depth:
+                    out.write(self.buf[self.pos:m.end()])
+                    self.pos = m.end()
+                    return
+            out.write(self.buf[self.pos:end])
+            self.pos = end
+
+
+def transform(stream, out, schema, token=None):
+    """Copy the next value of stream to out, applying schema."""
+    if token is None:
+        token = stream.expect('{', '[', STRING, SCALAR)
+    kind = token[0]
+    if isinstance(schema, tuple):
+        schema = _pick(schema, kind)
+
+    if kind == '{' and isinstance(schema, dict):
+        out.write('{')
+        token = stream.expect(STRING, '}')
+        while token[0] != '}':
+            out.write(token[1])
+            key = token[1][1:-1]
+            out.write(stream.expect(':')[1])
+            transform(stream, out, schema.get(key))
+            token = stream.expect(',', '}')
+            if token[0] == ',':
+                out.write(',')
+                token = stream.expect(STRING)
+        out.write('}')
+    elif kind == '[' and isinstance(schema, list):
+        out.write('[')
+        token = stream.expect('{', '[', STRING, SCALAR, ']')
+        while token[0] != ']':
+            transform(stream, out, schema[0], token)
+            token = stream.expect(',', ']')
+            if token[0] == ',':
+                out.write(',')
+                if callable(schema[0]) and stream.map_scalars(out, schema[0]):
+                    return
+                token = stream.expect('{', '[', STRING, SCALAR)
+        out.write(']')
+    elif kind in (STRING, SCALAR) and callable(schema):
+        replacement = schema(token[1])
+        out.write(token[1] if replacement is None else replacement)
+    else:
+        stream.copy_value(token, out)
+
+
+def _pick(schemas, kind):
+    for schema in schemas:
+        if kind == '{' and isinstance(schema, dict) or \
+                kind == '[' and isinstance(schema, list) or \
+                kind in (STRING, SCALAR) and callable(schema):
+            return schema
+    return None
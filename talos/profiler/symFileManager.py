@@ -4,15 +4,33 @@
 
 from symLogging import LogTrace, LogError, LogMessage
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 import itertools
+import mmap
 import os
 import re
+import struct
+import sys
 import threading
 import time
 from bisect import bisect
+from collections import OrderedDict
 
 # Libraries to keep prefetched
-PREFETCHED_LIBS = ["xul.pdb", "firefox.pdb"]
+PREFETCHED_LIBS = ["xul.pdb", "firefox.pdb", "libxul.so", "firefox", "XUL"]
+
+# Compiled symbol index, stored next to the .sym / .nmsym file it was built
+# from. Layout: header, sorted addresses (uint64), string offsets (uint32,
+# one more than the entry count) and the symbol names themselves.
+INDEX_EXTENSION = ".idx"
+INDEX_MAGIC = "TSYMIDX1"
+INDEX_HEADER = struct.Struct("<8sQ")
+INDEX_ADDRESS = struct.Struct("<Q")
+INDEX_OFFSET = struct.Struct("<I")
 
 
 class SymbolInfo:
@@ -22,6 +40,15 @@ class SymbolInfo:
         self.sortedSymbols = [addressMap[address]
                               for address in self.sortedAddresses]
         self.entryCount = len(self.sortedAddresses)
+        # numpy copy of sortedAddresses for LookupMany, made on first use
+        self.addressArray = None
+        # Rough estimate: the two lists, the address ints and the strings
+        self.memoryUsage = \
+            sys.getsizeof(self.sortedAddresses) * 2 + \
+            self.entryCount * (sys.getsizeof(0) + sys.getsizeof("")) + \
+            sum(len(symbol) for symbol in self.sortedSymbols)
+        if numpy is not None:
+            self.memoryUsage += self.entryCount * 8
 
     # TODO: Add checks for address < funcEnd ?
     def Lookup(self, address):
@@ -30,24 +57,240 @@ class SymbolInfo:
             return None
         return self.sortedSymbols[nearest]
 
+    def LookupMany(self, addresses):
+        """Lookup all the addresses at once."""
+        if numpy is not None:
+            if self.addressArray is None:
+                self.addressArray = numpy.array(self.sortedAddresses,
+                                                dtype=numpy.uint64)
+            nearest = NearestIndexes(self.addressArray, addresses)
+        else:
+            nearest = NearestIndexes(self.sortedAddresses, addresses)
+        return [self.sortedSymbols[index] if index >= 0 else None
+                for index in nearest]
+
     def GetEntryCount(self):
         return self.entryCount
 
+    def GetMemoryUsage(self):
+        return self.memoryUsage
+
+
+class PackedArray:
+    """Read-only sequence of packed integers, suitable for bisect."""
+
+    def __init__(self, buf, offset, count, item):
+        self.buf = buf
+        self.offset = offset
+        self.count = count
+        self.item = item
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0 or index >= self.count:
+            raise IndexError(index)
+        return self.item.unpack_from(
+            self.buf, self.offset + index * self.item.size)[0]
+
+
+class MappedSymbolInfo:
+    """SymbolInfo backed by a memory-mapped compiled index."""
+
+    def __init__(self, path):
+        with open(path, "rb") as indexFile:
+            self.map = mmap.mmap(indexFile.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+        magic, count = INDEX_HEADER.unpack_from(self.map, 0)
+        if magic != INDEX_MAGIC:
+            self.map.close()
+            raise ValueError("Bad symbol index " + path)
+        self.entryCount = count
+        offsetsStart = INDEX_HEADER.size + count * INDEX_ADDRESS.size
+        self.stringsStart = offsetsStart + (count + 1) * INDEX_OFFSET.size
+        self.sortedAddresses = PackedArray(self.map, INDEX_HEADER.size,
+                                           count, INDEX_ADDRESS)
+        self.offsets = PackedArray(self.map, offsetsStart, count + 1,
+                                   INDEX_OFFSET)
+        if self.stringsStart + self.offsets[count] > len(self.map):
+            self.map.close()
+            raise ValueError("Truncated symbol index " + path)
+
+    def Lookup(self, address):
+        nearest = bisect(self.sortedAddresses, address) - 1
+        if nearest < 0:
+            return None
+        return self.map[self.stringsStart + self.offsets[nearest]:
+                        self.stringsStart + self.offsets[nearest + 1]]
+
+    def LookupMany(self, addresses):
+        """Lookup all the addresses at once."""
+        if numpy is None:
+            return [self.Lookup(address) for address in addresses]
+        # search the mapped arrays in place
+        count = self.entryCount
+        sortedAddresses = numpy.frombuffer(
+            self.map, dtype="<u8", count=count, offset=INDEX_HEADER.size)
+        offsets = numpy.frombuffer(
+            self.map, dtype="<u4", count=count + 1,
+            offset=INDEX_HEADER.size + count * INDEX_ADDRESS.size)
+        nearest = NearestIndexes(sortedAddresses, addresses)
+        found = nearest >= 0
+        starts = numpy.zeros(len(nearest), dtype=numpy.int64)
+        ends = numpy.zeros(len(nearest), dtype=numpy.int64)
+        starts[found] = offsets[nearest[found]] + self.stringsStart
+        ends[found] = offsets[nearest[found] + 1] + self.stringsStart
+        return [self.map[start:end] if isFound else None
+                for start, end, isFound
+                in zip(starts.tolist(), ends.tolist(), found.tolist())]
+
+    def GetEntryCount(self):
+        return self.entryCount
+
+    def GetMemoryUsage(self):
+        return len(self.map)
+
+
+def NearestIndexes(sortedAddresses, addresses):
+    """
+    Index of the last entry of sortedAddresses not above each address, or
+    -1. Vectorized when sortedAddresses is a numpy array.
+    """
+    if numpy is not None and isinstance(sortedAddresses, numpy.ndarray):
+        return numpy.searchsorted(
+            sortedAddresses, numpy.array(addresses, dtype=numpy.uint64),
+            side="right").astype(numpy.int64) - 1
+    return [bisect(sortedAddresses, address) - 1 for address in addresses]
+
+
+def WriteSymbolIndex(symbolMap, path):
+    """Write symbolMap as a compiled index, atomically replacing path."""
+    addresses = sorted(symbolMap.keys())
+    tmpPath = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(tmpPath, "wb") as indexFile:
+            indexFile.write(INDEX_HEADER.pack(INDEX_MAGIC, len(addresses)))
+            for address in addresses:
+                indexFile.write(INDEX_ADDRESS.pack(address))
+            offset = 0
+            indexFile.write(INDEX_OFFSET.pack(offset))
+            for address in addresses:
+                offset += len(symbolMap[address])
+                indexFile.write(INDEX_OFFSET.pack(offset))
+            for address in addresses:
+                indexFile.write(symbolMap[address])
+        os.rename(tmpPath, path)
+    finally:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+
+
+class SymbolCache:
+    """
+    Least recently used cache of symbol tables, keyed by (libName,
+    breakpadId) and weighted by entry count and memory usage. Callers
+    must hold the lock of the owning SymFileManager.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.maxEntries = None
+        self.maxBytes = None
+        self.entryCount = 0
+        self.byteCount = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def SetLimits(self, maxEntries=None, maxBytes=None):
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.MakeRoom(0, 0)
+
+    def RaiseLimits(self, maxEntries=None, maxBytes=None):
+        """
+        Raise the limits to the given ones, for caches shared by several
+        users: the largest limits asked for are kept, and unset ones leave
+        the current limits alone.
+        """
+        def larger(current, limit):
+            if current is None or limit is None:
+                return limit if current is None else current
+            return max(current, limit)
+        self.maxEntries = larger(self.maxEntries, maxEntries)
+        self.maxBytes = larger(self.maxBytes, maxBytes)
+
+    def Get(self, key):
+        symbolInfo = self.entries.pop(key, None)
+        if symbolInfo is None:
+            self.misses += 1
+            return None
+        self.entries[key] = symbolInfo
+        self.hits += 1
+        return symbolInfo
+
+    def Put(self, key, symbolInfo):
+        self.Remove(key)
+        self.MakeRoom(symbolInfo.GetEntryCount(),
+                      symbolInfo.GetMemoryUsage())
+        self.entries[key] = symbolInfo
+        self.entryCount += symbolInfo.GetEntryCount()
+        self.byteCount += symbolInfo.GetMemoryUsage()
+
+    def Remove(self, key):
+        symbolInfo = self.entries.pop(key, None)
+        if symbolInfo is not None:
+            self.entryCount -= symbolInfo.GetEntryCount()
+            self.byteCount -= symbolInfo.GetMemoryUsage()
+        return symbolInfo
+
+    def Fits(self, entries, bytes):
+        return (self.maxEntries is None or
+                self.entryCount + entries <= self.maxEntries) and \
+            (self.maxBytes is None or
+             self.byteCount + bytes <= self.maxBytes)
+
+    def MakeRoom(self, entries, bytes):
+        """Evict least recently used tables until the given amount fits."""
+        while self.entries and not self.Fits(entries, bytes):
+            key = next(iter(self.entries))
+            self.Remove(key)
+            self.evictions += 1
+            LogTrace("Evicted symbols for " + str(key))
+
+    def GetStats(self):
+        return {"libraries": len(self.entries),
+                "entries": self.entryCount,
+                "bytes": self.byteCount,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions}
+
 # Singleton for .sym / .nmsym file cache management
 
 
 class SymFileManager:
     # Symbol cache data structures
-    sCache = {}
-    sCacheCount = 0
+    sCache = SymbolCache()
     sCacheLock = threading.Lock()
-    sMruSymbols = []
 
     sOptions = {}
     sCallbackTimer = None
 
     def __init__(self, options):
         self.sOptions = options
+        # the cache is shared by all the instances, which must not shrink
+        # it under the others
+        with self.sCacheLock:
+            self.sCache.RaiseLimits(options.get("maxCacheEntries"),
+                                    options.get("maxCacheBytes"))
 
     def GetLibSymbolMap(self, libName, breakpadId, symbolSources):
         # Empty lib name means client couldn't associate frame with any lib
@@ -55,14 +298,8 @@ class SymFileManager:
             return None
 
         # Check cache first
-        libSymbolMap = None
-        self.sCacheLock.acquire()
-        try:
-            if libName in self.sCache and breakpadId in self.sCache[libName]:
-                libSymbolMap = self.sCache[libName][breakpadId]
-                self.UpdateMruList(libName, breakpadId)
-        finally:
-            self.sCacheLock.release()
+        with self.sCacheLock:
+            libSymbolMap = self.sCache.Get((libName, breakpadId))
 
         if libSymbolMap is None:
             LogTrace(
@@ -91,22 +328,42 @@ class SymFileManager:
 
             LogTrace("Storing libSymbolMap under [" + libName + "][" +
                      breakpadId + "]")
-            self.sCacheLock.acquire()
-            try:
-                self.MaybeEvict(libSymbolMap.GetEntryCount())
-                if libName not in self.sCache:
-                    self.sCache[libName] = {}
-                self.sCache[libName][breakpadId] = libSymbolMap
-                self.sCacheCount += libSymbolMap.GetEntryCount()
-                self.UpdateMruList(libName, breakpadId)
-                LogTrace(str(self.sCacheCount) +
+            with self.sCacheLock:
+                self.sCache.Put((libName, breakpadId), libSymbolMap)
+                LogTrace(str(self.sCache.entryCount) +
                          " symbols in cache after fetching symbol file")
-            finally:
-                self.sCacheLock.release()
 
         return libSymbolMap
 
+    def GetCacheStats(self):
+        with self.sCacheLock:
+            return self.sCache.GetStats()
+
     def FetchSymbolsFromFile(self, path):
+        """
+        Return the symbols of a .sym or .nmsym file, from its compiled index
+        when there is an up to date one. The index is built on first use.
+        """
+        indexPath = path + INDEX_EXTENSION
+        try:
+            if os.path.getmtime(indexPath) >= os.path.getmtime(path):
+                return MappedSymbolInfo(indexPath)
+        except (OSError, IOError, ValueError, struct.error) as e:
+            LogTrace("No usable symbol index for " + path + ": " + str(e))
+
+        symbolMap = self.ParseSymbolFile(path)
+        if symbolMap is None:
+            return None
+
+        try:
+            WriteSymbolIndex(symbolMap, indexPath)
+            return MappedSymbolInfo(indexPath)
+        except (OSError, IOError, ValueError, struct.error) as e:
+            LogTrace("Could not write symbol index " + indexPath + ": " +
+                     str(e))
+        return SymbolInfo(symbolMap)
+
+    def ParseSymbolFile(self, path):
         try:
             symFile = open(path, "r")
         except Exception as e:
@@ -170,7 +427,7 @@ class SymFileManager:
             str(funcCount) + " FUNC lines"
         LogTrace(logString)
 
-        return SymbolInfo(symbolMap)
+        return symbolMap
 
     def PrefetchRecentSymbolFiles(self):
         global PREFETCHED_LIBS
@@ -180,6 +437,7 @@ class SymFileManager:
         interval = self.sOptions['prefetchInterval'] * 60 * 60
         self.sCallbackTimer = threading.Timer(
             interval, self.PrefetchRecentSymbolFiles)
+        self.sCallbackTimer.daemon = True
         self.sCallbackTimer.start()
 
         thresholdTime = time.time() - \
@@ -213,24 +471,23 @@ class SymFileManager:
         # Ideally, mutex would be held from check to insert in self.sCache,
         # but we don't want to hold the lock during I/O. This won't cause
         # inconsistencies.
-        self.sCacheLock.acquire()
-        try:
+        with self.sCacheLock:
             for pdbName in symDirsToInspect:
-                for (mtime, symbolDirPath) in symDirsToInspect[pdbName]:
-                    pdbId = os.path.basename(symbolDirPath)
-                    if pdbName in self.sCache and \
-                            pdbId in self.sCache[pdbName]:
-                        symDirsToInspect[pdbName].remove(
-                            (mtime, symbolDirPath))
-        finally:
-            self.sCacheLock.release()
+                symDirsToInspect[pdbName] = [
+                    entry for entry in symDirsToInspect[pdbName]
+                    if (pdbName, os.path.basename(entry[1]))
+                    not in self.sCache]
 
         # Read all new symbol files in at once
         fetchedSymbols = {}
         fetchedCount = 0
         for pdbName in symDirsToInspect:
-            # The corresponding symbol file name ends with .sym
-            symFileName = re.sub(r"\.[^\.]+$", ".sym", pdbName)
+            # The corresponding symbol file name ends with .sym, and
+            # replaces the .pdb extension, as in GetLibSymbolMap
+            if pdbName.endswith(".pdb"):
+                symFileName = re.sub(r"\.[^\.]+$", ".sym", pdbName)
+            else:
+                symFileName = pdbName + ".sym"
 
             for (mtime, symbolDirPath) in symDirsToInspect[pdbName]:
                 pdbId = os.path.basename(symbolDirPath)
@@ -248,66 +505,13 @@ class SymFileManager:
                              symbolFilePath)
                     continue
 
-        # Insert new symbols into global symbol cache
-        self.sCacheLock.acquire()
-        try:
-            # Make room for the new symbols
-            self.MaybeEvict(fetchedCount)
-
+        # Insert new symbols into global symbol cache. Each one goes to the
+        # most recently used end to give it a chance.
+        with self.sCacheLock:
             for (pdbName, pdbId) in fetchedSymbols:
-                if pdbName not in self.sCache:
-                    self.sCache[pdbName] = {}
-
-                if pdbId in self.sCache[pdbName]:
+                if (pdbName, pdbId) in self.sCache:
                     continue
-
-                newSymbolFile = fetchedSymbols[(pdbName, pdbId)]
-                self.sCache[pdbName][pdbId] = newSymbolFile
-                self.sCacheCount += newSymbolFile.GetEntryCount()
-
-                # Move new symbols to front of MRU list to give them a chance
-                self.UpdateMruList(pdbName, pdbId)
-
-        finally:
-            self.sCacheLock.release()
+                self.sCache.Put((pdbName, pdbId),
+                                fetchedSymbols[(pdbName, pdbId)])
 
         LogMessage("Finished prefetching recent symbol files")
-
-    def UpdateMruList(self, pdbName, pdbId):
-        libId = (pdbName, pdbId)
-        if libId in self.sMruSymbols:
-            self.sMruSymbols.remove(libId)
-        self.sMruSymbols.insert(0, libId)
-
-    def MaybeEvict(self, freeEntriesNeeded):
-        maxCacheSize = self.sOptions["maxCacheEntries"]
-        LogTrace("Cache occupancy before MaybeEvict: " +
-                 str(self.sCacheCount) + "/" + str(maxCacheSize))
-
-        if self.sCacheCount == 0 or \
-                self.sCacheCount + freeEntriesNeeded <= maxCacheSize:
-            # No need to lock mutex here, this doesn't need to be 100%
-            return
-
-        # If adding the new entries would exceed the max cache size,
-        # evict so that cache is at 70% capacity after new entries added
-        numOldEntriesAfterEvict = max(
-            0, (0.70 * maxCacheSize) - freeEntriesNeeded)
-        numToEvict = self.sCacheCount - numOldEntriesAfterEvict
-
-        # Evict symbols until evict quota is met, starting with least recently
-        # used
-        for (pdbName, pdbId) in reversed(self.sMruSymbols):
-            if numToEvict <= 0:
-                break
-
-            evicteeCount = self.sCache[pdbName][pdbId].GetEntryCount()
-
-            del self.sCache[pdbName][pdbId]
-            self.sCacheCount -= evicteeCount
-            self.sMruSymbols.pop()
-
-            numToEvict -= evicteeCount
-
-        LogTrace("Cache occupancy after MaybeEvict: " +
-                 str(self.sCacheCount) + "/" + str(maxCacheSize))
@@ -0,0 +1,86 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Memo table of resolved symbols, keyed by (libName, breakpadId, offset).
+
+Offsets are relative to the library, so entries stay valid across
+processes and address space layouts. A memo can be persisted to an
+append-only file, one JSON list per line.
+"""
+
+from symLogging import LogTrace, LogError
+
+import json
+import os
+import threading
+
+
+class SymbolMemo:
+
+    def __init__(self, path=None):
+        self.path = path
+        self.symbols = {}
+        # libraries with at least one symbol in the memo
+        self.modules = set()
+        self.lock = threading.Lock()
+        if path:
+            self.Load()
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def Load(self):
+        try:
+            with open(self.path) as memoFile:
+                for line in memoFile:
+                    try:
+                        libName, breakpadId, offset, symbol = json.loads(line)
+                    except ValueError:
+                        # partially written last line
+                        continue
+                    self.symbols[(libName, breakpadId, offset)] = symbol
+                    self.modules.add((libName, breakpadId))
+        except IOError:
+            pass
+        LogTrace("Loaded " + str(len(self.symbols)) + " symbols from " +
+                 self.path)
+
+    def Get(self, key):
+        return self.symbols.get(key)
+
+    def Update(self, entries):
+        """Add (key, symbol) entries, appending new ones to the file."""
+        with self.lock:
+            newEntries = [(key, symbol) for key, symbol in entries
+                          if key not in self.symbols]
+            if not newEntries:
+                return
+            self.symbols.update(newEntries)
+            self.modules.update(key[:2] for key, symbol in newEntries)
+            if not self.path:
+                return
+            try:
+                with open(self.path, "a") as memoFile:
+                    memoFile.write("".join(
+                        json.dumps(list(key) + [symbol]) + "\n"
+                        for key, symbol in newEntries))
+            except IOError as e:
+                LogError("Could not write symbol memo " + self.path + ": " +
+                         str(e))
+
+
+# One memo per file (or in memory only), shared by the whole process
+gMemos = {}
+gMemosLock = threading.Lock()
+
+
+def GetSymbolMemo(path=None):
+    if path:
+        path = os.path.abspath(path)
+    with gMemosLock:
+        memo = gMemos.get(path)
+        if memo is None:
+            memo = gMemos[path] = SymbolMemo(path)
+        return memo
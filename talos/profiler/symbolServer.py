@@ -0,0 +1,183 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Local symbolication service.
+
+A long-lived process serving v4 symbolication requests from a warm
+SymFileManager cache, so that all the talos jobs of a host can share it
+as their remote symbol server (see the --symbolServer talos option).
+Recent libxul/firefox symbols are prefetched periodically, symbols the
+service doesn't have are forwarded to an upstream server, and GET
+/stats returns the cache statistics.
+"""
+
+import argparse
+import BaseHTTPServer
+import json
+import SocketServer
+import sys
+import threading
+
+import symLogging
+from forwardingClient import gunzipData
+from symFileManager import SymFileManager
+from symLogging import LogMessage, LogTrace
+from symbolicationRequest import SymbolicationRequest
+
+DEFAULT_OPTIONS = {
+    # Fallback server if symbol is not found locally
+    "remoteSymbolServer": None,
+    # Maximum number of symbol files to keep in memory
+    "maxCacheEntries": 10000000,
+    # Maximum memory used by symbol files kept in memory
+    "maxCacheBytes": 4 * 1024 * 1024 * 1024,
+    # Frequency of checking for recent symbols to cache (in hours)
+    "prefetchInterval": 12,
+    # Oldest file age to prefetch (in hours)
+    "prefetchThreshold": 48,
+    # Maximum number of library versions to pre-fetch per library
+    "prefetchMaxSymbolsPerLib": 3,
+    # Default symbol lookup directories
+    "defaultApp": "FIREFOX",
+    "defaultOs": "WINDOWS",
+}
+
+
+class SymbolRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # keep connections alive for the talos forwarding clients
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        LogTrace(self.address_string() + " " + format % args)
+
+    def respond(self, status, data):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/stats":
+            return self.respond(404, json.dumps({"error": "not found"}))
+        self.respond(200, json.dumps(self.server.GetStats()))
+
+    def do_POST(self):
+        try:
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            if self.headers.get("Content-Encoding") == "gzip":
+                body = gunzipData(body)
+            rawRequest = json.loads(body)
+        except Exception as e:
+            return self.respond(400, json.dumps({"error": str(e)}))
+
+        response = self.server.Symbolicate(rawRequest)
+        if response is None:
+            return self.respond(400, json.dumps({"error": "invalid request"}))
+        self.respond(200, json.dumps(response))
+
+
+class SymbolServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, options):
+        BaseHTTPServer.HTTPServer.__init__(self, address, SymbolRequestHandler)
+        self.symFileManager = SymFileManager(options)
+        self.statsLock = threading.Lock()
+        self.requestCount = 0
+        self.invalidRequestCount = 0
+        self.pcCount = 0
+
+    def Symbolicate(self, rawRequest):
+        """Return the v4 response to rawRequest, or None if invalid."""
+        request = SymbolicationRequest(self.symFileManager, rawRequest)
+        if not request.isValidRequest:
+            with self.statsLock:
+                self.invalidRequestCount += 1
+            return None
+        stacks = [request.Symbolicate(i) for i in range(len(request.stacks))]
+        with self.statsLock:
+            self.requestCount += 1
+            self.pcCount += sum(len(stack) for stack in stacks)
+        return {"symbolicatedStacks": stacks,
+                "knownModules": request.knownModules}
+
+    def GetStats(self):
+        with self.statsLock:
+            stats = {"requests": self.requestCount,
+                     "invalidRequests": self.invalidRequestCount,
+                     "pcs": self.pcCount}
+        stats["cache"] = self.symFileManager.GetCacheStats()
+        return stats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="address to listen on")
+    parser.add_argument("--port", type=int, default=8000,
+                        help="port to listen on")
+    parser.add_argument("--symbolPath", dest="symbol_path", required=True,
+                        help="directory of the application (FIREFOX)"
+                             " symbols")
+    parser.add_argument("--osSymbolPath", dest="os_symbol_path",
+                        help="directory of the system (WINDOWS) symbols")
+    parser.add_argument("--remoteSymbolServer", dest="remote_symbol_server",
+                        help="upstream server for the symbols not found"
+                             " locally")
+    parser.add_argument("--maxCacheEntries", dest="max_cache_entries",
+                        type=int, help="maximum number of symbols in memory")
+    parser.add_argument("--maxCacheBytes", dest="max_cache_bytes",
+                        type=int, help="maximum memory used by symbols")
+    parser.add_argument("--prefetchInterval", dest="prefetch_interval",
+                        type=float, help="hours between prefetches of the"
+                                         " recent symbols")
+    parser.add_argument("--noPrefetch", dest="prefetch",
+                        action="store_false",
+                        help="don't prefetch recent symbols")
+    parser.add_argument("--trace", action="store_true",
+                        help="enable trace logging")
+    return parser.parse_args(argv)
+
+
+def get_options(args):
+    options = dict(DEFAULT_OPTIONS)
+    options["symbolPaths"] = {"FIREFOX": args.symbol_path}
+    if args.os_symbol_path:
+        options["symbolPaths"]["WINDOWS"] = args.os_symbol_path
+    else:
+        options["defaultOs"] = "FIREFOX"
+    for option, value in (("remoteSymbolServer", args.remote_symbol_server),
+                          ("maxCacheEntries", args.max_cache_entries),
+                          ("maxCacheBytes", args.max_cache_bytes),
+                          ("prefetchInterval", args.prefetch_interval)):
+        if value is not None:
+            options[option] = value
+    return options
+
+
+def main(argv=sys.argv[1:]):
+    args = parse_args(argv)
+    symLogging.gEnableTracing = args.trace
+    server = SymbolServer((args.host, args.port), get_options(args))
+    if args.prefetch:
+        # reschedules itself every prefetchInterval hours
+        prefetch = threading.Thread(
+            target=server.symFileManager.PrefetchRecentSymbolFiles)
+        prefetch.daemon = True
+        prefetch.start()
+    LogMessage("Serving symbols on http://%s:%d/" % server.server_address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if server.symFileManager.sCallbackTimer:
+            server.symFileManager.sCallbackTimer.cancel()
+
+
+if __name__ == "__main__":
+    main()
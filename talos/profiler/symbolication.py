@@ -2,21 +2,35 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 import cStringIO
 import hashlib
 import json
+import multiprocessing
 import os
 import platform
 import re
+import shutil
 import subprocess
 import urllib2
 import zipfile
 from distutils import spawn
+from multiprocessing.pool import ThreadPool
 from symFileManager import SymFileManager
-from symbolicationRequest import SymbolicationRequest
+from symbolicationRequest import SymbolicationRequest, getModuleV3
+from symbolMemo import SymbolMemo
+import streaming
 from symLogging import LogMessage
 
 
+# Where ProfileSymbolicator looks for symbols
+SYMBOL_SOURCES = ["FIREFOX", "WINDOWS"]
+
+
 class SymbolError(Exception):
     pass
 
@@ -48,7 +62,8 @@ class OSXSymbolDumper:
         def process_file(arch):
             proc = subprocess.Popen([self.dump_syms_bin, "-a", arch, lib_path],
                                     stdout=subprocess.PIPE,
-                                    stderr=subprocess.PIPE)
+                                    stderr=subprocess.PIPE,
+                                    close_fds=True)
             stdout, stderr = proc.communicate()
             if proc.returncode != 0:
                 return None
@@ -89,33 +104,64 @@ class LinuxSymbolDumper:
         """
         output_filename = output_filename_without_extension + ".nmsym"
 
-        proc = subprocess.Popen([self.nm, "--demangle", lib_path],
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE)
-        stdout, stderr = proc.communicate()
+        # nm output goes straight to the file. The dynamic symbols (nm -D)
+        # are appended: on Linux, most system libraries have no "normal"
+        # symbols, but they have "dynamic" symbols.
+        with open(output_filename, "w") as f, \
+                open(os.devnull, "w") as devnull:
+            if subprocess.call([self.nm, "--demangle", lib_path],
+                               stdout=f, stderr=devnull, close_fds=True):
+                f.close()
+                os.remove(output_filename)
+                return
+            f.flush()
+            subprocess.call([self.nm, "--demangle", "-D", lib_path],
+                            stdout=f, stderr=devnull, close_fds=True)
+        return output_filename
 
-        if proc.returncode != 0:
-            return
 
-        with open(output_filename, "w") as f:
-            f.write(stdout)
+class ProfileScan:
+    """What a streaming pass found in a profile."""
+
+    def __init__(self):
+        self.version = 2
+        # JSON encoded list of the shared libraries
+        self.libs = None
+        self.addresses_v2 = set()
+        self.addresses_v3 = set()
+        # scans of the string-encoded threads, in order
+        self.nested = []
+        # symbolication table, once resolved
+        self.table = None
+
+    def addresses(self):
+        if self.version == 3:
+            return self.addresses_v3
+        return self.addresses_v2
+
+    def merged_scans(self):
+        """
+        This scan and, for a v3 profile, those of the nested v3 threads
+        with libraries, recursively: the ones resolved together.
+        """
+        scans = [self]
+        if self.version == 3:
+            for scan in self.nested:
+                if scan.libs is not None and scan.version == 3:
+                    scans += scan.merged_scans()
+        return scans
 
-            # Append nm -D output to the file. On Linux, most system libraries
-            # have no "normal" symbols, but they have "dynamic" symbols, which
-            # nm -D shows.
-            proc = subprocess.Popen([self.nm, "--demangle", "-D", lib_path],
-                                    stdout=subprocess.PIPE,
-                                    stderr=subprocess.PIPE)
-            stdout, stderr = proc.communicate()
-            if proc.returncode == 0:
-                f.write(stdout)
-        return output_filename
+
+def _profile_version(profile_json):
+    return profile_json.get("meta", {}).get("version", 2)
 
 
 class ProfileSymbolicator:
 
-    def __init__(self, options):
+    def __init__(self, options, memo=None):
         self.options = options
+        # symbols resolved so far; may be shared with other symbolicators
+        self.memo = memo if memo is not None else SymbolMemo()
         self.sym_file_manager = SymFileManager(self.options)
         self.symbol_dumper = self.get_symbol_dumper()
 
@@ -180,7 +226,7 @@ class ProfileSymbolicator:
             memoryMap.append(self._module_from_lib(lib))
 
         rawRequest = {"stacks": [[]], "memoryMap": memoryMap,
-                      "version": 4, "symbolSources": ["FIREFOX", "WINDOWS"]}
+                      "version": 4, "symbolSources": SYMBOL_SOURCES}
         request = SymbolicationRequest(self.sym_file_manager, rawRequest)
         if not request.isValidRequest:
             return []
@@ -206,12 +252,44 @@ class ProfileSymbolicator:
         output_dir = self.options["symbolPaths"]["FIREFOX"]
 
         # Additionally, we add all dumped symbol files to the missingsymbols
-        # zip file.
+        # zip file. Dumping runs concurrently; only this thread writes to
+        # the zip file.
         with zipfile.ZipFile(symbol_zip_path, 'a', zipfile.ZIP_DEFLATED) as zf:
+            # a library can be listed several times, e.g. by the profiles
+            # of several processes; dump its symbols once
+            jobs = []
+            outputs = set()
             for lib in unknown_modules:
-                self.dump_and_integrate_symbols_for_lib(lib, output_dir, zf)
+                job = self.prepare_symbols_for_lib(lib, output_dir, zf)
+                if job and job[2] not in outputs:
+                    outputs.add(job[2])
+                    jobs.append(job)
+            if not jobs:
+                return
 
-    def dump_and_integrate_symbols_for_lib(self, lib, output_dir, zip):
+            pool = ThreadPool(min(len(jobs), multiprocessing.cpu_count()))
+            try:
+                sym_files = pool.map(self._store_symbols, jobs)
+            finally:
+                pool.close()
+                pool.join()
+
+            rootlen = len(os.path.join(output_dir, '_')) - 1
+            namelist = set(zf.namelist())
+            for sym_file in sym_files:
+                if not sym_file:
+                    continue
+                output_filename = sym_file[rootlen:]
+                if output_filename not in namelist:
+                    zf.write(sym_file, output_filename)
+                    namelist.add(output_filename)
+
+    def prepare_symbols_for_lib(self, lib, output_dir, zip):
+        """
+        Extract the symbols of lib from zip if a previous run dumped them.
+        Otherwise return the (lib_path, breakpad_id, output filename
+        without extension) to dump them with, or None.
+        """
         [name, breakpadId] = self._module_from_lib(lib)
         expected_name_without_extension = os.path.join(name, breakpadId, name)
         for extension in [".sym", ".nmsym"]:
@@ -220,40 +298,153 @@ class ProfileSymbolicator:
                 # No need to dump the symbols again if we already have it in
                 # the missingsymbols zip file from a previous run.
                 zip.extract(expected_name, output_dir)
-                return
+                return None
 
         lib_path = lib['name']
         if not os.path.exists(lib_path):
-            return
+            return None
 
         output_filename_without_extension = os.path.join(
             output_dir, expected_name_without_extension)
         store_path = os.path.dirname(output_filename_without_extension)
         if not os.path.exists(store_path):
             os.makedirs(store_path)
+        return (lib_path, lib["breakpadId"], output_filename_without_extension)
 
-        # Dump the symbols.
-        sym_file = self.symbol_dumper.store_symbols(
-            lib_path, lib["breakpadId"], output_filename_without_extension)
-        if sym_file:
-            rootlen = len(os.path.join(output_dir, '_')) - 1
-            output_filename = sym_file[rootlen:]
-            if output_filename not in zip.namelist():
-                zip.write(sym_file, output_filename)
+    def _store_symbols(self, job):
+        try:
+            return self.symbol_dumper.store_symbols(*job)
+        except (OSError, IOError) as e:
+            LogMessage("Failed to dump symbols for %s: %s" % (job[0], e))
+            return None
 
     def symbolicate_profile(self, profile_json):
         if "libs" not in profile_json:
             return
-        if profile_json["meta"].get("version", 2) == 3:
-            self.symbolicate_profile_v3(profile_json)
-        else:
-            self.symbolicate_profile_v2(profile_json)
+        if _profile_version(profile_json) == 3:
+            self.symbolicate_profiles_v3(profile_json)
+            return
+        self.symbolicate_profile_v2(profile_json)
         for i, thread in enumerate(profile_json["threads"]):
             if isinstance(thread, basestring):
                 thread_json = json.loads(thread)
                 self.symbolicate_profile(thread_json)
                 profile_json["threads"][i] = json.dumps(thread_json)
 
+    def symbolicate_profiles_v3(self, profile_json):
+        """
+        Symbolicate a v3 profile along with its string-encoded threads,
+        e.g. those of the content processes, resolving the addresses of
+        all of them in a single pass.
+        """
+        profiles = []
+        nested_threads = []
+
+        def collect(profile_json):
+            profiles.append(profile_json)
+            for i, thread in enumerate(profile_json["threads"]):
+                if not isinstance(thread, basestring):
+                    continue
+                thread_json = json.loads(thread)
+                nested_threads.append((profile_json["threads"], i,
+                                       thread_json))
+                if "libs" in thread_json and \
+                        _profile_version(thread_json) == 3:
+                    collect(thread_json)
+                else:
+                    self.symbolicate_profile(thread_json)
+        collect(profile_json)
+
+        tables = self._resolve_profiles(
+            [(json.loads(p["libs"]), self._find_addresses_v3(p))
+             for p in profiles])
+        for p, symbolication_table in zip(profiles, tables):
+            self._substitute_symbols_v3(p, symbolication_table)
+        # encode the innermost threads first
+        for threads, i, thread_json in reversed(nested_threads):
+            threads[i] = json.dumps(thread_json)
+
+    def scan_profile(self, profile_file):
+        """
+        Stream through a profile file and return a ProfileScan with what
+        symbolicate_profile_stream needs, including a scan of each nested
+        string-encoded thread.
+        """
+        scan = ProfileScan()
+
+        def version(raw):
+            scan.version = int(raw)
+
+        def libs(raw):
+            scan.libs = json.loads(raw)
+
+        def collect(addresses):
+            def add(raw):
+                if raw[1:3] == "0x":
+                    addresses.add(raw[1:-1])
+            return add
+
+        def nested_thread(raw):
+            scan.nested.append(self.scan_profile(
+                cStringIO.StringIO(json.loads(raw).encode("utf-8"))))
+
+        schema = {
+            "meta": {"version": version},
+            "libs": libs,
+            "threads": [({
+                "stringTable": [collect(scan.addresses_v3)],
+                "samples": [{"frames": [{"location":
+                                         collect(scan.addresses_v2)}]}]
+            }, nested_thread)]
+        }
+        streaming.transform(streaming.JSONStream(profile_file),
+                            streaming.NullWriter(), schema)
+        return scan
+
+    def symbolicate_profile_stream(self, input, output, scan=None):
+        """
+        Streaming version of symbolicate_profile: read the profile from the
+        (seekable) file object input and write it symbolicated to output.
+        Only the addresses and their symbols are kept in memory.
+        """
+        if scan is None:
+            scan = self.scan_profile(input)
+        input.seek(0)
+        if scan.libs is None:
+            shutil.copyfileobj(input, output)
+            return
+
+        if scan.table is None:
+            # as symbolicate_profiles_v3 does, resolve the addresses of the
+            # nested v3 threads along with ours
+            scans = scan.merged_scans()
+            tables = self._resolve_profiles(
+                [(json.loads(s.libs), s.addresses()) for s in scans])
+            for s, table in zip(scans, tables):
+                s.table = table
+        symbolication_table = scan.table
+        nested_scans = iter(scan.nested)
+
+        def substitute(raw):
+            if raw[1:3] == "0x" and raw[1:-1] in symbolication_table:
+                return json.dumps(symbolication_table[raw[1:-1]])
+
+        def nested_thread(raw):
+            thread_input = cStringIO.StringIO(
+                json.loads(raw).encode("utf-8"))
+            thread_output = cStringIO.StringIO()
+            self.symbolicate_profile_stream(thread_input, thread_output,
+                                            next(nested_scans))
+            return json.dumps(thread_output.getvalue())
+
+        if scan.version == 3:
+            thread_schema = {"stringTable": [substitute]}
+        else:
+            thread_schema = {
+                "samples": [{"frames": [{"location": substitute}]}]}
+        schema = {"threads": [(thread_schema, nested_thread)]}
+        streaming.transform(streaming.JSONStream(input), output, schema)
+
     def symbolicate_profile_v2(self, profile_json):
         shared_libraries = json.loads(profile_json["libs"])
         shared_libraries.sort(key=lambda lib: lib["start"])
@@ -263,15 +454,45 @@ class ProfileSymbolicator:
         symbolication_table = self._resolve_symbols(symbols_to_resolve)
         self._substitute_symbols_v2(profile_json, symbolication_table)
 
-    def symbolicate_profile_v3(self, profile_json):
-        shared_libraries = json.loads(profile_json["libs"])
-        shared_libraries.sort(key=lambda lib: lib["start"])
-        addresses = self._find_addresses_v3(profile_json)
-        symbols_to_resolve = self._assign_symbols_to_libraries(
-            addresses, shared_libraries)
-        # print symbols_to_resolve
-        symbolication_table = self._resolve_symbols(symbols_to_resolve)
-        self._substitute_symbols_v3(profile_json, symbolication_table)
+    def _resolve_profiles(self, profiles):
+        """
+        Resolve the addresses of several profiles at once. profiles is a
+        list of (shared libraries, addresses); the same library may be
+        loaded at different addresses in each of them. Each (library,
+        offset) is resolved only once. Returns a symbolication table for
+        each profile.
+        """
+        libraries = {}
+        seen_offsets = {}
+        profile_keys = []
+        for shared_libraries, addresses in profiles:
+            shared_libraries = sorted(shared_libraries,
+                                      key=lambda lib: lib["start"])
+            keys = []
+            for library_with_symbols in self._assign_symbols_to_libraries(
+                    addresses, shared_libraries):
+                lib = library_with_symbols["library"]
+                module = tuple(self._module_from_lib(lib))
+                if module not in libraries:
+                    libraries[module] = {"library": lib, "symbols": [],
+                                         "offsets": []}
+                    seen_offsets[module] = set()
+                merged = libraries[module]
+                seen = seen_offsets[module]
+                for address, offset in zip(library_with_symbols["symbols"],
+                                           library_with_symbols["offsets"]):
+                    keys.append((address, (module, offset)))
+                    if offset not in seen:
+                        seen.add(offset)
+                        merged["symbols"].append((module, offset))
+                        merged["offsets"].append(offset)
+            profile_keys.append(keys)
+
+        symbolication_table = self._resolve_symbols(libraries.values())
+        return [dict((address, symbolication_table[key])
+                     for address, key in profile
+                     if key in symbolication_table)
+                for profile in profile_keys]
 
     def _find_addresses_v3(self, profile_json):
         addresses = set()
@@ -315,44 +536,154 @@ class ProfileSymbolicator:
         return None
 
     def _assign_symbols_to_libraries(self, addresses, shared_libraries):
+        """
+        Group the addresses by the library containing them, in a list of
+        {"library", "symbols", "offsets"} dicts: "symbols" is a list of
+        the addresses, "offsets" their offsets in the library.
+        shared_libraries must be sorted by start address.
+        """
+        if numpy is not None and shared_libraries:
+            return self._assign_symbols_to_libraries_array(
+                addresses, shared_libraries)
         libs_with_symbols = {}
         for address in addresses:
-            lib = self._get_containing_library(
-                int(address, 0), shared_libraries)
+            value = int(address, 0)
+            lib = self._get_containing_library(value, shared_libraries)
             if not lib:
                 continue
             if lib["start"] not in libs_with_symbols:
                 libs_with_symbols[lib["start"]] = {
-                    "library": lib, "symbols": set()}
-            libs_with_symbols[lib["start"]]["symbols"].add(address)
+                    "library": lib, "symbols": [], "offsets": []}
+            libs_with_symbols[lib["start"]]["symbols"].append(address)
+            libs_with_symbols[lib["start"]]["offsets"].append(
+                value - lib["start"])
         return libs_with_symbols.values()
 
+    def _assign_symbols_to_libraries_array(self, addresses, shared_libraries):
+        """
+        _assign_symbols_to_libraries on arrays: the addresses are converted
+        once, then matched with the libraries by a single search.
+        """
+        addresses = numpy.array(list(addresses), dtype=object)
+        values = numpy.array([int(address, 0) for address in addresses],
+                             dtype=numpy.uint64)
+        starts = numpy.array([lib["start"] for lib in shared_libraries],
+                             dtype=numpy.uint64)
+        ends = numpy.array([lib["end"] for lib in shared_libraries],
+                           dtype=numpy.uint64)
+
+        lib_indexes = numpy.searchsorted(starts, values, side="right") \
+            .astype(numpy.int64) - 1
+        hits = numpy.nonzero(lib_indexes >= 0)[0]
+        hits = hits[values[hits] < ends[lib_indexes[hits]]]
+        # group the hits by library
+        hits = hits[numpy.argsort(lib_indexes[hits], kind="mergesort")]
+        bounds = numpy.nonzero(numpy.diff(lib_indexes[hits]))[0] + 1
+
+        libs_with_symbols = []
+        for group in numpy.split(hits, bounds):
+            if not len(group):
+                continue
+            lib_index = lib_indexes[group[0]]
+            libs_with_symbols.append({
+                "library": shared_libraries[lib_index],
+                "symbols": addresses[group].tolist(),
+                "offsets": (values[group] - starts[lib_index])
+                .astype(numpy.int64).tolist()
+            })
+        return libs_with_symbols
+
     def _module_from_lib(self, lib):
         if "breakpadId" in lib:
             return [lib["name"].split("/")[-1], lib["breakpadId"]]
         pdbSig = re.sub("[{}\-]", "", lib["pdbSignature"])
         return [lib["pdbName"], pdbSig + lib["pdbAge"]]
 
+    def _symbol_sources(self):
+        sources = [source for source in SYMBOL_SOURCES
+                   if source in self.options["symbolPaths"]]
+        return sources or [self.options["defaultApp"],
+                           self.options["defaultOs"]]
+
+    def _local_symbol_map(self, module):
+        """Symbols of the module if we have them locally, else None."""
+        if not getModuleV3(*module):
+            return None
+        return self.sym_file_manager.GetLibSymbolMap(
+            module[0], module[1], self._symbol_sources())
+
     def _resolve_symbols(self, symbols_to_resolve):
+        symbolication_table = {}
+        memo_entries = []
+        # what has no symbols here goes through a SymbolicationRequest,
+        # which can forward it to the remote symbol server
         memoryMap = []
         processedStack = []
         all_symbols = []
-        for moduleIndex, library_with_symbols in enumerate(symbols_to_resolve):
+        for library_with_symbols in symbols_to_resolve:
             lib = library_with_symbols["library"]
             symbols = library_with_symbols["symbols"]
-            memoryMap.append(self._module_from_lib(lib))
-            all_symbols += symbols
-            for symbol in symbols:
-                processedStack.append(
-                    [moduleIndex, int(symbol, 0) - lib["start"]])
+            offsets = library_with_symbols.get("offsets")
+            if offsets is None:
+                symbols = list(symbols)
+                offsets = [int(symbol, 0) - lib["start"]
+                           for symbol in symbols]
+            module = self._module_from_lib(lib)
+
+            pending_symbols = []
+            pending_offsets = []
+            for symbol, offset in zip(symbols, offsets):
+                resolved = self.memo.Get((module[0], module[1], offset))
+                if resolved is not None:
+                    symbolication_table[symbol] = resolved
+                else:
+                    pending_symbols.append(symbol)
+                    pending_offsets.append(offset)
+            if not pending_offsets:
+                continue
 
-        rawRequest = {"stacks": [processedStack], "memoryMap": memoryMap,
-                      "version": 4, "symbolSources": ["FIREFOX", "WINDOWS"]}
-        request = SymbolicationRequest(self.sym_file_manager, rawRequest)
-        if not request.isValidRequest:
-            return {}
-        symbolicated_stack = request.Symbolicate(0)
-        return dict(zip(all_symbols, symbolicated_stack))
+            symbol_map = self._local_symbol_map(module)
+            if symbol_map is None:
+                moduleIndex = len(memoryMap)
+                memoryMap.append(module)
+                all_symbols += pending_symbols
+                processedStack += [[moduleIndex, offset]
+                                   for offset in pending_offsets]
+                continue
+
+            # Resolve all the offsets of this library in one go, formatted
+            # like SymbolicationRequest does.
+            suffix = " (in " + module[0] + ")"
+            for symbol, offset, function_name in zip(
+                    pending_symbols, pending_offsets,
+                    symbol_map.LookupMany(pending_offsets)):
+                if function_name is None:
+                    function_name = hex(offset)
+                resolved = function_name + suffix
+                symbolication_table[symbol] = resolved
+                memo_entries.append(((module[0], module[1], offset),
+                                     resolved))
+
+        if processedStack:
+            rawRequest = {"stacks": [processedStack], "memoryMap": memoryMap,
+                          "version": 4, "symbolSources": SYMBOL_SOURCES}
+            request = SymbolicationRequest(self.sym_file_manager, rawRequest)
+            if request.isValidRequest:
+                symbolicated_stack = request.Symbolicate(0)
+                symbolication_table.update(
+                    zip(all_symbols, symbolicated_stack))
+                # Only remember the symbols of libraries we had symbols
+                # for; the other ones may still show up later, e.g. once
+                # dumped.
+                for (index, offset), resolved in zip(processedStack,
+                                                     symbolicated_stack):
+                    if request.knownModules[index]:
+                        memo_entries.append(((memoryMap[index][0],
+                                              memoryMap[index][1], offset),
+                                             resolved))
+
+        self.memo.Update(memo_entries)
+        return symbolication_table
 
     def _substitute_symbols_v2(self, profile_json, symbolication_table):
         for thread in profile_json["threads"]:
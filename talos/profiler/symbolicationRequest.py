@@ -2,11 +2,10 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+from forwardingClient import GetForwardingClient
 from symLogging import LogTrace, LogError
 
 import re
-import json
-import urllib2
 
 # Precompiled regex for validating lib names
 # Empty lib name means client couldn't associate frame with any lib
@@ -162,7 +161,9 @@ class SymbolicationRequest:
         LogTrace("Forwarding " + str(len(stack)) + " PCs for symbolication")
 
         try:
-            url = self.symFileManager.sOptions["remoteSymbolServer"]
+            options = self.symFileManager.sOptions
+            client = GetForwardingClient(options["remoteSymbolServer"],
+                                         options.get("remoteSymbolCache"))
             rawModules = []
             moduleToIndex = {}
             newIndexToOldIndex = {}
@@ -181,63 +182,26 @@ class SymbolicationRequest:
                 newIndex = moduleToIndex[module]
                 rawStack.append([newIndex, offset])
 
-            requestVersion = 4
-            while True:
-                requestObj = {
-                    "symbolSources": self.symbolSources,
-                    "stacks": [rawStack],
-                    "memoryMap": rawModules,
-                    "forwarded": self.forwardCount + 1,
-                    "version": requestVersion
-                }
-                requestJson = json.dumps(requestObj)
-                headers = {"Content-Type": "application/json"}
-                requestHandle = urllib2.Request(url, requestJson, headers)
-                try:
-                    response = urllib2.urlopen(requestHandle)
-                except Exception as e:
-                    if requestVersion == 4:
-                        # Try again with version 3
-                        requestVersion = 3
-                        continue
-                    raise e
-                succeededVersion = requestVersion
-                break
-
+            result = client.Symbolicate(self.symbolSources,
+                                        self.forwardCount + 1,
+                                        rawModules, rawStack)
         except Exception as e:
             LogError("Exception while forwarding request: " + str(e))
             return
 
-        try:
-            responseJson = json.loads(response.read())
-        except Exception as e:
-            LogError("Exception while reading server response to forwarded"
-                     " request: " + str(e))
+        if result is None:
             return
+        responseSymbols, responseKnownModules = result
 
-        try:
-            if succeededVersion == 4:
-                responseKnownModules = responseJson['knownModules']
-                for newIndex, known in enumerate(responseKnownModules):
-                    if known and newIndex in newIndexToOldIndex:
-                        self.knownModules[newIndexToOldIndex[newIndex]] = True
-
-                responseSymbols = responseJson['symbolicatedStacks'][0]
-            else:
-                responseSymbols = responseJson[0]
-            if len(responseSymbols) != len(stack):
-                LogError(str(len(responseSymbols)) + " symbols in response, " +
-                         str(len(stack)) + " PCs in request!")
-                return
+        if responseKnownModules is not None:
+            for newIndex, known in enumerate(responseKnownModules):
+                if known and newIndex in newIndexToOldIndex:
+                    self.knownModules[newIndexToOldIndex[newIndex]] = True
 
-            for index in range(0, len(stack)):
-                symbol = responseSymbols[index]
-                originalIndex = indexes[index]
-                symbolicatedStack[originalIndex] = symbol
-        except Exception as e:
-            LogError("Exception while parsing server response to forwarded"
-                     " request: " + str(e))
-            return
+        for index in range(0, len(stack)):
+            symbol = responseSymbols[index]
+            originalIndex = indexes[index]
+            symbolicatedStack[originalIndex] = symbol
 
     def Symbolicate(self, stackNum):
         # Check if we should forward requests when required sym files don't
@@ -95,8 +95,11 @@ class TestResults(object):
         self.format = None
         self.global_counters = global_counters or {}
         self.all_counter_results = []
+        self.all_counter_series = []
         self.extensions = extensions
         self.using_xperf = False
+        self.cycles_run = None  # set when the cycles adapt to the results
+        self.topology = {}  # cpu and scheduling settings of the browser
 
     def name(self):
         return self.test_config['name']
@@ -107,18 +110,23 @@ class TestResults(object):
     def mainthread(self):
         return self.test_config['mainthread']
 
-    def add(self, results, counter_results=None):
+    def add(self, results, counter_results=None, counter_series=None,
+            mainthread_io=None):
         """
         accumulate one cycle of results
-        - results : TalosResults instance or path to browser log
+        - results : browser log, or BrowserLogScanner fed with it
         - counter_results : counters accumulated for this cycle
+        - counter_series : timestamped counter values for this cycle
+        - mainthread_io : main thread IO of this cycle, see
+          mainthreadio.analyze
         """
 
         # convert to a results class via parsing the browser log
         browserLog = BrowserLogResults(
             results,
             counter_results=counter_results,
-            global_counters=self.global_counters
+            global_counters=self.global_counters,
+            mainthread_io=mainthread_io
         )
         results = browserLog.results()
 
@@ -134,6 +142,30 @@ class TestResults(object):
 
         if counter_results:
             self.all_counter_results.append(counter_results)
+        if counter_series:
+            self.all_counter_series.append(counter_series)
+
+    def cycle_values(self):
+        """return the filtered value of each cycle, averaged over its pages"""
+        values = []
+        for results in self.results:
+            filtered = [i['filtered'] for i, page in
+                        results.values(self.name(),
+                                       self.test_config['filters'])]
+            if filtered:
+                values.append(filter.mean(filtered))
+        return values
+
+    def converged(self, ci_width):
+        """
+        whether the 95% confidence interval of the cycle values is narrower
+        than ci_width, relative to their mean
+        """
+        values = self.cycle_values()
+        if len(values) < 2:
+            return False
+        width = 2 * filter.confidence_interval(values)
+        return width <= ci_width * abs(filter.mean(values))
 
 
 class Results(object):
@@ -145,35 +177,43 @@ class Results(object):
         the last filter should return a scalar (float or int)
         returns a list of [[data, page], ...]
         """
-        retval = []
+        # ignore* functions return a filtered set of data
+        ignore_filters = [f for f in filters
+                          if f.func.__name__.startswith('ignore')]
+        remaining_filters = [f for f in filters
+                             if not f.func.__name__.startswith('ignore')]
+
+        pages = []
+        series = []
         for result in self.results:
-            page = result['page']
             data = result['runs']
-            remaining_filters = []
-
-            # ignore* functions return a filtered set of data
-            for f in filters:
-                if f.func.__name__.startswith('ignore'):
-                    data = f.apply(data)
-                else:
-                    remaining_filters.append(f)
-
-            # calculate common numbers with the raw data
-            data_summary = {
-                'min': min(data),
-                'max': max(data),
-                'mean': filter.mean(data),
-                'median': filter.median(data),
-                'std': filter.stddev(data)
-            }
-
-            # apply the summarization filters
-            for f in remaining_filters:
-                if f.func.__name__ == "v8_subtest":
-                    # for v8_subtest we need to page for reference data
-                    data = filter.v8_subtest(data, page)
-                else:
-                    data = f.apply(data)
+            for f in ignore_filters:
+                data = f.apply(data)
+            pages.append(result['page'])
+            series.append(data)
+
+        # calculate common numbers with the raw data, for all pages at once
+        summaries = filter.summarize(series)
+
+        # a single summarization filter is already part of the summary
+        summary_key = None
+        if len(remaining_filters) == 1:
+            f = remaining_filters[0]
+            if not (f.args or f.kwargs):
+                summary_key = filter.summary_keys.get(f.func.__name__)
+
+        retval = []
+        for page, data, data_summary in zip(pages, series, summaries):
+            if summary_key:
+                data = data_summary[summary_key]
+            else:
+                # apply the summarization filters
+                for f in remaining_filters:
+                    if f.func.__name__ == "v8_subtest":
+                        # for v8_subtest we need to page for reference data
+                        data = filter.v8_subtest(data, page)
+                    else:
+                        data = f.apply(data)
             data_summary['filtered'] = data
 
             # special case for dromaeo_dom and v8_7
@@ -285,6 +325,124 @@ class PageloaderResults(Results):
         return page
 
 
+class BrowserLogScanner(object):
+    """
+    incremental parser of a browser log.
+
+    The log is given with :meth:`feed`, either at once or line by line as
+    the browser outputs it. It is walked only once, recording the positions
+    and contents of all the given token pairs, the __FAIL block, the RSS
+    lines and the responsiveness samples, so that the raw log does not need
+    to be kept around for :class:`BrowserLogResults`.
+    """
+
+    FAIL_TOKEN = '__FAIL'
+
+    def __init__(self, token_pairs):
+        self.token_pairs = list(token_pairs)
+        self.offset = 0  # position of the next fed text in the log
+        self.positions = {self.FAIL_TOKEN: []}
+        self.parts = {}  # token pair: list of token contents
+        self.rss = []  # (type, value) tuples
+        self.responsiveness = []
+        self.fail_message = None
+
+        # token: (token pair, True for start tokens)
+        self._tokens = {}
+        for start, end in self.token_pairs:
+            self.positions[start] = []
+            self.positions[end] = []
+            self.parts[(start, end)] = []
+            self._tokens[start] = ((start, end), True)
+            self._tokens[end] = ((start, end), False)
+        # token pair: pieces of the contents of the tokens not yet closed
+        self._open = dict((pair, []) for pair in self.token_pairs)
+        self._fail = None
+
+        # longest tokens first so that a token is never matched as the
+        # prefix of another one
+        tokens = sorted(self.positions, key=len, reverse=True)
+        self.regex = re.compile(
+            r'(?P<token>%s)'
+            r'|RSS:[^\S\n]+(?P<rss_type>[a-zA-Z0-9]+):'
+            r'[^\S\n]+(?P<rss_value>[0-9]+)$'
+            r'|MOZ_EVENT_TRACE\ssample\s\d*?\s'
+            r'(?P<responsiveness>\d*\.?\d*)$'
+            % '|'.join(re.escape(token) for token in tokens),
+            re.MULTILINE
+        )
+
+    @property
+    def failed(self):
+        """whether a complete __FAIL block has been seen"""
+        return self.fail_message is not None
+
+    def scan(self, string):
+        """scan a whole browser log"""
+        self.feed(string)
+        return self
+
+    def feed(self, text):
+        """scan the next piece of the browser log"""
+        last = 0
+        for match in self.regex.finditer(text):
+            token = match.group('token')
+            if token is not None:
+                self._capture(text[last:match.start()])
+                last = match.end()
+                self.positions[token].append(self.offset + match.start())
+                self._token(token)
+            elif match.group('rss_type') is not None:
+                self.rss.append((match.group('rss_type'),
+                                 match.group('rss_value')))
+            else:
+                self.responsiveness.append(match.group('responsiveness'))
+        self._capture(text[last:])
+        self.offset += len(text)
+
+    def _capture(self, text):
+        if not text:
+            return
+        for pieces in self._open.itervalues():
+            for piece in pieces:
+                piece.append(text)
+        if self._fail is not None:
+            self._fail.append(text)
+
+    def _token(self, token):
+        # the token is part of the contents of the other open tokens
+        if token == self.FAIL_TOKEN:
+            if self._fail is not None:
+                # only the first __FAIL block is reported
+                self.fail_message = ''.join(self._fail)
+                self._fail = None
+                self._capture(token)
+            else:
+                self._capture(token)
+                if self.fail_message is None:
+                    self._fail = []
+            return
+        pair, is_start = self._tokens[token]
+        if is_start:
+            self._capture(token)
+            self._open[pair].append([])
+        else:
+            if self._open[pair]:
+                self.parts[pair].append(''.join(self._open[pair].pop(0)))
+            self._capture(token)
+
+    def tokenize(self, start, end):
+        """
+        like utils.tokenize on the scanned log,
+        returns parts and position of last token
+        """
+        _start, _end = self.positions[start], self.positions[end]
+        utils.check_token_positions(start, end, _start, _end)
+        if not _start and not _end:
+            return [], -1
+        return self.parts[(start, end)], _end[-1]
+
+
 class BrowserLogResults(object):
     """parse the results from the browser log output"""
 
@@ -304,19 +462,6 @@ class BrowserLogResults(object):
                      '__endAfterTerminationTimestamp'))
     ]
 
-    # regular expression for failure case if we can't parse the tokens
-    RESULTS_REGEX_FAIL = re.compile('__FAIL(.*?)__FAIL',
-                                    re.DOTALL | re.MULTILINE)
-
-    # regular expression for RSS results
-    RSS_REGEX = re.compile('RSS:\s+([a-zA-Z0-9]+):\s+([0-9]+)$')
-
-    # regular expression for responsiveness results
-    RESULTS_RESPONSIVENESS_REGEX = re.compile(
-        'MOZ_EVENT_TRACE\ssample\s\d*?\s(\d*\.?\d*)$',
-        re.DOTALL | re.MULTILINE
-    )
-
     # classes for results types
     classes = {'tsformat': TsResults,
                'tpformat': PageloaderResults}
@@ -326,22 +471,28 @@ class BrowserLogResults(object):
     using_xperf = False
 
     def __init__(self, results_raw, counter_results=None,
-                 global_counters=None):
+                 global_counters=None, mainthread_io=None):
         """
+        - results_raw : browser log, either as a string or as a
+          BrowserLogScanner it has already been fed to
         - shutdown : whether to record shutdown results or not
+        - mainthread_io : main thread IO rows, see mainthreadio.analyze
         """
 
         self.counter_results = counter_results
         self.global_counters = global_counters
+        self.mainthread_io_rows = mainthread_io
 
-        self.results_raw = results_raw
+        # find all the tokens and counter lines in one pass over the log
+        if isinstance(results_raw, BrowserLogScanner):
+            self.scanner = results_raw
+        else:
+            self.scanner = self.make_scanner().scan(results_raw)
 
         # parse the results
         try:
-            match = self.RESULTS_REGEX_FAIL.search(self.results_raw)
-            if match:
-                self.error(match.group(1))
-                raise utils.TalosError(match.group(1))
+            if self.scanner.failed:
+                self.error(self.scanner.fail_message)
 
             self.parse()
         except utils.TalosError:
@@ -352,6 +503,13 @@ class BrowserLogResults(object):
         # accumulate counter results
         self.counters(self.counter_results, self.global_counters)
 
+    @classmethod
+    def make_scanner(cls):
+        """return a BrowserLogScanner for all the tokens of the log"""
+        return BrowserLogScanner(
+            [tokens for _, tokens in cls.report_tokens + cls.time_tokens]
+        )
+
     def error(self, message):
         """raise a TalosError for bad parsing of the browser log"""
         raise utils.TalosError(message)
@@ -400,8 +558,7 @@ class BrowserLogResults(object):
     def get_single_token(self, start_token, end_token):
         """browser logs should only have a single instance of token pairs"""
         try:
-            parts, last_token = utils.tokenize(self.results_raw,
-                                               start_token, end_token)
+            parts, last_token = self.scanner.tokenize(start_token, end_token)
         except AssertionError, e:
             self.error(str(e))
         if not parts:
@@ -523,30 +680,23 @@ class BrowserLogResults(object):
                 .intersection(counter_results.keys()):
             # no RSS counters to accumulate
             return
-        for line in self.results_raw.split('\n'):
-            rssmatch = self.RSS_REGEX.search(line)
-            if rssmatch:
-                (type, value) = (rssmatch.group(1), rssmatch.group(2))
-                # type will be 'Main' or 'Content'
-                counter_name = '%s_RSS' % type
-                if counter_name in counter_results:
-                    counter_results[counter_name].append(value)
+        for type, value in self.scanner.rss:
+            # type will be 'Main' or 'Content'
+            counter_name = '%s_RSS' % type
+            if counter_name in counter_results:
+                counter_results[counter_name].append(value)
 
     def mainthread_io(self, counter_results):
         """record mainthread IO counters in counter_results dictionary"""
 
         # we want to measure mtio on xperf runs.
         # this will be shoved into the xperf results as we ignore those
-        SCRIPT_DIR = \
-            os.path.abspath(os.path.realpath(os.path.dirname(__file__)))
-        filename = os.path.join(SCRIPT_DIR, 'mainthread_io.json')
-        try:
-            contents = file(filename).read()
-            counter_results.setdefault('mainthreadio', []).append(contents)
-            self.using_xperf = True
-        except:
-            # silent failure is fine here as we will only see this on tp5n runs
-            pass
+        if self.mainthread_io_rows is None:
+            # we will only see this on tp5n runs
+            return
+        counter_results.setdefault('mainthreadio', []).append(
+            self.mainthread_io_rows)
+        self.using_xperf = True
 
     def shutdown(self, counter_results):
         """record shutdown time in counter_results dictionary"""
@@ -554,4 +704,4 @@ class BrowserLogResults(object):
             .append(int(self.endTime - self.startTime))
 
     def responsiveness(self):
-        return self.RESULTS_RESPONSIVENESS_REGEX.findall(self.results_raw)
+        return self.scanner.responsiveness
@@ -10,9 +10,12 @@ import logging
 import os
 import sys
 import time
+import Queue
+import threading
 import traceback
 import urllib
 import urlparse
+import psutil
 import utils
 
 from talos.results import TalosResults
@@ -92,6 +95,128 @@ def setup_webserver(webserver):
         return None
 
 
+def parallel_safe(test, browser_config=None):
+    """
+    whether a test may run along other tests. Tests that use machine wide
+    resources may not: xperf (setup and cleanup scripts), the mainthread io
+    log, the media test server and the counters, which look for the browser
+    processes by name. Neither may tests writing to shared files: the
+    missing symbols zip of sps profiling, and the browser output log.
+    """
+    return not (test.get('setup') or test.get('cleanup') or
+                test.get('mainthread') or test['name'] == 'media_tests' or
+                test.get(TTest.platform_type + 'counters') or
+                test.get('sps_profile') or
+                (browser_config or {}).get('output_log'))
+
+
+def cpu_sets(count, cpus=None):
+    """
+    split the cpus (by default, those of the machine) in `count` sets;
+    returns a list of `count` cpu lists, or of None if the cpu affinity can
+    not be set
+    """
+    if not hasattr(psutil.Process, 'cpu_affinity'):
+        return [None] * count
+    if not cpus:
+        cpus = psutil.Process().cpu_affinity()
+    size = max(len(cpus) / count, 1)
+    return [cpus[(i * size) % len(cpus):][:size] for i in range(count)]
+
+
+class TestScheduler(object):
+    """
+    run the tests, up to `workers` at a time.
+
+    Each test already gets its own profile and browser instance from
+    :class:`TTest`; running tests also get their own set of cpus. Tests
+    that are not :func:`parallel_safe` run alone.
+
+    Iterating over the scheduler yields (test, run) in the order of the
+    tests, where run() returns the test results or raises the error of
+    the test.
+    """
+
+    def __init__(self, tests, browser_config, workers=1):
+        self.tests = tests
+        self.browser_config = browser_config
+        self.workers = workers
+        self._stop = threading.Event()
+        self._threads = []
+
+    def __iter__(self):
+        batch = []
+        for test in self.tests:
+            if self.workers > 1 and parallel_safe(test, self.browser_config):
+                batch.append(test)
+                continue
+            for item in self._run_batch(batch):
+                yield item
+            batch = []
+            yield test, self._runner(test, self.browser_config)
+        for item in self._run_batch(batch):
+            yield item
+
+    def stop(self):
+        """do not start the remaining tests"""
+        self._stop.set()
+
+    def join(self):
+        """wait for the running tests to finish"""
+        for thread in self._threads:
+            # wait with a timeout, so that KeyboardInterrupt is not blocked
+            while thread.is_alive():
+                thread.join(1)
+
+    def _runner(self, test, browser_config):
+        def run():
+            return TTest().runTest(browser_config, test)
+        return run
+
+    def _run_batch(self, batch):
+        if not batch:
+            return
+        queue = Queue.Queue()
+        for i in range(len(batch)):
+            queue.put(i)
+        outcomes = [None] * len(batch)
+        done = [threading.Event() for test in batch]
+        workers = min(self.workers, len(batch))
+        for cpus in cpu_sets(workers, self.browser_config['cpu_affinity']):
+            browser_config = dict(self.browser_config, cpu_affinity=cpus)
+            thread = threading.Thread(target=self._worker,
+                                      args=(queue, batch, browser_config,
+                                            outcomes, done))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+        for i, test in enumerate(batch):
+            # wait with a timeout, so that KeyboardInterrupt is not blocked
+            while not done[i].wait(1):
+                pass
+            yield test, outcomes[i]
+
+    def _worker(self, queue, batch, browser_config, outcomes, done):
+        while not self._stop.is_set():
+            try:
+                i = queue.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                results = self._runner(batch[i], browser_config)()
+            except BaseException:
+                exc_info = sys.exc_info()
+
+                def run(exc_info=exc_info):
+                    raise exc_info[0], exc_info[1], exc_info[2]
+            else:
+                def run(results=results):
+                    return results
+            outcomes[i] = run
+            done[i].set()
+
+
 def run_tests(config, browser_config):
     """Runs the talos tests on the given configuration and generates a report.
     """
@@ -195,6 +320,14 @@ def run_tests(config, browser_config):
         )
     talos_results.check_output_formats(results_urls)
 
+    # keep talos and its counter collection off the cpus of the browser
+    if browser_config['harness_cpus']:
+        if not browser_config['cpu_affinity']:
+            browser_config['cpu_affinity'] = \
+                [cpu for cpu in psutil.Process().cpu_affinity()
+                 if cpu not in browser_config['harness_cpus']]
+        psutil.Process().cpu_affinity(browser_config['harness_cpus'])
+
     # setup a webserver, if --develop is specified
     httpd = None
     if browser_config['develop']:
@@ -205,35 +338,44 @@ def run_tests(config, browser_config):
     # run the tests
     timer = utils.Timer()
     logging.info("Starting test suite %s", title)
-    for test in tests:
-        testname = test['name']
-        testtimer = utils.Timer()
-        logging.info("Starting test %s", testname)
-
-        try:
-            mytest = TTest()
-            if mytest:
-                talos_results.add(mytest.runTest(browser_config, test))
-            else:
-                logging.error("Error found while running %s", testname)
-        except TalosRegression:
-            logging.error("Detected a regression for %s", testname)
-            if httpd:
-                httpd.stop()
-            # by returning 1, we report an orange to buildbot
-            # http://docs.buildbot.net/latest/developer/results.html
-            return 1
-        except (TalosCrash, TalosError):
-            # NOTE: if we get into this condition, talos has an internal
-            # problem and cannot continue
-            #       this will prevent future tests from running
-            traceback.print_exception(*sys.exc_info())
-            if httpd:
-                httpd.stop()
-            # indicate a failure to buildbot, turn the job red
-            return 2
-
-        logging.info("Completed test %s (%s)", testname, testtimer.elapsed())
+    scheduler = TestScheduler(tests, browser_config,
+                              browser_config['parallel'])
+    status = 0
+    try:
+        for test, run_test in scheduler:
+            testname = test['name']
+            testtimer = utils.Timer()
+            logging.info("Starting test %s", testname)
+
+            try:
+                talos_results.add(run_test())
+            except TalosRegression:
+                logging.error("Detected a regression for %s", testname)
+                # by returning 1, we report an orange to buildbot
+                # http://docs.buildbot.net/latest/developer/results.html
+                status = 1
+                break
+            except (TalosCrash, TalosError):
+                # NOTE: if we get into this condition, talos has an internal
+                # problem and cannot continue
+                #       this will prevent future tests from running
+                traceback.print_exception(*sys.exc_info())
+                # indicate a failure to buildbot, turn the job red
+                status = 2
+                break
+
+            logging.info("Completed test %s (%s)", testname,
+                         testtimer.elapsed())
+    finally:
+        # let the tests still running finish and clean up their browser
+        # before the webserver goes away
+        scheduler.stop()
+        scheduler.join()
+
+    if status:
+        if httpd:
+            httpd.stop()
+        return status
 
     logging.info("Completed test suite (%s)", timer.elapsed())
 
@@ -9,12 +9,42 @@ module to handle sps profilling.
 import os
 import tempfile
 import logging
+import multiprocessing
 import zipfile
 import json
 
 import mozfile
+import psutil
 
-from talos.profiler import symbolication, sps
+from talos.profiler import symbolication, symbolMemo, sps
+from talos.talos_process import isolate
+
+# Profiles bigger than this (in bytes) are symbolicated while streaming
+# through them, instead of being loaded in memory.
+STREAMING_PROFILE_SIZE = 64 * 1024 * 1024
+
+# Priority of the background symbolication process
+PIPELINE_NICE = getattr(psutil, 'BELOW_NORMAL_PRIORITY_CLASS', 10)
+
+
+def _pipeline_worker(sps_profile, jobs, cpus):
+    """
+    Symbolicate and archive the profiles of the cycles queued in jobs,
+    until None is queued.
+    """
+    isolate(psutil.Process(), cpus, PIPELINE_NICE)
+    for cycle, profile_dir in iter(jobs.get, None):
+        _symbolicate_queued(sps_profile, cycle, profile_dir)
+
+
+def _symbolicate_queued(sps_profile, cycle, profile_dir):
+    try:
+        sps_profile._symbolicate_dir(cycle, profile_dir)
+    except Exception:
+        logging.exception("Failed to symbolicate the profiles of"
+                          " cycle %d", cycle)
+    finally:
+        mozfile.remove(profile_dir)
 
 
 class SpsProfile(object):
@@ -50,6 +80,11 @@ class SpsProfile(object):
             'THUNDERBIRD': tempfile.mkdtemp(),
             'WINDOWS': tempfile.mkdtemp()
         }
+        self.symbolicator = None
+        self.pipeline = None
+        self.pipeline_jobs = None
+        # the (cycle, profile directory) queued for the pipeline process
+        self.pipeline_queued = []
 
         logging.info("Activating Gecko Profiling. Temp. profile dir:"
                      " {0}, interval: {1}, entries: {2}"
@@ -64,6 +99,13 @@ class SpsProfile(object):
             "sps_profile_threads": sps_profile_threads
         }
 
+    def __getstate__(self):
+        # what the pipeline process needs, when it is not forked
+        state = self.__dict__.copy()
+        state.update(symbolicator=None, pipeline=None, pipeline_jobs=None,
+                     pipeline_queued=[])
+        return state
+
     def option(self, name):
         return self.profiling_info["sps_profile_" + name]
 
@@ -86,6 +128,10 @@ class SpsProfile(object):
     def _save_sps_profile(self, cycle, symbolicator, missing_symbols_zip,
                           profile_path):
         try:
+            if os.path.getsize(profile_path) > STREAMING_PROFILE_SIZE:
+                self._stream_sps_profile(symbolicator, missing_symbols_zip,
+                                         profile_path)
+                return
             with open(profile_path, 'r') as profile_file:
                 profile = json.load(profile_file)
             symbolicator.dump_and_integrate_missing_symbols(
@@ -104,20 +150,46 @@ class SpsProfile(object):
                               " symbolication {0} (cycle {1})"
                               .format(profile_path, cycle))
 
-    def symbolicate(self, cycle):
+    def _stream_sps_profile(self, symbolicator, missing_symbols_zip,
+                            profile_path):
         """
-        Symbolicate sps profiling data for one cycle.
+        Symbolicate a profile in two streaming passes, keeping only its
+        addresses and their symbols in memory.
+        """
+        output_path = profile_path + '.tmp'
+        try:
+            with open(profile_path, 'rb') as profile_file, \
+                    open(output_path, 'wb') as output_file:
+                scan = symbolicator.scan_profile(profile_file)
+                if scan.libs is not None:
+                    symbolicator.dump_and_integrate_missing_symbols(
+                        {'libs': scan.libs},
+                        missing_symbols_zip)
+                symbolicator.symbolicate_profile_stream(profile_file,
+                                                        output_file, scan)
+            os.rename(output_path, profile_path)
+        finally:
+            mozfile.remove(output_path)
 
-        :param cycle: the number of the cycle of the test currently run.
+    def _get_symbolicator(self):
+        """
+        Create the symbolicator on first use, then reuse it for the next
+        cycles. Resolved symbols go to a memo shared by the whole talos
+        run, so each cycle only resolves the addresses not seen before.
         """
+        if self.symbolicator:
+            return self.symbolicator
+        memo = symbolMemo.GetSymbolMemo(
+            self.browser_config.get('symbol_cache'))
         symbolicator = symbolication.ProfileSymbolicator({
             # Trace-level logging (verbose)
             "enableTracing": 0,
             # Fallback server if symbol is not found locally
-            "remoteSymbolServer":
-                "http://symbolapi.mozilla.org:80/talos/",
+            "remoteSymbolServer": self.browser_config.get('symbol_server'),
             # Maximum number of symbol files to keep in memory
             "maxCacheEntries": 2000000,
+            # Maximum memory used by symbol files kept in memory
+            "maxCacheBytes": 1024 * 1024 * 1024,
             # Frequency of checking for recent symbols to
             # cache (in hours)
             "prefetchInterval": 12,
@@ -134,7 +206,7 @@ class SpsProfile(object):
             # Note: App & OS names from requests are converted
             # to all-uppercase internally
             "symbolPaths": self.symbol_paths
-        })
+        }, memo=memo)
 
         if self.browser_config['symbols_path']:
             if mozfile.is_url(self.browser_config['symbols_path']):
@@ -145,7 +217,85 @@ class SpsProfile(object):
                 symbolicator.integrate_symbol_zip_from_file(
                     self.browser_config['symbols_path']
                 )
+        self.symbolicator = symbolicator
+        return symbolicator
+
+    def _pipeline_cpus(self):
+        """
+        The cpus of the pipeline process: those of the harness, or those
+        the browser does not use.
+        """
+        if self.browser_config.get('harness_cpus'):
+            return self.browser_config['harness_cpus']
+        browser_cpus = self.browser_config.get('cpu_affinity')
+        if not browser_cpus or not hasattr(psutil.Process, 'cpu_affinity'):
+            return None
+        return [cpu for cpu in psutil.Process().cpu_affinity()
+                if cpu not in browser_cpus] or None
+
+    def _queue_cycle(self, cycle):
+        """
+        Move the profiles of the cycle out of the way of the next one,
+        and queue them for the pipeline process.
+        """
+        profile_dir = tempfile.mkdtemp()
+        sps_profile_dir = self.option('dir')
+        for profile_filename in os.listdir(sps_profile_dir):
+            os.rename(os.path.join(sps_profile_dir, profile_filename),
+                      os.path.join(profile_dir, profile_filename))
+
+        if self.pipeline is None:
+            self.pipeline_jobs = multiprocessing.Queue()
+            self.pipeline = multiprocessing.Process(
+                target=_pipeline_worker,
+                args=(self, self.pipeline_jobs, self._pipeline_cpus()))
+            self.pipeline.start()
+        self.pipeline_jobs.put((cycle, profile_dir))
+        self.pipeline_queued.append((cycle, profile_dir))
+
+    def join(self):
+        """
+        Wait for the pipeline process to handle all the queued cycles.
+        If it died, the cycles it did not handle are symbolicated here.
+        """
+        if self.pipeline is None:
+            return
+        logging.info("Waiting for the symbolication of the profiles")
+        self.pipeline_jobs.put(None)
+        self.pipeline.join()
+        if self.pipeline.exitcode:
+            logging.error("The symbolication process failed with exit code"
+                          " %s, symbolicating the remaining profiles",
+                          self.pipeline.exitcode)
+            # nobody reads the queue anymore
+            self.pipeline_jobs.cancel_join_thread()
+            for cycle, profile_dir in self.pipeline_queued:
+                # the directories of the handled cycles are removed
+                if os.path.isdir(profile_dir):
+                    _symbolicate_queued(self, cycle, profile_dir)
+        self.pipeline = self.pipeline_jobs = None
+        self.pipeline_queued = []
+
+    def symbolicate(self, cycle):
+        """
+        Symbolicate sps profiling data for one cycle.
+
+        With the sps_profile_pipeline option, this happens in a background
+        process while the next cycle runs, see :meth:`join`.
+
+        :param cycle: the number of the cycle of the test currently run.
+        """
+        if self.browser_config.get('sps_profile_pipeline'):
+            self._queue_cycle(cycle)
+        else:
+            self._symbolicate_dir(cycle, self.option('dir'))
 
+    def _symbolicate_dir(self, cycle, sps_profile_dir):
+        """
+        Symbolicate the profiles in sps_profile_dir and add them to the
+        profile archive.
+        """
+        symbolicator = self._get_symbolicator()
         missing_symbols_zip = os.path.join(self.upload_dir,
                                            "missingsymbols.zip")
 
@@ -154,8 +304,6 @@ class SpsProfile(object):
         except NameError:
             mode = zipfile.ZIP_STORED
 
-        sps_profile_dir = self.option('dir')
-
         with zipfile.ZipFile(self.profile_arcname, 'a', mode) as arc:
             # Collect all individual profiles that the test
             # has put into sps_profile_dir.
@@ -200,6 +348,7 @@ class SpsProfile(object):
         """
         Clean up temp folders created with the instance creation.
         """
+        self.join()
         mozfile.remove(self.option('dir'))
         for symbol_path in self.symbol_paths.values():
             mozfile.remove(symbol_path)
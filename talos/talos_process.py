@@ -3,13 +3,15 @@
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import time
+import gzip
 import logging
 import psutil
 import mozcrash
 from mozprocess import ProcessHandler
 from threading import Event
+from collections import deque
 
-from utils import TalosError
+from utils import TalosError, chrt_command
 
 
 class ProcessContext(object):
@@ -19,6 +21,7 @@ class ProcessContext(object):
     def __init__(self):
         self.output = None
         self.process = None
+        self.log_scanner = None
 
     @property
     def pid(self):
@@ -36,11 +39,40 @@ class ProcessContext(object):
                 self.process.wait(3)
 
 
+def isolate(process, cpu_affinity=None, nice=None):
+    """
+    pin a process and its children to the given cpus and set their
+    niceness; processes they start later inherit both settings
+    """
+    settings = []
+    if cpu_affinity:
+        settings.append(('cpu affinity', 'cpu_affinity', cpu_affinity))
+    if nice is not None:
+        settings.append(('niceness', 'nice', nice))
+    for proc in [process] + process.children(recursive=True):
+        for name, method, value in settings:
+            try:
+                getattr(proc, method)(value)
+            except psutil.NoSuchProcess:
+                break
+            except psutil.AccessDenied:
+                # e.g. a negative niceness without privileges; the run goes
+                # on without this setting rather than failing
+                logging.warning("Not allowed to set the %s of %s to %s, the"
+                                " results may be noisier", name, proc, value)
+                continue
+
+
 class Reader(object):
-    def __init__(self, event):
-        self.output = []
+    def __init__(self, event, log_scanner=None, output_lines=None,
+                 output_log=None):
+        # with output_lines, only the last lines are kept in a ring buffer
+        self.output = deque(maxlen=output_lines)
         self.got_end_timestamp = False
+        self.got_failure = False
         self.event = event
+        self.log_scanner = log_scanner
+        self.output_log = output_log
 
     def __call__(self, line):
         if line.find('__endTimestamp') != -1:
@@ -50,10 +82,23 @@ class Reader(object):
         if not (line.startswith('JavaScript error:') or
                 line.startswith('JavaScript warning:')):
             logging.debug('BROWSER_OUTPUT: %s', line)
-            self.output.append(line)
-
-
-def run_browser(command, timeout=None, on_started=None, **kwargs):
+            self.append(line)
+
+    def append(self, line):
+        self.output.append(line)
+        if self.output_log is not None:
+            self.output_log.write(line + '\n')
+        if self.log_scanner is not None:
+            self.log_scanner.feed(line + '\n')
+            if self.log_scanner.failed and not self.got_failure:
+                # no need to wait for the browser, the cycle failed
+                self.got_failure = True
+                self.event.set()
+
+
+def run_browser(command, timeout=None, on_started=None, log_scanner=None,
+                output_lines=None, output_log=None, cpu_affinity=None,
+                nice=None, sched_policy=None, **kwargs):
     """
     Run the browser using the given `command`.
 
@@ -68,16 +113,50 @@ def run_browser(command, timeout=None, on_started=None, **kwargs):
                     we raise a :class:`TalosError`
     :param on_started: a callback that can be used to do things just after
                        the browser has been started
+    :param log_scanner: if specified, a :class:`BrowserLogScanner` that is
+                        fed with the browser output as it arrives. The
+                        browser is killed as soon as a __FAIL block is seen.
+    :param output_lines: if specified, only keep the last `output_lines`
+                         lines of the browser output in memory (shown when
+                         the browser times out). The results must then be
+                         parsed with a `log_scanner`.
+    :param output_log: if specified, path of a gzip file the whole browser
+                       output is appended to
+    :param cpu_affinity: if specified, list of the cpus the browser
+                         processes are pinned to
+    :param nice: if specified, niceness of the browser processes
+    :param sched_policy: if specified, linux scheduling policy ('batch',
+                         'fifo', ...) of the browser processes, set with
+                         chrt
     :param kwargs: additional keyword arguments for the :class:`ProcessHandler`
                    instance
 
     Returns a ProcessContext instance, with available output and pid used.
     """
+    if sched_policy:
+        command = chrt_command(sched_policy, command)
     context = ProcessContext()
+    event = Event()
+    reader = Reader(event, log_scanner=log_scanner,
+                    output_lines=output_lines,
+                    output_log=(gzip.open(output_log, 'ab')
+                                if output_log else None))
+    try:
+        _run_browser(context, reader, command, timeout, on_started,
+                     cpu_affinity, nice, **kwargs)
+    finally:
+        if reader.output_log is not None:
+            reader.output_log.close()
+
+    context.log_scanner = log_scanner
+    return context
+
+
+def _run_browser(context, reader, command, timeout, on_started, cpu_affinity,
+                 nice, **kwargs):
     first_time = int(time.time()) * 1000
     wait_for_quit_timeout = 5
-    event = Event()
-    reader = Reader(event)
+    event = reader.event
 
     kwargs['storeOutput'] = False
     kwargs['processOutputLine'] = reader
@@ -86,6 +165,8 @@ def run_browser(command, timeout=None, on_started=None, **kwargs):
     proc.run()
     try:
         context.process = psutil.Process(proc.pid)
+        if cpu_affinity or nice is not None:
+            isolate(context.process, cpu_affinity=cpu_affinity, nice=nice)
         if on_started:
             on_started()
         # wait until we saw __endTimestamp in the proc output,
@@ -93,8 +174,14 @@ def run_browser(command, timeout=None, on_started=None, **kwargs):
         if not event.wait(timeout):
             # try to extract the minidump stack if the browser hangs
             mozcrash.kill_and_get_minidump(proc.pid)
+            if reader.output.maxlen:
+                logging.info("Last %d lines of browser output:\n%s",
+                             len(reader.output), '\n'.join(reader.output))
             raise TalosError("timeout")
-        if reader.got_end_timestamp:
+        if reader.got_failure:
+            logging.info("Found a failure in the browser output,"
+                         " terminating process.")
+        elif reader.got_end_timestamp:
             for i in range(1, wait_for_quit_timeout):
                 if proc.wait(1) is not None:
                     break
@@ -108,13 +195,12 @@ def run_browser(command, timeout=None, on_started=None, **kwargs):
         # ensure early the process is really terminated
         context.kill_process()
 
-    reader.output.append(
+    reader.append(
         "__startBeforeLaunchTimestamp%d__endBeforeLaunchTimestamp"
         % first_time)
-    reader.output.append(
+    reader.append(
         "__startAfterTerminationTimestamp%d__endAfterTerminationTimestamp"
         % (int(time.time()) * 1000))
 
     logging.info("Browser exited with error code: {0}".format(proc.returncode))
-    context.output = reader.output
-    return context
+    context.output = list(reader.output)
@@ -82,6 +82,10 @@ class TsBase(Test):
         'url_timestamp',
         'timeout',
         'cycles',
+        'min_cycles',    # If set, stop after this number of cycles once the
+                         # confidence interval of the results is narrower
+                         # than |ci_width| (relative to their mean).
+        'ci_width',
         'shutdown',      # If True, collect data on shutdown (using the value
                          # provided by __startTimestamp/__endTimestamp).
                          # Otherwise, ignore shutdown data
@@ -233,9 +237,10 @@ class PageloaderTest(Test):
     timeout = None
     keys = ['tpmanifest', 'tpcycles', 'tppagecycles', 'tprender', 'tpchrome',
             'tpmozafterpaint', 'tploadnocache', 'rss', 'mainthread',
-            'resolution', 'cycles', 'sps_profile', 'sps_profile_interval',
-            'sps_profile_entries', 'tptimeout', 'win_counters', 'w7_counters',
-            'linux_counters', 'mac_counters', 'tpscrolltest', 'xperf_counters',
+            'resolution', 'cycles', 'min_cycles', 'ci_width', 'sps_profile',
+            'sps_profile_interval', 'sps_profile_entries', 'tptimeout',
+            'win_counters', 'w7_counters', 'linux_counters', 'mac_counters',
+            'tpscrolltest', 'xperf_counters',
             'timeout', 'shutdown', 'responsiveness', 'profile_path',
             'xperf_providers', 'xperf_user_providers', 'xperf_stackwalk',
             'filters', 'preferences', 'extensions', 'setup', 'cleanup',
@@ -15,6 +15,7 @@
 import os
 import sys
 import platform
+import mainthreadio
 import results
 import subprocess
 import utils
@@ -81,9 +82,13 @@ class TTest(object):
         # add the mainthread_io to the environment variable, as defined
         # in test.py configs
         here = os.path.dirname(os.path.realpath(__file__))
+        mainthread_whitelist = None
         if test_config['mainthread']:
             mainthread_io = os.path.join(here, "mainthread_io.log")
             setup.env['MOZ_MAIN_THREAD_IO_LOG'] = mainthread_io
+            # loaded once, for all the cycles
+            mainthread_whitelist = mainthreadio.load_whitelist(
+                os.path.dirname(browser_config['browser_path']))
 
         test_config['url'] = utils.interpolate(
             test_config['url'],
@@ -114,6 +119,12 @@ class TTest(object):
             test_config,
             global_counters
         )
+        for key in ('cpu_affinity', 'harness_cpus', 'nice', 'sched_policy'):
+            if browser_config.get(key) is not None:
+                test_results.topology[key] = browser_config[key]
+
+        # with min_cycles, stop as soon as the results are stable enough
+        min_cycles = test_config.get('min_cycles')
 
         for i in range(test_config['cycles']):
             logging.info("Running cycle %d/%d for %s test...",
@@ -183,6 +194,13 @@ class TTest(object):
                     # start collecting counters as soon as possible
                     on_started=(counter_management.start
                                 if counter_management else None),
+                    # parse the results while the browser is running
+                    log_scanner=results.BrowserLogResults.make_scanner(),
+                    output_lines=browser_config.get('output_lines'),
+                    output_log=browser_config.get('output_log'),
+                    cpu_affinity=browser_config.get('cpu_affinity'),
+                    nice=browser_config.get('nice'),
+                    sched_policy=browser_config.get('sched_policy'),
                 )
             finally:
                 if counter_management:
@@ -190,26 +208,21 @@ class TTest(object):
                 if mm_httpd:
                     mm_httpd.stop()
 
+            mainthread_io = None
             if test_config['mainthread']:
                 rawlog = os.path.join(here, "mainthread_io.log")
                 if os.path.exists(rawlog):
-                    processedlog = \
-                        os.path.join(here, 'mainthread_io.json')
-                    xre_path = \
-                        os.path.dirname(browser_config['browser_path'])
-                    mtio_py = os.path.join(here, 'mainthreadio.py')
-                    command = ['python', mtio_py, rawlog,
-                               processedlog, xre_path]
-                    mtio = subprocess.Popen(command,
-                                            env=os.environ.copy(),
-                                            stdout=subprocess.PIPE)
-                    output, stderr = mtio.communicate()
-                    for line in output.split('\n'):
-                        if line.strip() == "":
-                            continue
-
+                    # keep the aggregates as an artifact when uploading
+                    processedlog = None
+                    if os.environ.get('MOZ_UPLOAD_DIR'):
+                        processedlog = os.path.join(
+                            os.environ['MOZ_UPLOAD_DIR'],
+                            'mainthread_io.json')
+                    mainthread_io, errors, warnings = mainthreadio.analyze(
+                        rawlog, mainthread_whitelist, processedlog)
+                    for line in errors + warnings:
                         print line
-                        mainthread_error_count += 1
+                    mainthread_error_count += len(errors)
                     mozfile.remove(rawlog)
 
             if test_config['cleanup']:
@@ -240,10 +253,15 @@ class TTest(object):
             # add the results from the browser output
             try:
                 test_results.add(
-                    '\n'.join(pcontext.output),
+                    pcontext.log_scanner,
                     counter_results=(counter_management.results()
                                      if counter_management
-                                     else None))
+                                     else None),
+                    counter_series=(counter_management.time_series()
+                                    if counter_management and
+                                    browser_config.get('counter_series')
+                                    else None),
+                    mainthread_io=mainthread_io)
             except Exception:
                 # Log the exception, but continue. One way to get here
                 # is if the browser hangs, and we'd still like to get
@@ -259,6 +277,14 @@ class TTest(object):
             self.check_for_crashes(browser_config, setup.profile_dir,
                                    test_config['name'])
 
+            if min_cycles:
+                test_results.cycles_run = i + 1
+                if i + 1 >= min_cycles and \
+                        test_results.converged(test_config['ci_width']):
+                    logging.info("Results of %s converged after %d cycles",
+                                 test_config['name'], i + 1)
+                    break
+
         # include global (cross-cycle) counters
         test_results.all_counter_results.extend(
             [{key: value} for key, value in global_counters.items()]
@@ -90,14 +90,28 @@ def tokenize(string, start, end):
     tokenize a string by start + end tokens,
     returns parts and position of last token
     """
+    _start = findall(string, start)
+    _end = findall(string, end)
+    check_token_positions(start, end, _start, _end)
+    if not _start and not _end:
+        return [], -1
+    parts = []
+    for i in range(len(_start)):
+        parts.append(string[_start[i] + len(start):_end[i]])
+    return parts, _end[-1]
+
+
+def check_token_positions(start, end, _start, _end):
+    """
+    ensure that the positions (_start and _end) found for a pair of start +
+    end tokens delimit matching parts; raises AssertionError otherwise
+    """
     assert end not in start, \
         "End token '%s' is contained in start token '%s'" % (end, start)
     assert start not in end, \
         "Start token '%s' is contained in end token '%s'" % (start, end)
-    _start = findall(string, start)
-    _end = findall(string, end)
     if not _start and not _end:
-        return [], -1
+        return
     assert len(_start), "Could not find start token: '%s'" % start
     assert len(_end), "Could not find end token: '%s'" % end
     assert len(_start) == len(_end), \
@@ -106,10 +120,6 @@ def tokenize(string, start, end):
     for i in range(len(_start)):
         assert _end[i] > _start[i], \
             "End token '%s' occurs before start token '%s'" % (end, start)
-    parts = []
-    for i in range(len(_start)):
-        parts.append(string[_start[i] + len(start):_end[i]])
-    return parts, _end[-1]
 
 
 def urlsplit(url, default_scheme='file'):
@@ -172,6 +182,12 @@ def GenerateBrowserCommandLine(browser_path, extra_args, profile_dir,
     return command_args
 
 
+def chrt_command(sched_policy, command):
+    """Prefix command to run it with the given linux scheduling policy"""
+    priority = '1' if sched_policy in ('fifo', 'rr') else '0'
+    return ['chrt', '--%s' % sched_policy, priority] + list(command)
+
+
 def indexed_items(itr):
     """
     Generator that allows us to figure out which item is the last one so
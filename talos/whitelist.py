@@ -7,6 +7,7 @@
 import json
 import os
 import utils
+from xtalos import pathmatcher
 
 KEY_XRE = '{xre}'
 DEFAULT_DURATION = 100.0
@@ -25,6 +26,12 @@ class Whitelist:
         self.paths = paths
         self.path_substitutions = path_substitutions
         self.name_substitutions = name_substitutions
+        self.sanitizer = pathmatcher.PathSanitizer(
+            [(pathmatcher.PREFIX, path, subst)
+             for path, subst in path_substitutions.iteritems()] +
+            [(pathmatcher.SUFFIX, old_name, new_name)
+             for old_name, new_name in name_substitutions.iteritems()],
+            strip='/\\\ \t', on_prefix=self.found_prefix)
 
     def load(self, filename):
         if not self.load_dependent_libs():
@@ -43,38 +50,26 @@ class Whitelist:
         return True
 
     def sanitize_filename(self, filename):
-        filename = filename.lower()
-        filename.replace(' (x86)', '')
-
-        for path, subst in self.path_substitutions.iteritems():
-            parts = filename.split(path)
-            if len(parts) >= 2:
-                if self.PRE_PROFILE == '' and subst == '{profile}':
-                    fname = self.sanitize_filename(parts[0])
-                    self.listmap[fname] = {}
-                    # Windows can have {appdata}\local\temp\longnamedfolder
-                    # or {appdata}\local\temp\longna~1
-                    self.listmap[fname] = {}
-                    if not fname.endswith('~1'):
-                        # parse the longname into longna~1
-                        dirs = fname.split('\\')
-                        dirs[-1] = "%s~1" % (dirs[-1][:6])
-                        # now we want to ensure that every parent dir is
-                        # added since we seem to be accessing them sometimes
-                        diter = 2
-                        while (diter < len(dirs)):
-                            self.listmap['\\'.join(dirs[:diter])] = {}
-                            diter = diter + 1
-                        self.PRE_PROFILE = fname
-
-                filename = "%s%s" % (subst, path.join(parts[1:]))
-
-        for old_name, new_name in self.name_substitutions.iteritems():
-            parts = filename.split(old_name)
-            if len(parts) >= 2:
-                filename = "%s%s" % (parts[0], new_name)
-
-        return filename.strip('/\\\ \t')
+        return self.sanitizer.sanitize(filename)
+
+    def found_prefix(self, subst, prefix):
+        if self.PRE_PROFILE == '' and subst == '{profile}':
+            fname = self.sanitize_filename(prefix)
+            self.listmap[fname] = {}
+            # Windows can have {appdata}\local\temp\longnamedfolder
+            # or {appdata}\local\temp\longna~1
+            self.listmap[fname] = {}
+            if not fname.endswith('~1'):
+                # parse the longname into longna~1
+                dirs = fname.split('\\')
+                dirs[-1] = "%s~1" % (dirs[-1][:6])
+                # now we want to ensure that every parent dir is
+                # added since we seem to be accessing them sometimes
+                diter = 2
+                while (diter < len(dirs)):
+                    self.listmap['\\'.join(dirs[:diter])] = {}
+                    diter = diter + 1
+                self.PRE_PROFILE = fname
 
     def check(self, test, file_name_index):
         errors = {}
@@ -108,9 +103,9 @@ class Whitelist:
 
                 if filename not in errors:
                     errors[filename] = []
-                errors[filename].append("Duration %s > %S"
-                                        % (row_value[file_duration_index]),
-                                        DEFAULT_DURATION)
+                errors[filename].append("Duration %s > %s"
+                                        % (row_value[file_duration_index],
+                                           DEFAULT_DURATION))
         return errors
 
     def filter(self, test, file_name_index):
@@ -134,10 +129,13 @@ class Whitelist:
                                   " expecting it: %r" % (filename, datum))
         return error_strs
 
+    def format_errors(self, error_strs, status="TEST-UNEXPECTED-FAIL"):
+        return ["%s | %s | %s" % (status, self.test_name, error_msg)
+                for error_msg in error_strs]
+
     def print_errors(self, error_strs):
-        for error_msg in error_strs:
-            print "TEST-UNEXPECTED-FAIL | %s | %s" % (self.test_name,
-                                                      error_msg)
+        for error in self.format_errors(error_strs):
+            print error
 
     # Note that we don't store dependent libs in listmap. This makes
     # save_baseline cleaner. Since a baseline whitelist should not include
@@ -5,6 +5,7 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import csv
+import multiprocessing
 import re
 import os
 import sys
@@ -12,6 +13,7 @@ import xtalos
 import subprocess
 import json
 import mozfile
+import pathmatcher
 
 
 EVENTNAME_INDEX = 0
@@ -33,106 +35,32 @@ net_events = {
     "TcpDataTransferSend": "send",
     "UdpEndpointSendMessages": "send"
 }
-gThreads = {}
-gConnectionIDs = {}
-gHeaders = {}
-
-
-def filterOutHeader(data):
-    # -1 means we have not yet found the header
-    # 0 means we are in the header
-    # 1+ means that we are past the header
-    state = -1
-    for row in data:
-
-        if not len(row):
-            continue
-
-        if state < 0:
-            # Keep looking for the header (denoted by "BeginHeader").
-            if row[0] == "BeginHeader":
-                state = 0
-            continue
-
-        if state == 0:
-            # Eventually, we'll find the end (denoted by "EndHeader").
-            if row[0] == "EndHeader":
-                state = 1
-                continue
-
-            gHeaders[row[EVENTNAME_INDEX]] = row
-            continue
-
-        if state >= 1:
-            state = state + 1
-
-        # The line after "EndHeader" is also not useful, so we want to strip
-        # that in addition to the header.
-        if state > 2:
-            yield row
-
-
-def getIndex(eventType, colName):
-    if colName not in gHeaders[eventType]:
-        return None
-    return gHeaders[eventType].index(colName)
-
-
-def readFile(filename):
-    print "etlparser: in readfile: %s" % filename
-    data = csv.reader(open(filename, 'rb'), delimiter=',', quotechar='"',
-                      skipinitialspace=True)
-    data = filterOutHeader(data)
-    return data
-
-
-def fileSummary(row, stage, retVal):
-    event = row[EVENTNAME_INDEX]
-
-    # TODO: do we care about the other events?
-    if event not in ("FileIoRead", "FileIoWrite"):
-        return
-    fname_index = getIndex(event, FNAME_COL)
-
-    # We only care about events that have a file name.
-    if fname_index is None:
-        return
+THREAD_EVENTS = ("T-DCStart", "T-Start", "T-DCEnd", "T-End")
+FILEIO_EVENTS = ("FileIoRead", "FileIoWrite")
+# Size of the pieces of the csv file parsed in parallel
+CHUNK_SIZE = 32 * 1024 * 1024
+# Rewrites file names to their form in xperf_whitelist.json
+FILENAME_SANITIZER = pathmatcher.PathSanitizer(
+    # take care of 'program files (x86)' matching 'program files'
+    replace=[(" (x86)", '')],
+    rules=[(pathmatcher.PREFIX, '%s\\' % path, '{%s}\\' % path)
+           for path in ('profile', 'firefox', 'desktop', 'talos')] + [
+        (pathmatcher.SUFFIX, '\\installtime', '\\{time}'),
+        # NOTE: this is Prefetch or prefetch, not case sensitive operating
+        # system
+        (pathmatcher.SUFFIX, 'refetch', 'refetch\\{prefetch}.pf')])
 
-    # Some data rows are missing the filename?
-    if len(row) <= fname_index:
-        return
 
-    thread_extra = ""
-    if gThreads[row[THREAD_ID_INDEX]] == "main":
-        thread_extra = " (main)"
-    key_tuple = (row[fname_index],
-                 "%s%s" % (row[THREAD_ID_INDEX], thread_extra),
-                 stages[stage])
-    total_tuple = (row[fname_index],
-                   "%s%s" % (row[THREAD_ID_INDEX], thread_extra),
-                   "all")
-
-    if key_tuple not in retVal:
-        retVal[key_tuple] = {
-            "DiskReadBytes": 0,
-            "DiskReadCount": 0,
-            "DiskWriteBytes": 0,
-            "DiskWriteCount": 0
-        }
-        retVal[total_tuple] = retVal[key_tuple]
-
-    if event == "FileIoRead":
-        retVal[key_tuple]['DiskReadCount'] += 1
-        retVal[total_tuple]['DiskReadCount'] += 1
-        idx = getIndex(event, DISKBYTES_COL)
-        retVal[key_tuple]['DiskReadBytes'] += int(row[idx], 16)
-        retVal[total_tuple]['DiskReadBytes'] += int(row[idx], 16)
-    elif event == "FileIoWrite":
-        retVal[key_tuple]['DiskWriteCount'] += 1
-        retVal[total_tuple]['DiskWriteCount'] += 1
-        idx = getIndex(event, DISKBYTES_COL)
-        retVal[key_tuple]['DiskWriteBytes'] += int(row[idx], 16)
-        retVal[total_tuple]['DiskWriteBytes'] += int(row[idx], 16)
+def mergeEtl(xperf_path, etl_filename, debug=False):
+    """Merge the user and kernel sessions into etl_filename."""
+    xperf_cmd = [xperf_path,
+                 '-merge',
+                 '%s.user' % etl_filename,
+                 '%s.kernel' % etl_filename,
+                 etl_filename]
+    if debug:
+        print "executing '%s'" % subprocess.list2cmdline(xperf_cmd)
+    subprocess.call(xperf_cmd)
 
 
 def etl2csv(xperf_path, etl_filename, debug=False):
@@ -144,14 +72,7 @@ def etl2csv(xperf_path, etl_filename, debug=False):
     (large files == high memory + cpu)
     """
 
-    xperf_cmd = [xperf_path,
-                 '-merge',
-                 '%s.user' % etl_filename,
-                 '%s.kernel' % etl_filename,
-                 etl_filename]
-    if debug:
-        print "executing '%s'" % subprocess.list2cmdline(xperf_cmd)
-    subprocess.call(xperf_cmd)
+    mergeEtl(xperf_path, etl_filename, debug=debug)
 
     csv_filename = '%s.csv' % etl_filename
     xperf_cmd = [xperf_path,
@@ -163,63 +84,362 @@ def etl2csv(xperf_path, etl_filename, debug=False):
     return csv_filename
 
 
-def trackThread(row, firefoxPID):
-    event, proc, tid = \
-        row[EVENTNAME_INDEX], row[PROCESS_INDEX], row[THREAD_ID_INDEX]
-    if event in ["T-DCStart", "T-Start"]:
-        procName, procID = re.search("^(.*) \(\s*(\d+)\)$", proc).group(1, 2)
-        if procID == str(firefoxPID):
-            imgIdx = getIndex(event, IMAGEFUNC_COL)
-            img = re.match("([^!]+)!", row[imgIdx]).group(1)
-            if img == procName:
-                gThreads[tid] = "main"
+def etl2stream(xperf_path, etl_filename, debug=False):
+    """
+    Like etl2csv, but return the xperf process writing the .csv
+    representation of etl_filename to its stdout, so it can be parsed as
+    it is produced instead of going through a temp file.
+    """
+
+    mergeEtl(xperf_path, etl_filename, debug=debug)
+
+    # without -o, xperf writes to stdout
+    xperf_cmd = [xperf_path, '-i', etl_filename]
+    if debug:
+        print "executing '%s'" % subprocess.list2cmdline(xperf_cmd)
+    return subprocess.Popen(xperf_cmd, stdout=subprocess.PIPE)
+
+
+def csvReader(lines):
+    return csv.reader(lines, delimiter=',', quotechar='"',
+                      skipinitialspace=True)
+
+
+def findChunks(f, start, chunkSize):
+    """Split f from start into (start, end) ranges of whole lines."""
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    chunks = []
+    while start < size:
+        f.seek(min(start + chunkSize, size))
+        f.readline()
+        end = min(f.tell(), size)
+        chunks.append((start, end))
+        start = end
+    return chunks
+
+
+def readLines(f, start, end):
+    f.seek(start)
+    offset = start
+    while offset < end:
+        line = f.readline()
+        if not line:
+            break
+        offset += len(line)
+        yield line
+
+
+def isSequentialEvent(line):
+    """
+    Whether the row of line has to be parsed in order: thread lifetime,
+    stage and network events, which are few.
+    """
+    event = line.split(',', 1)[0].strip().strip('"')
+    return event in THREAD_EVENTS or event.endswith("Event/Classic") or \
+        event.startswith("Microsoft-Windows-TCPIP")
+
+
+class ETLParser(object):
+    """
+    Aggregates the file and network IO of the threads of a process from
+    the csv exported by xperf.
+
+    All the state of a parse is kept here, so several ones can run in the
+    same process.
+    """
+
+    def __init__(self, firefoxPID):
+        self.firefoxPID = str(firefoxPID)
+        # thread id -> "main" or "nonmain", for the live threads
+        self.threads = {}
+        # connection id -> thread id of its first event
+        self.connectionIDs = {}
+        # event -> header row, and column name -> index
+        self.headers = {}
+        self.columns = {}
+        self.stage = 0
+        # (filename, thread, stage) -> counters, see fileSummary
+        self.files = {}
+        # (thread, stage, counter) -> value
+        self.io = {}
+
+    def addHeader(self, row):
+        event = row[EVENTNAME_INDEX]
+        self.headers[event] = row
+        columns = {}
+        for index, colName in enumerate(row):
+            columns.setdefault(colName, index)
+        self.columns[event] = columns
+
+    def getIndex(self, eventType, colName):
+        return self.columns[eventType].get(colName)
+
+    def filterOutHeader(self, data):
+        # -1 means we have not yet found the header
+        # 0 means we are in the header
+        # 1+ means that we are past the header
+        state = -1
+        for row in data:
+
+            if not len(row):
+                continue
+
+            if state < 0:
+                # Keep looking for the header (denoted by "BeginHeader").
+                if row[0] == "BeginHeader":
+                    state = 0
+                continue
+
+            if state == 0:
+                # Eventually, we'll find the end (denoted by "EndHeader").
+                if row[0] == "EndHeader":
+                    state = 1
+                    continue
+
+                self.addHeader(row)
+                continue
+
+            if state >= 1:
+                state = state + 1
+
+            # The line after "EndHeader" is also not useful, so we want to
+            # strip that in addition to the header.
+            if state > 2:
+                yield row
+
+    def readFile(self, filename):
+        print "etlparser: in readfile: %s" % filename
+        data = csvReader(open(filename, 'rb'))
+        return self.filterOutHeader(data)
+
+    def parseStream(self, f):
+        """
+        Parse the csv exported by xperf from f, any iterable of lines such
+        as a pipe, in a single pass.
+        """
+        self.parseRows(self.filterOutHeader(csvReader(f)))
+
+    def readHeader(self, f):
+        """
+        Read the header of the csv file f. Returns the offset of the first
+        data row, as filterOutHeader does.
+        """
+        state = -1
+        while state < 2:
+            line = f.readline()
+            if not line:
+                break
+            row = next(csvReader([line]), None)
+            if not row:
+                continue
+            if state < 0:
+                if row[0] == "BeginHeader":
+                    state = 0
+            elif state == 0:
+                if row[0] == "EndHeader":
+                    state = 1
+                else:
+                    self.addHeader(row)
             else:
-                gThreads[tid] = "nonmain"
-    elif event in ["T-DCEnd", "T-End"] and tid in gThreads:
-        del gThreads[tid]
-
-
-def trackThreadFileIO(row, io, stage):
-    event, tid = row[EVENTNAME_INDEX], row[THREAD_ID_INDEX]
-    opType = {"FileIoWrite": "write", "FileIoRead": "read"}[event]
-    th, stg = gThreads[tid], stages[stage]
-    sizeIdx = getIndex(event, DISKBYTES_COL)
-    bytes = int(row[sizeIdx], 16)
-    io[(th, stg, "file_%s_ops" % opType)] = \
-        io.get((th, stg, "file_%s_ops" % opType), 0) + 1
-    io[(th, stg, "file_%s_bytes" % opType)] = \
-        io.get((th, stg, "file_%s_bytes" % opType), 0) + bytes
-    io[(th, stg, "file_io_bytes")] = \
-        io.get((th, stg, "file_io_bytes"), 0) + bytes
-
-
-def trackThreadNetIO(row, io, stage):
-    event, tid = row[EVENTNAME_INDEX], row[THREAD_ID_INDEX]
-    connIdIdx = getIndex(event, ACTIVITY_ID_COL)
-    connID = row[connIdIdx]
-    if connID not in gConnectionIDs:
-        gConnectionIDs[connID] = tid
-    origThread = gConnectionIDs[connID]
-    if origThread in gThreads:
-        netEvt = re.match("[\w-]+\/([\w-]+)", event).group(1)
-        if netEvt in net_events:
-            opType = net_events[netEvt]
-            th, stg = gThreads[origThread], stages[stage]
-            lenIdx = getIndex(event, NUMBYTES_COL)
-            bytes = int(row[lenIdx])
-            io[(th, stg, "net_%s_bytes" % opType)] = \
-                io.get((th, stg, "net_%s_bytes" % opType), 0) + bytes
-            io[(th, stg, "net_io_bytes")] = \
-                io.get((th, stg, "net_io_bytes"), 0) + bytes
-
-
-def updateStage(row, stage):
-    guidIdx = getIndex(row[EVENTNAME_INDEX], EVENTGUID_COL)
-    if row[guidIdx] == CEVT_WINDOWS_RESTORED and stage == 0:
-        stage = 1
-    elif row[guidIdx] == CEVT_XPCOM_SHUTDOWN and stage == 1:
-        stage = 2
-    return stage
+                state += 1
+        return f.tell()
+
+    def fileSummary(self, row):
+        event = row[EVENTNAME_INDEX]
+
+        # TODO: do we care about the other events?
+        if event not in FILEIO_EVENTS:
+            return
+        fname_index = self.getIndex(event, FNAME_COL)
+
+        # We only care about events that have a file name.
+        if fname_index is None:
+            return
+
+        # Some data rows are missing the filename?
+        if len(row) <= fname_index:
+            return
+
+        retVal = self.files
+        thread_extra = ""
+        if self.threads[row[THREAD_ID_INDEX]] == "main":
+            thread_extra = " (main)"
+        key_tuple = (row[fname_index],
+                     "%s%s" % (row[THREAD_ID_INDEX], thread_extra),
+                     stages[self.stage])
+        total_tuple = (row[fname_index],
+                       "%s%s" % (row[THREAD_ID_INDEX], thread_extra),
+                       "all")
+
+        if key_tuple not in retVal:
+            retVal[key_tuple] = {
+                "DiskReadBytes": 0,
+                "DiskReadCount": 0,
+                "DiskWriteBytes": 0,
+                "DiskWriteCount": 0
+            }
+            retVal[total_tuple] = retVal[key_tuple]
+
+        idx = self.getIndex(event, DISKBYTES_COL)
+        if event == "FileIoRead":
+            retVal[key_tuple]['DiskReadCount'] += 1
+            retVal[total_tuple]['DiskReadCount'] += 1
+            retVal[key_tuple]['DiskReadBytes'] += int(row[idx], 16)
+            retVal[total_tuple]['DiskReadBytes'] += int(row[idx], 16)
+        elif event == "FileIoWrite":
+            retVal[key_tuple]['DiskWriteCount'] += 1
+            retVal[total_tuple]['DiskWriteCount'] += 1
+            retVal[key_tuple]['DiskWriteBytes'] += int(row[idx], 16)
+            retVal[total_tuple]['DiskWriteBytes'] += int(row[idx], 16)
+
+    def trackThread(self, row):
+        event, proc, tid = \
+            row[EVENTNAME_INDEX], row[PROCESS_INDEX], row[THREAD_ID_INDEX]
+        if event in ["T-DCStart", "T-Start"]:
+            procName, procID = \
+                re.search("^(.*) \(\s*(\d+)\)$", proc).group(1, 2)
+            if procID == self.firefoxPID:
+                imgIdx = self.getIndex(event, IMAGEFUNC_COL)
+                img = re.match("([^!]+)!", row[imgIdx]).group(1)
+                if img == procName:
+                    self.threads[tid] = "main"
+                else:
+                    self.threads[tid] = "nonmain"
+        elif event in ["T-DCEnd", "T-End"] and tid in self.threads:
+            del self.threads[tid]
+
+    def trackThreadFileIO(self, row):
+        io = self.io
+        event, tid = row[EVENTNAME_INDEX], row[THREAD_ID_INDEX]
+        opType = {"FileIoWrite": "write", "FileIoRead": "read"}[event]
+        th, stg = self.threads[tid], stages[self.stage]
+        sizeIdx = self.getIndex(event, DISKBYTES_COL)
+        bytes = int(row[sizeIdx], 16)
+        io[(th, stg, "file_%s_ops" % opType)] = \
+            io.get((th, stg, "file_%s_ops" % opType), 0) + 1
+        io[(th, stg, "file_%s_bytes" % opType)] = \
+            io.get((th, stg, "file_%s_bytes" % opType), 0) + bytes
+        io[(th, stg, "file_io_bytes")] = \
+            io.get((th, stg, "file_io_bytes"), 0) + bytes
+
+    def trackThreadNetIO(self, row):
+        io = self.io
+        event, tid = row[EVENTNAME_INDEX], row[THREAD_ID_INDEX]
+        connIdIdx = self.getIndex(event, ACTIVITY_ID_COL)
+        connID = row[connIdIdx]
+        if connID not in self.connectionIDs:
+            self.connectionIDs[connID] = tid
+        origThread = self.connectionIDs[connID]
+        if origThread in self.threads:
+            netEvt = re.match("[\w-]+\/([\w-]+)", event).group(1)
+            if netEvt in net_events:
+                opType = net_events[netEvt]
+                th, stg = self.threads[origThread], stages[self.stage]
+                lenIdx = self.getIndex(event, NUMBYTES_COL)
+                bytes = int(row[lenIdx])
+                io[(th, stg, "net_%s_bytes" % opType)] = \
+                    io.get((th, stg, "net_%s_bytes" % opType), 0) + bytes
+                io[(th, stg, "net_io_bytes")] = \
+                    io.get((th, stg, "net_io_bytes"), 0) + bytes
+
+    def updateStage(self, row):
+        guidIdx = self.getIndex(row[EVENTNAME_INDEX], EVENTGUID_COL)
+        if row[guidIdx] == CEVT_WINDOWS_RESTORED and self.stage == 0:
+            self.stage = 1
+        elif row[guidIdx] == CEVT_XPCOM_SHUTDOWN and self.stage == 1:
+            self.stage = 2
+
+    def parseRows(self, rows, netIO=True):
+        """Aggregate rows into files and io."""
+        threads = self.threads
+        for row in rows:
+            event = row[EVENTNAME_INDEX]
+            if event in THREAD_EVENTS:
+                self.trackThread(row)
+            elif event in FILEIO_EVENTS and row[THREAD_ID_INDEX] in threads:
+                self.fileSummary(row)
+                self.trackThreadFileIO(row)
+            elif event.endswith("Event/Classic") and \
+                    row[THREAD_ID_INDEX] in threads:
+                self.updateStage(row)
+            elif netIO and event.startswith("Microsoft-Windows-TCPIP"):
+                self.trackThreadNetIO(row)
+
+    def prescanFile(self, f, chunks):
+        """
+        Sequential pass over the thread lifetime, stage and network events
+        of f, aggregating the network IO. Returns the (threads, stage)
+        state at the start of each chunk.
+        """
+        states = []
+        for start, end in chunks:
+            states.append((dict(self.threads), self.stage))
+            self.parseRows(csvReader(line
+                                     for line in readLines(f, start, end)
+                                     if isSequentialEvent(line)))
+        return states
+
+    def merge(self, results):
+        """Sum the (files, io) aggregates of chunks into ours."""
+        files, io = self.files, self.io
+        for chunkFiles, chunkIO in results:
+            for key, counts in chunkFiles.iteritems():
+                if key[2] == "all":
+                    continue
+                if key not in files:
+                    files[key] = dict.fromkeys(counts, 0)
+                for counter, value in counts.iteritems():
+                    files[key][counter] += value
+            for key, value in chunkIO.iteritems():
+                io[key] = io.get(key, 0) + value
+        # as fileSummary does, the totals of a file and thread are those of
+        # the last stage it was accessed in
+        for key in sorted(files, key=lambda key: stages.index(key[2])):
+            files[(key[0], key[1], "all")] = files[key]
+
+    def parseFile(self, filename, jobs=1, chunkSize=CHUNK_SIZE):
+        """
+        Parse the csv file exported by xperf.
+
+        With several jobs, the file is split into chunks parsed by as many
+        worker processes. A sequential pre-pass tracks the thread lifetimes
+        and stages, which the file IO of each chunk depends on.
+        """
+        if jobs <= 1 or os.path.getsize(filename) <= chunkSize:
+            self.parseRows(self.readFile(filename))
+            return
+
+        print "etlparser: in parseFile: %s" % filename
+        with open(filename, 'rb') as f:
+            chunks = findChunks(f, self.readHeader(f), chunkSize)
+            states = self.prescanFile(f, chunks)
+        headers = self.headers.values()
+        pool = multiprocessing.Pool(min(jobs, len(chunks)))
+        try:
+            self.merge(pool.imap(parseChunk, [
+                (filename, start, end, headers, threads, stage,
+                 self.firefoxPID)
+                for (start, end), (threads, stage) in zip(chunks, states)]))
+        finally:
+            pool.terminate()
+
+
+def parseChunk(args):
+    """
+    Parse the file IO of a chunk of a csv file, from the state the
+    pre-pass found at its start. Returns the (files, io) aggregates of the
+    chunk.
+    """
+    filename, start, end, headers, threads, stage, firefoxPID = args
+    parser = ETLParser(firefoxPID)
+    for row in headers:
+        parser.addHeader(row)
+    parser.threads.update(threads)
+    parser.stage = stage
+    with open(filename, 'rb') as f:
+        parser.parseRows(csvReader(readLines(f, start, end)), netIO=False)
+    return parser.files, parser.io
 
 
 def loadWhitelist(filename):
@@ -231,40 +451,34 @@ def loadWhitelist(filename):
     lines = file(filename).readlines()
     # Expand paths
     lines = [os.path.expandvars(elem.strip()) for elem in lines]
-    files = set()
-    dirs = set()
-    recur = set()
+    whitelist = pathmatcher.PathMatcher()
     for line in lines:
         if line.startswith("#"):
             continue
         elif line.endswith("\\*\\*"):
-            recur.add(line[:-4])
+            whitelist.add(line[:-4], pathmatcher.RECURSIVE)
         elif line.endswith("\\*"):
-            dirs.add(line[:-2])
+            whitelist.add(line[:-2], pathmatcher.DIR)
         else:
-            files.add(line)
-    return (files, dirs, recur)
+            whitelist.add(line)
+    return whitelist
 
 
 def checkWhitelist(filename, whitelist):
     if not whitelist:
         return False
-    if filename in whitelist[0]:
-        return True
-    if os.path.dirname(filename) in whitelist[1]:
-        return True
-    head = filename
-    while len(head) > 3:  # Length 3 implies root directory, e.g. C:\
-        head, tail = os.path.split(head)
-        if head in whitelist[2]:
-            return True
-    return False
+    return whitelist.match(filename)
 
 
 def etlparser(xperf_path, etl_filename, processID, approot=None,
               configFile=None, outputFile=None, whitelist_file=None,
               error_filename=None, all_stages=False, all_threads=False,
-              debug=False):
+              debug=False, jobs=None, stream=False, dump=None):
+    """
+    Parse etl_filename, converted to csv by xperf. With stream, the csv is
+    parsed as xperf produces it. dump is a file of a csv already produced
+    by xperf, e.g. a recorded one, to parse instead.
+    """
 
     # setup output file
     if outputFile:
@@ -272,29 +486,33 @@ def etlparser(xperf_path, etl_filename, processID, approot=None,
     else:
         outFile = sys.stdout
 
-    files = {}
-    io = {}
-    stage = 0
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+
+    parser = ETLParser(processID)
+    if dump is not None:
+        parser.parseStream(dump)
+    elif stream:
+        print "streaming etl filename: %s" % etl_filename
+        xperf = etl2stream(xperf_path, etl_filename, debug=debug)
+        try:
+            parser.parseStream(xperf.stdout)
+        finally:
+            xperf.stdout.close()
+            status = xperf.wait()
+        # the output of a failed xperf would look like a short valid run
+        if status:
+            raise xtalos.XTalosError("xperf failed to convert %s, exit code"
+                                     " %d" % (etl_filename, status))
+    else:
+        print "reading etl filename: %s" % etl_filename
+        csvname = etl2csv(xperf_path, etl_filename, debug=debug)
+        parser.parseFile(csvname, jobs)
 
-    print "reading etl filename: %s" % etl_filename
-    csvname = etl2csv(xperf_path, etl_filename, debug=debug)
-    for row in readFile(csvname):
-        event = row[EVENTNAME_INDEX]
-        if event in ["T-DCStart", "T-Start", "T-DCEnd", "T-End"]:
-            trackThread(row, processID)
-        elif event in ["FileIoRead", "FileIoWrite"] and \
-                row[THREAD_ID_INDEX] in gThreads:
-            fileSummary(row, stage, files)
-            trackThreadFileIO(row, io, stage)
-        elif event.endswith("Event/Classic") and \
-                row[THREAD_ID_INDEX] in gThreads:
-            stage = updateStage(row, stage)
-        elif event.startswith("Microsoft-Windows-TCPIP"):
-            trackThreadNetIO(row, io, stage)
-
-    # remove the csv file
-    if not debug:
-        mozfile.remove(csvname)
+        # remove the csv file
+        if not debug:
+            mozfile.remove(csvname)
+    files, io = parser.files, parser.io
 
     output = "thread, stage, counter, value\n"
     for cntr in sorted(io.iterkeys()):
@@ -373,27 +591,7 @@ def etlparser(xperf_path, etl_filename, processID, approot=None,
 
     errors = []
     for row in filekeys:
-        filename = row[0]
-        filename = filename.lower()
-        # take care of 'program files (x86)' matching 'program files'
-        filename = filename.replace(" (x86)", '')
-
-        paths = ['profile', 'firefox', 'desktop', 'talos']
-        for path in paths:
-            pathname = '%s\\' % path
-            parts = filename.split(pathname)
-            if len(parts) >= 2:
-                filename = "{%s}\\%s" % (path, pathname.join(parts[1:]))
-
-        parts = filename.split('\\installtime')
-        if len(parts) >= 2:
-            filename = "%s\\{time}" % parts[0]
-
-        # NOTE: this is Prefetch or prefetch, not case sensitive operating
-        # system
-        parts = filename.split('refetch')
-        if len(parts) >= 2:
-            filename = "%srefetch\\{prefetch}.pf" % parts[0]
+        filename = FILENAME_SANITIZER.sanitize(row[0])
 
         if filename in wl:
             if 'ignore' in wl[filename] and wl[filename]['ignore']:
@@ -473,7 +671,9 @@ def etlparser_from_config(config_file, **kwargs):
             'whitelist_file': None,
             'error_filename': None,
             'all_stages': False,
-            'all_threads': False
+            'all_threads': False,
+            'jobs': None,
+            'stream': False
             }
     args.update(kwargs)
 
@@ -511,7 +711,8 @@ def main(args=sys.argv[1:]):
     etlparser(args.xperf_path, args.etl_filename, args.processID, args.approot,
               args.configFile, args.outputFile, args.whitelist_file,
               args.error_filename, args.all_stages, args.all_threads,
-              debug=args.debug_level >= xtalos.DEBUG_INFO)
+              debug=args.debug_level >= xtalos.DEBUG_INFO, jobs=args.jobs,
+              stream=args.stream)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,106 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+Matching of the file names found in IO logs against whitelists.
+
+PathMatcher is a prefix tree of the path components of whitelisted files,
+directories and directory trees, so a path is checked in a single walk
+down its components. PathSanitizer rewrites paths to their whitelisted
+form (e.g. {profile}\\prefs.js) with substitution rules compiled once,
+remembering the paths it already rewrote.
+"""
+
+import re
+
+# Kinds of whitelist entries
+EXACT = 1  # the path itself
+DIR = 2  # the files of a directory
+RECURSIVE = 4  # the files of a directory and of its subdirectories
+
+# Kinds of substitution rules
+PREFIX = 'prefix'  # replace the path up to the end of the token
+SUFFIX = 'suffix'  # replace the path from the start of the token
+
+SEPARATOR_RE = re.compile(r'[\\/]+')
+# key of the kinds of entry ending at a node
+_KINDS = None
+
+
+def split_path(path):
+    return [part for part in SEPARATOR_RE.split(path) if part]
+
+
+class PathMatcher(object):
+
+    def __init__(self):
+        self.root = {}
+
+    def add(self, path, kind=EXACT):
+        node = self.root
+        for part in split_path(path):
+            node = node.setdefault(part, {})
+        node[_KINDS] = node.get(_KINDS, 0) | kind
+
+    def match(self, path):
+        """Whether path is whitelisted."""
+        node = self.root
+        parts = split_path(path)
+        last = len(parts) - 1
+        for index, part in enumerate(parts):
+            node = node.get(part)
+            if node is None:
+                return False
+            kinds = node.get(_KINDS, 0)
+            if not kinds:
+                continue
+            if index == last:
+                return bool(kinds & EXACT)
+            if kinds & RECURSIVE or kinds & DIR and index == last - 1:
+                return True
+        return False
+
+
+class PathSanitizer(object):
+    """
+    Rewrites paths with rules, lists of (PREFIX or SUFFIX, token,
+    replacement) applied in order at the first occurrence of their token.
+    Paths are lower cased and the replace list of (old, new) pairs applied
+    first, strip characters are stripped last.
+
+    on_prefix, if given, is called with the replacement and the replaced
+    part of the path when a PREFIX rule applies.
+    """
+
+    def __init__(self, rules, replace=(), strip=None, on_prefix=None):
+        self.rules = list(rules)
+        self.replace = list(replace)
+        self.strip = strip
+        self.on_prefix = on_prefix
+        self.cache = {}
+
+    def sanitize(self, path):
+        try:
+            return self.cache[path]
+        except KeyError:
+            sanitized = self.cache[path] = self.apply(path)
+            return sanitized
+
+    def apply(self, path):
+        path = path.lower()
+        for old, new in self.replace:
+            path = path.replace(old, new)
+        for kind, token, replacement in self.rules:
+            index = path.find(token)
+            if index < 0:
+                continue
+            if kind == PREFIX:
+                if self.on_prefix:
+                    self.on_prefix(replacement, path[:index])
+                path = replacement + path[index + len(token):]
+            else:
+                path = path[:index] + replacement
+        if self.strip is not None:
+            path = path.strip(self.strip)
+        return path
@@ -109,6 +109,17 @@ class XtalosOptions(argparse.ArgumentParser):
                                " while runnning the test")
         defaults["error_filename"] = None
 
+        self.add_argument("-j", "--jobs", dest="jobs", type=int,
+                          help="Number of processes parsing the xperf"
+                               " output, defaults to the number of CPUs")
+        defaults["jobs"] = None
+
+        self.add_argument("--stream", dest="stream", action="store_true",
+                          help="Parse the xperf output as it is produced,"
+                               " without writing it to a temporary csv"
+                               " file")
+        defaults["stream"] = False
+
         self.set_defaults(**defaults)
 
     def verifyOptions(self, options):
@@ -139,6 +139,65 @@ __startAfterTerminationTimestamp1333663596551__endAfterTerminationTimestamp
 
         self.compare_error_message(bad_report, "Multiple matches for %s,%s" % (self.start_report(), self.end_report()))
 
+    def test_counter_lines(self):
+        """RSS and responsiveness lines are gathered with the report"""
+
+        report = """__start_report392__end_report
+RSS: Main: 12345
+RSS: Content: 678
+MOZ_EVENT_TRACE sample 1333663595953 26.5
+__startTimestamp1333663595953__endTimestamp
+__startBeforeLaunchTimestamp1333663595557__endBeforeLaunchTimestamp
+__startAfterTerminationTimestamp1333663596551__endAfterTerminationTimestamp
+"""
+        counter_results = {'Main_RSS': []}
+        global_counters = {'responsiveness': []}
+        BrowserLogResults(results_raw=report,
+                          counter_results=counter_results,
+                          global_counters=global_counters)
+        self.assertEqual(counter_results['Main_RSS'], ['12345'])
+        self.assertEqual(global_counters['responsiveness'], ['26.5'])
+
+    def test_fail_block(self):
+        """the first __FAIL block is the error message"""
+
+        report = self.start_report() + "392" + self.end_report() + \
+            "__FAILbroken test__FAIL"
+        self.compare_error_message(report, "broken test")
+
+    def test_incremental_parsing(self):
+        """feeding the log line by line gives the same results"""
+
+        report = """__start_tp_report_x_x_mozilla_page_load
+|0;gearflowers.svg;74;65;68;66;62
+__end_tp_report
+RSS: Main: 12345
+__startTimestamp1333663595953__endTimestamp
+__startBeforeLaunchTimestamp1333663595557__endBeforeLaunchTimestamp
+__startAfterTerminationTimestamp1333663596551__endAfterTerminationTimestamp
+"""
+        scanner = BrowserLogResults.make_scanner()
+        for line in report.splitlines():
+            scanner.feed(line + '\n')
+        self.assertFalse(scanner.failed)
+
+        counter_results = {'Main_RSS': []}
+        streamed = BrowserLogResults(scanner, counter_results=counter_results)
+        parsed = BrowserLogResults(report)
+        self.assertEqual(streamed.format, 'tpformat')
+        self.assertEqual(streamed.browser_results, parsed.browser_results)
+        self.assertEqual(streamed.startTime, parsed.startTime)
+        self.assertEqual(streamed.endTime, parsed.endTime)
+        self.assertEqual(counter_results['Main_RSS'], ['12345'])
+
+        # a failure is noticed as soon as its block is complete
+        scanner = BrowserLogResults.make_scanner()
+        scanner.feed('__FAILbroken\n')
+        self.assertFalse(scanner.failed)
+        scanner.feed('test__FAIL\n')
+        self.assertTrue(scanner.failed)
+        self.assertEqual(scanner.fail_message, 'broken\ntest')
+
     def start_report(self):
         """return a start report token"""
         return BrowserLogResults.report_tokens[0][1][0] # start token
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+"""
+test the counter collection of talos.cmanager
+"""
+
+import time
+import unittest
+
+from talos import cmanager
+
+
+class FakeCounterManager(cmanager.CounterManager):
+
+    def __init__(self, process, counters=None):
+        cmanager.CounterManager.__init__(self)
+        self.registeredCounters = dict((counter, [None, []])
+                                       for counter in counters)
+        self.count = 0
+
+    def getCounterValues(self):
+        self.count += 1
+        return {'RSS': self.count % 2 * 100}
+
+    def getPidCounterValues(self):
+        return {1: {'RSS': 60}, 2: {'RSS': 40}}
+
+
+class TestCounterManagement(unittest.TestCase):
+
+    def setUp(self):
+        self.manager_class = cmanager.DefaultCounterManager
+        cmanager.DefaultCounterManager = FakeCounterManager
+
+    def tearDown(self):
+        cmanager.DefaultCounterManager = self.manager_class
+
+    def test_time_series(self):
+        management = cmanager.CounterManagement('firefox', ['RSS'], 0.01)
+        management.start()
+        time.sleep(0.2)
+        management.stop()
+
+        series = management.time_series()['RSS']
+        timestamps, values = series['timestamps'], series['values']
+        self.assertTrue(len(values) > 2)
+        self.assertEqual(len(timestamps), len(values))
+        self.assertEqual(timestamps, sorted(timestamps))
+        # unlike the results, the series keep the zero values
+        self.assertEqual(values[:2], [100., 0.])
+        self.assertEqual(management.results()['RSS'],
+                         [100] * ((len(values) + 1) / 2))
+
+        self.assertEqual(sorted(series['pids']), [1, 2])
+        self.assertEqual(series['pids'][1]['timestamps'], timestamps)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+
+"""
+test the /proc sampler of talos.cmanager_linux
+"""
+
+import os
+import sys
+import unittest
+
+if sys.platform.startswith('linux'):
+    import talos.cmanager  # noqa, resolves the cmanager_linux import cycle
+    from talos import cmanager_linux
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), 'linux only')
+class TestStatmSampler(unittest.TestCase):
+
+    def test_sample(self):
+        """the sampler agrees with the /proc/<pid>/status and maps parsers"""
+        pids = [os.getpid()]
+        sampler = cmanager_linux.StatmSampler()
+        try:
+            resident, private = sampler.sample(pids)
+            # allow for the memory used between two reads
+            self.assertAlmostEqual(resident,
+                                   cmanager_linux.GetResidentSize(pids),
+                                   delta=1 << 20)
+            if cmanager_linux.STATM_PRIVATE_BYTES:
+                self.assertAlmostEqual(private,
+                                       cmanager_linux.GetPrivateBytes(pids),
+                                       delta=1 << 20)
+            # the file is kept open and read again
+            sampler.sample(pids)
+            self.assertEqual(sampler._fds.keys(), pids)
+        finally:
+            sampler.forget()
+        self.assertEqual(sampler._fds, {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+"""
+test the xperf csv parsing of talos.xtalos.etlparser
+"""
+
+import cStringIO
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from talos.xtalos import etlparser
+from talos.xtalos import xtalos
+
+PID = 1234
+HEADER = """BeginHeader
+T-DCStart, TimeStamp, Process Name ( PID), ThreadID, Image!Function
+T-End, TimeStamp, Process Name ( PID), ThreadID, Image!Function
+FileIoRead, TimeStamp, Process Name ( PID), ThreadID, Size, FileName
+FileIoWrite, TimeStamp, Process Name ( PID), ThreadID, Size, FileName
+Mozilla/Event/Classic, TimeStamp, Process Name ( PID), ThreadID, EventGuid
+Microsoft-Windows-TCPIP/TcpDataTransferSend, TimeStamp, Process Name ( PID),\
+ ThreadID, etw:ActivityId, NumBytes
+EndHeader
+
+"""
+
+
+def generate_rows(count):
+    """Random events of a firefox process and another one."""
+    rng = random.Random(42)
+    rows = []
+    threads = []
+    stage_events = [etlparser.CEVT_WINDOWS_RESTORED,
+                    etlparser.CEVT_XPCOM_SHUTDOWN]
+    for i in range(count):
+        tid = str(rng.randint(1, 12))
+        pid = rng.choice([PID, PID, 99])
+        proc = "firefox.exe (%d)" % pid
+        r = rng.random()
+        if i in (count // 3, 2 * count // 3):
+            rows.append(["T-DCStart", i, "firefox.exe (%d)" % PID, "100",
+                         "xul.dll!start"])
+            rows.append(["Mozilla/Event/Classic", i, proc, "100",
+                         stage_events.pop(0)])
+        elif r < 0.05 or not threads:
+            img = rng.choice(["firefox.exe", "xul.dll"])
+            rows.append(["T-DCStart", i, proc, tid, img + "!start"])
+            threads.append(tid)
+        elif r < 0.08:
+            rows.append(["T-End", i, proc, rng.choice(threads), "x!end"])
+        elif r < 0.15:
+            rows.append(["Microsoft-Windows-TCPIP/TcpDataTransferSend", i,
+                         proc, rng.choice(threads),
+                         "{conn%d}" % rng.randint(1, 5),
+                         rng.randint(1, 1000)])
+        else:
+            rows.append([rng.choice(etlparser.FILEIO_EVENTS), i, proc,
+                         rng.choice(threads), hex(rng.randint(1, 4096)),
+                         '"C:\\Program Files\\file%d, %d"'
+                         % (rng.randint(1, 20), rng.randint(1, 3))])
+    return "".join(", ".join(str(v) for v in row) + "\r\n" for row in rows)
+
+
+class FakeXperf(object):
+    """Stand-in for subprocess, running xperf on a recorded csv."""
+
+    PIPE = subprocess.PIPE
+    list2cmdline = staticmethod(subprocess.list2cmdline)
+
+    def __init__(self, csv, returncode=0):
+        self.csv = csv
+        self.returncode = returncode
+        self.commands = []
+
+    def call(self, command):
+        self.commands.append(command)
+        return 0
+
+    def Popen(self, command, stdout=None):
+        self.commands.append(command)
+        self.stdout = open(self.csv, 'rb')
+        return self
+
+    def wait(self):
+        return self.returncode
+
+
+class TestParseFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.csv = os.path.join(self.tempdir, 'test.etl.csv')
+        with open(self.csv, 'wb') as f:
+            f.write(HEADER + "Trailer\r\n" + generate_rows(5000))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def parse(self, jobs, chunkSize=etlparser.CHUNK_SIZE):
+        parser = etlparser.ETLParser(PID)
+        parser.parseFile(self.csv, jobs, chunkSize)
+        return parser.files, parser.io
+
+    def test_chunks(self):
+        files, io = self.parse(1)
+        self.assertTrue(files)
+        self.assertTrue([key for key in io if key[2] == 'net_io_bytes'])
+        self.assertEqual(set(key[2] for key in files),
+                         set(etlparser.stages + ['all']))
+        for chunkSize in (1000, 20000):
+            self.assertEqual(self.parse(3, chunkSize), (files, io))
+
+    def test_concurrent_parsers(self):
+        # parse the file for two processes at once, row by row
+        expected = []
+        parsers = []
+        for pid in (PID, 99):
+            parser = etlparser.ETLParser(pid)
+            parser.parseFile(self.csv)
+            expected.append((parser.files, parser.io))
+            parsers.append(etlparser.ETLParser(pid))
+        rows = list(parsers[0].readFile(self.csv))
+        parsers[1].headers = parsers[0].headers
+        parsers[1].columns = parsers[0].columns
+        for row in rows:
+            for parser in parsers:
+                parser.parseRows([row])
+        self.assertNotEqual(expected[0], expected[1])
+        self.assertEqual([(parser.files, parser.io) for parser in parsers],
+                         expected)
+
+    def run_etlparser(self, name, **kwargs):
+        output = os.path.join(self.tempdir, name + '.csv')
+        # the files of the fixture are not whitelisted
+        stdout = sys.stdout
+        sys.stdout = cStringIO.StringIO()
+        try:
+            etlparser.etlparser('xperf.exe', 'test.etl', PID,
+                                outputFile=output, all_stages=True,
+                                all_threads=True, **kwargs)
+        finally:
+            sys.stdout = stdout
+        with open(output) as f:
+            data = f.read()
+        with open(os.path.join(self.tempdir,
+                               name + '_thread_stats.csv')) as f:
+            return data, f.read()
+
+    def test_stream(self):
+        csv_copy = os.path.join(self.tempdir, 'copy.csv')
+        shutil.copy(self.csv, csv_copy)
+        etl2csv = etlparser.etl2csv
+        etlparser.etl2csv = lambda *args, **kwargs: csv_copy
+        try:
+            expected = self.run_etlparser('file', jobs=1)
+        finally:
+            etlparser.etl2csv = etl2csv
+        self.assertFalse(os.path.exists(csv_copy))
+        self.assertTrue(expected[0].count('\n') > 100)
+
+        with open(self.csv, 'rb') as dump:
+            self.assertEqual(self.run_etlparser('stream', dump=dump),
+                             expected)
+
+        fake = FakeXperf(self.csv)
+        etlparser.subprocess = fake
+        try:
+            self.assertEqual(self.run_etlparser('xperf', stream=True),
+                             expected)
+            self.assertEqual(fake.commands[-1],
+                             ['xperf.exe', '-i', 'test.etl'])
+            self.assertTrue(fake.stdout.closed)
+
+            # a failed conversion is not taken for a short run
+            fake.returncode = 1
+            self.assertRaises(xtalos.XTalosError, self.run_etlparser,
+                              'failed', stream=True)
+        finally:
+            etlparser.subprocess = subprocess
+
+    def test_find_chunks(self):
+        with open(self.csv, 'rb') as f:
+            start = etlparser.ETLParser(PID).readHeader(f)
+            self.assertEqual(f.read(5000).split('\r\n')[0][:10],
+                             'T-DCStart,')
+            chunks = etlparser.findChunks(f, start, 1000)
+            f.seek(0)
+            data = f.read()
+        self.assertEqual(chunks[0][0], start)
+        self.assertEqual(chunks[-1][1], len(data))
+        for (start, end), (next_start, next_end) in zip(chunks, chunks[1:]):
+            self.assertEqual(end, next_start)
+            self.assertEqual(data[end - 1], '\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+"""
+test the profile cache helpers of talos' ffsetup module
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from talos import ffsetup
+
+
+class TestProfileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.profile = os.path.join(self.tmpdir, 'cache')
+        os.makedirs(os.path.join(self.profile, 'extensions', 'addon'))
+        self.write('prefs.js', 'user_pref("a", 1);')
+        self.write(os.path.join('extensions', 'addon', 'install.rdf'), 'rdf')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, contents):
+        with open(os.path.join(self.profile, name), 'w') as f:
+            f.write(contents)
+
+    def digest(self):
+        sha = hashlib.sha1()
+        ffsetup.hash_path(sha, self.profile)
+        return sha.hexdigest()
+
+    def test_hash_path(self):
+        digest = self.digest()
+        self.assertEqual(digest, self.digest())
+        self.write('prefs.js', 'user_pref("a", 2);')
+        self.assertNotEqual(digest, self.digest())
+
+    def test_copy_profile(self):
+        dest = os.path.join(self.tmpdir, 'profile')
+        ffsetup.copy_profile(self.profile, dest)
+
+        prefs = os.path.join(dest, 'prefs.js')
+        addon = os.path.join(dest, 'extensions', 'addon', 'install.rdf')
+        self.assertEqual(open(prefs).read(), 'user_pref("a", 1);')
+        self.assertEqual(open(addon).read(), 'rdf')
+
+        # only add-on files are shared with the cache
+        cached = os.path.join(self.profile, 'prefs.js')
+        self.assertFalse(os.path.samefile(prefs, cached))
+        if hasattr(os, 'link'):
+            cached = os.path.join(self.profile, 'extensions', 'addon',
+                                  'install.rdf')
+            self.assertTrue(os.path.samefile(addon, cached))
+
+    def test_store_profile(self):
+        cache_dir = os.path.join(self.tmpdir, 'profiles', 'abc')
+        self.write('.parentlock', '')
+        ffsetup.store_profile(self.profile, cache_dir)
+        self.assertEqual(sorted(os.listdir(cache_dir)),
+                         ['extensions', 'prefs.js'])
+        # storing it again, as another process would, keeps the first copy
+        self.write('prefs.js', 'user_pref("a", 2);')
+        ffsetup.store_profile(self.profile, cache_dir)
+        with open(os.path.join(cache_dir, 'prefs.js')) as f:
+            self.assertEqual(f.read(), 'user_pref("a", 1);')
+        self.assertEqual(os.listdir(os.path.dirname(cache_dir)), ['abc'])
+
+    def test_store_profile_failure(self):
+        cache_dir = os.path.join(self.tmpdir, 'profiles', 'abc')
+        copytree = shutil.copytree
+
+        def partial_copytree(src, dst, **kwargs):
+            os.makedirs(dst)
+            raise shutil.Error([(src, dst, 'No space left on device')])
+
+        shutil.copytree = partial_copytree
+        try:
+            self.assertRaises(shutil.Error, ffsetup.store_profile,
+                              self.profile, cache_dir)
+        finally:
+            shutil.copytree = copytree
+        # no partial copy is left behind
+        self.assertEqual(os.listdir(os.path.dirname(cache_dir)), [])
+
+    def test_profile_path(self):
+        # the add-on manager state refers to the profile the cache is
+        # stored from, it must refer to the copy instead
+        addon = os.path.join(self.profile, 'extensions', 'addon')
+        self.write('extensions.json',
+                   json.dumps({'addons': [{'descriptor': addon}]}))
+        self.write('prefs.js', 'user_pref("extensions.xpiState", %s);'
+                   % json.dumps(json.dumps({'app-profile': {'addon': {
+                       'd': addon}}})))
+        cache_dir = os.path.join(self.tmpdir, 'profiles', 'abc')
+        ffsetup.store_profile(self.profile, cache_dir)
+        with open(os.path.join(cache_dir, 'prefs.js')) as f:
+            self.assertFalse(self.profile in f.read())
+
+        dest = os.path.join(self.tmpdir, 'profile')
+        ffsetup.copy_profile(cache_dir, dest)
+        addon = os.path.join(dest, 'extensions', 'addon')
+        with open(os.path.join(dest, 'extensions.json')) as f:
+            self.assertEqual(json.load(f)['addons'][0]['descriptor'], addon)
+        with open(os.path.join(dest, 'prefs.js')) as f:
+            pref = f.read()[len('user_pref("extensions.xpiState", '):-2]
+        self.assertEqual(
+            json.loads(json.loads(pref))['app-profile']['addon']['d'], addon)
+
+
+class TestFFSetup(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.base_profile = os.path.join(self.tmpdir, 'base')
+        os.makedirs(self.base_profile)
+        browser_config = {'profile_cache': os.path.join(self.tmpdir, 'cache'),
+                          'env': {}, 'symbols_path': None,
+                          'browser_path': '/bin/firefox', 'buildid': '1',
+                          'init_url': 'getInfo.html', 'preferences': {},
+                          'extensions': [], 'webserver': 'localhost'}
+        test_config = {'name': 'ts', 'profile_path': self.base_profile}
+        self.setup = ffsetup.FFSetup(browser_config, test_config)
+        self.setup._run_profile = self.fail
+        # a profile initialized by another test
+        self.cache_dir = self.setup._profile_cache_dir()
+        os.makedirs(self.cache_dir)
+        with open(os.path.join(self.cache_dir, 'prefs.js'), 'w') as f:
+            f.write('user_pref("a", 1);')
+
+    def tearDown(self):
+        self.setup.clean()
+        shutil.rmtree(self.tmpdir)
+
+    def test_cache_hit(self):
+        with self.setup as setup:
+            # the browser was not run
+            with open(os.path.join(setup.profile_dir, 'prefs.js')) as f:
+                self.assertEqual(f.read(), 'user_pref("a", 1);')
+        self.assertFalse(os.path.exists(self.setup.profile_dir))
+
+    def test_copy_failure(self):
+        copy_profile = ffsetup.copy_profile
+
+        def partial_copy(src, dest):
+            os.makedirs(dest)
+            raise OSError(28, 'No space left on device')
+
+        ffsetup.copy_profile = partial_copy
+        try:
+            self.assertRaises(OSError, self.setup.__enter__)
+        finally:
+            ffsetup.copy_profile = copy_profile
+        self.assertFalse(os.path.exists(self.setup._tmp_dir))
+        self.assertTrue(os.path.isdir(self.cache_dir))
+
+if __name__ == '__main__':
+    unittest.main()
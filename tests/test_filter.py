@@ -74,5 +74,45 @@ class TestFilter(unittest.TestCase):
         # delete foo again
         del talos.filter.scalar_filters['foo']
 
+    def test_confidence_interval(self):
+        """test the half width of the 95% confidence interval"""
+
+        self.assertEquals(talos.filter.confidence_interval([5., 5., 5.]), 0.)
+        # sample standard deviation of 1, 3 degrees of freedom
+        self.assertAlmostEqual(
+            talos.filter.confidence_interval([1., 2., 3., 2.]),
+            3.182 * (2. / 3 / 4) ** 0.5)
+        # large samples use the normal distribution
+        series = [float(i % 2) for i in range(100)]
+        self.assertAlmostEqual(talos.filter.confidence_interval(series),
+                               1.96 * (25. / 99 / 100) ** 0.5)
+
+    def test_summarize(self):
+        """test summarize matches the scalar filters"""
+
+        series_list = [[float(i * j % 7) + 0.1 * j for i in range(25)]
+                       for j in range(1, 6)]
+        for backend in (talos.filter.numpy, None):
+            numpy = talos.filter.numpy
+            talos.filter.numpy = backend
+            try:
+                summaries = talos.filter.summarize(series_list)
+            finally:
+                talos.filter.numpy = numpy
+            self.assertEquals(len(summaries), len(series_list))
+            for series, summary in zip(series_list, summaries):
+                self.assertEquals(summary['min'], min(series))
+                self.assertEquals(summary['max'], max(series))
+                self.assertEquals(summary['mean'],
+                                  talos.filter.mean(series))
+                self.assertEquals(summary['median'],
+                                  talos.filter.median(series))
+                self.assertEquals(summary['std'],
+                                  talos.filter.stddev(series))
+
+        # series of different lengths are summarized one by one
+        summaries = talos.filter.summarize([[1., 2.], [3., 4., 8.]])
+        self.assertEquals([i['median'] for i in summaries], [1.5, 4.])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+"""
+test talos.profiler.forwardingClient against a local stand-in symbol server
+"""
+
+import BaseHTTPServer
+import json
+import os
+import shutil
+import SocketServer
+import tempfile
+import threading
+import unittest
+
+from talos.profiler import forwardingClient
+
+
+class SymbolServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, versions=(4,), gzip=True, reject_status=400):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0),
+                                           SymbolHandler)
+        self.versions = versions
+        self.gzip = gzip
+        # status of the responses to unsupported requests
+        self.reject_status = reject_status
+        self.posts = 0
+        self.requests = []
+        self.connections = set()
+
+
+class SymbolHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.posts += 1
+        if self.headers.get('Content-Encoding') == 'gzip':
+            if not self.server.gzip:
+                return self.respond(self.server.reject_status, 'no gzip')
+            body = forwardingClient.gunzipData(body)
+        request = json.loads(body)
+        if request['version'] not in self.server.versions:
+            return self.respond(self.server.reject_status, 'bad version')
+        self.server.requests.append(request)
+        self.server.connections.add(self.client_address)
+
+        memory_map = request['memoryMap']
+        stacks = [['%s:%x' % (memory_map[index][0], offset)
+                   for index, offset in stack]
+                  for stack in request['stacks']]
+        if request['version'] == 3:
+            return self.respond(200, json.dumps(stacks))
+        known = [lib.startswith('known') for lib, breakpad_id in memory_map]
+        self.respond(200, json.dumps({'symbolicatedStacks': stacks,
+                                      'knownModules': known}))
+
+    def respond(self, status, data):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class TestForwardingClient(unittest.TestCase):
+
+    modules = [['known.so', 'A'], ['unknown.so', 'B']]
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.tempdir, 'cache')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tempdir)
+
+    def start_server(self, **kwargs):
+        self.server = SymbolServer(**kwargs)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return 'http://127.0.0.1:%d/' % self.server.server_address[1]
+
+    def test_batching_and_cache(self):
+        url = self.start_server()
+        client = forwardingClient.ForwardingClient(url, self.cache_path,
+                                                   batchDelay=0.2)
+        results = {}
+
+        def symbolicate(offset):
+            results[offset] = client.Symbolicate(
+                ['FIREFOX'], 1, self.modules, [[0, offset], [1, offset]])
+
+        threads = [threading.Thread(target=symbolicate, args=(offset,))
+                   for offset in (0x10, 0x20, 0x30)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # the three stacks were sent in a single request
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(len(self.server.requests[0]['stacks']), 3)
+        self.assertEqual(results[0x20], (['known.so:20', 'unknown.so:20'],
+                                         [True, False]))
+
+        # known modules are served from the cache, the other ones again
+        # from the server, on the same connection
+        self.assertEqual(client.Symbolicate(['FIREFOX'], 1, self.modules,
+                                            [[0, 0x30]]),
+                         (['known.so:30'], [True, False]))
+        client.Symbolicate(['FIREFOX'], 1, self.modules, [[1, 0x30]])
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.server.requests[1]['stacks'], [[[1, 0x30]]])
+        self.assertEqual(len(self.server.connections), 1)
+
+        # the cache survives in its file
+        client = forwardingClient.ForwardingClient(url, self.cache_path)
+        self.assertEqual(client.Symbolicate(['FIREFOX'], 1, self.modules[:1],
+                                            [[0, 0x10]]),
+                         (['known.so:10'], [True]))
+        self.assertEqual(len(self.server.requests), 2)
+
+    def check_fallback(self, **kwargs):
+        url = self.start_server(versions=(3,), gzip=False, **kwargs)
+        client = forwardingClient.ForwardingClient(url, batchDelay=0,
+                                                   compress=True)
+        self.assertEqual(client.Symbolicate(['FIREFOX'], 1, self.modules,
+                                            [[0, 0x10]]),
+                         (['known.so:10'], None))
+        self.assertEqual(self.server.posts, 3)
+        # later requests start from the format that worked
+        client.Symbolicate(['FIREFOX'], 1, self.modules, [[0, 0x20]])
+        self.assertEqual(self.server.posts, 4)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_fallback(self):
+        self.check_fallback()
+
+    def test_server_error(self):
+        # servers may also fail on the formats they don't support
+        self.check_fallback(reject_status=500)
+
+    def test_uncompressed(self):
+        url = self.start_server(gzip=False)
+        client = forwardingClient.ForwardingClient(url, batchDelay=0)
+        self.assertEqual(client.Symbolicate(['FIREFOX'], 1, self.modules,
+                                            [[0, 0x10]]),
+                         (['known.so:10'], [True, False]))
+        self.assertEqual(self.server.posts, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
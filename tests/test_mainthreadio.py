@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+"""
+test the main thread IO analysis of talos.mainthreadio
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from talos import mainthreadio
+from talos import results
+
+LOG = """\
+1,read,1.0,PoisonIOInterposer,C:\\Windows\\Fonts\\unknown-startup.ttf
+0,NEXT-STAGE
+1,read,2.0,PoisonIOInterposer,C:\\Windows\\Fonts\\arial.ttf
+1,read,3.0,PoisonIOInterposer,C:\\firefox\\xul.dll
+1,create/open,4.0,PoisonIOInterposer,C:\\data\\unexpected.txt
+1,read,150.0,PoisonIOInterposer,C:\\data\\unexpected.txt
+1,read,5.0,PoisonIOInterposer,(not available)
+0,NEXT-STAGE
+1,write,6.0,PoisonIOInterposer,C:\\data\\unexpected.txt
+"""
+
+
+class TestMainthreadIO(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.log = os.path.join(self.tempdir, 'mainthread_io.log')
+        with open(self.log, 'w') as f:
+            f.write(LOG)
+        with open(os.path.join(self.tempdir, 'dependentlibs.list'), 'w') as f:
+            f.write('xul.dll\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_analyze(self):
+        wl = mainthreadio.load_whitelist(self.tempdir)
+        output = os.path.join(self.tempdir, 'mainthread_io.json')
+        rows, errors, warnings = mainthreadio.analyze(self.log, wl, output)
+        # whitelisted files without 'ignore' are kept, but not errors
+        expected = [
+            ['normal', 'PoisonIOInterposer', 'C:\\Windows\\Fonts\\arial.ttf',
+             'read', 1, 1, 2.0],
+            ['normal', 'PoisonIOInterposer', 'C:\\data\\unexpected.txt',
+             'create/open', 1, 1, 4.0],
+            ['normal', 'PoisonIOInterposer', 'C:\\data\\unexpected.txt',
+             'read', 1, 1, 150.0],
+            ['shutdown', 'PoisonIOInterposer', 'C:\\data\\unexpected.txt',
+             'write', 1, 1, 6.0]]
+        if os.sep == '\\':
+            expected_rows = expected
+        else:
+            # the dependent library only matches on Windows
+            expected_rows = expected + [
+                ['normal', 'PoisonIOInterposer', 'C:\\firefox\\xul.dll',
+                 'read', 1, 1, 3.0]]
+        self.assertEqual(sorted(rows), sorted(expected_rows))
+        with open(output) as f:
+            self.assertEqual(sorted(json.load(f)), sorted(rows))
+
+        self.assertTrue(all(error.startswith('TEST-UNEXPECTED-FAIL | '
+                                             'mainthreadio | ')
+                            for error in errors))
+        self.assertEqual(
+            len([error for error in errors
+                 if 'c:\\data\\unexpected.txt' in error]), 3)
+        self.assertFalse([error for error in errors if 'arial' in error])
+        # long durations are reported, but are not errors
+        self.assertFalse([error for error in errors
+                          if 'Duration 150.0 >' in error])
+        self.assertEqual(len(warnings), 1)
+        self.assertTrue(warnings[0].startswith('TEST-INFO | mainthreadio | '))
+        self.assertTrue('Duration 150.0 > 100.0' in warnings[0])
+
+        # the whitelist is reused
+        self.assertEqual(mainthreadio.analyze(self.log, wl)[1:],
+                         (errors, warnings))
+
+    def test_failures(self):
+        self.assertEqual(mainthreadio.analyze(self.log, None),
+                         (None, ["Failed to load whitelist"], []))
+        wl = mainthreadio.load_whitelist(self.tempdir)
+        self.assertEqual(
+            mainthreadio.analyze(os.path.join(self.tempdir, 'missing'), wl),
+            (None, ["Log parsing failed"], []))
+
+    def test_results(self):
+        rows = [['normal', 'PoisonIOInterposer', 'C:\\a.txt', 'read', 1, 1,
+                 4.0]]
+        global_counters = {}
+        browser_log = results.BrowserLogResults(
+            '__start_report12__end_report'
+            '__startTimestamp1__endTimestamp'
+            '__startBeforeLaunchTimestamp0__endBeforeLaunchTimestamp'
+            '__startAfterTerminationTimestamp2'
+            '__endAfterTerminationTimestamp',
+            global_counters=global_counters, mainthread_io=rows)
+        self.assertEqual(global_counters, {'mainthreadio': [rows]})
+        self.assertTrue(browser_log.using_xperf)
+
+
+if __name__ == '__main__':
+    unittest.main()
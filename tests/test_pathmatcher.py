@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+"""
+test the whitelist path matching of talos.xtalos.pathmatcher
+"""
+
+import unittest
+
+from talos import mainthreadio
+from talos import whitelist
+from talos.xtalos import etlparser
+from talos.xtalos import pathmatcher
+
+
+class TestPathMatcher(unittest.TestCase):
+
+    def test_match(self):
+        matcher = pathmatcher.PathMatcher()
+        matcher.add('C:\\Windows\\win.ini')
+        matcher.add('C:\\Windows\\Fonts', pathmatcher.DIR)
+        matcher.add('C:\\Program Files', pathmatcher.RECURSIVE)
+        for path in ('C:\\Windows\\win.ini', 'C:/Windows/win.ini',
+                     'C:\\Windows\\Fonts\\arial.ttf',
+                     'C:\\Program Files\\Mozilla\\firefox.exe',
+                     'C:\\Program Files\\a.txt'):
+            self.assertTrue(matcher.match(path), path)
+        for path in ('C:\\Windows', 'C:\\Windows\\win.ini\\x',
+                     'C:\\Windows\\system.ini', 'C:\\Windows\\Fonts',
+                     'C:\\Windows\\Fonts\\x\\arial.ttf',
+                     'C:\\Program Files', 'C:\\Program', 'D:\\'):
+            self.assertFalse(matcher.match(path), path)
+
+    def test_load_whitelist(self):
+        matcher = pathmatcher.PathMatcher()
+        self.assertFalse(etlparser.checkWhitelist('C:\\a', None))
+        matcher.add('C:\\a', pathmatcher.RECURSIVE)
+        self.assertTrue(etlparser.checkWhitelist('C:\\a\\b\\c', matcher))
+
+
+class TestPathSanitizer(unittest.TestCase):
+
+    def test_xperf(self):
+        sanitize = etlparser.FILENAME_SANITIZER.sanitize
+        self.assertEqual(
+            sanitize('C:\\Program Files (x86)\\Mozilla\\firefox\\xul.dll'),
+            '{firefox}\\xul.dll')
+        self.assertEqual(
+            sanitize('C:\\Users\\x\\Desktop\\Profile\\prefs.js'),
+            '{profile}\\prefs.js')
+        self.assertEqual(sanitize('C:\\Windows\\Prefetch\\FIREFOX-1.pf'),
+                         'c:\\windows\\prefetch\\{prefetch}.pf')
+        self.assertEqual(sanitize('C:\\talos\\a\\installtime\\b'),
+                         '{talos}\\a\\{time}')
+
+    def test_memo(self):
+        calls = []
+        sanitizer = pathmatcher.PathSanitizer(
+            [(pathmatcher.PREFIX, 'a', '{a}'),
+             (pathmatcher.SUFFIX, 'b', '{b}')],
+            strip='\\', on_prefix=lambda *args: calls.append(args))
+        self.assertEqual(sanitizer.sanitize('\\X\\A\\C\\B\\D'), '{a}\\c\\{b}')
+        self.assertEqual(calls, [('{a}', '\\x\\')])
+        self.assertEqual(sanitizer.sanitize('\\X\\A\\C\\B\\D'), '{a}\\c\\{b}')
+        self.assertEqual(len(calls), 1)
+
+    def test_whitelist(self):
+        wl = whitelist.Whitelist('mainthreadio', {'{xre}': '/'},
+                                 mainthreadio.PATH_SUBSTITUTIONS,
+                                 mainthreadio.NAME_SUBSTITUTIONS)
+        self.assertEqual(
+            wl.sanitize_filename('C:\\Users\\cltbld\\AppData\\Local\\Temp'
+                                 '\\tmpabcdef\\profile\\prefs.js'),
+            '{profile}\\prefs.js')
+        # the directories of the profile are whitelisted
+        self.assertEqual(wl.PRE_PROFILE, '{appdata}\\local\\temp\\tmpabcdef')
+        self.assertEqual(sorted(wl.listmap),
+                         ['{appdata}\\local', '{appdata}\\local\\temp',
+                          '{appdata}\\local\\temp\\tmpabcdef'])
+        self.assertEqual(wl.sanitize_filename('C:\\Windows\\Fonts\\a.ttf '),
+                         '{fonts}\\a.ttf')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -78,5 +78,55 @@ class TestPageloaderResults(unittest.TestCase):
         self.assertEqual(filtered[0][0], 68.)
         self.assertEqual(filtered[-1][0], 1623.)
 
+    def test_filter_summary(self):
+        """test the data summary built by PageloaderResults.filter"""
+
+        results = talos.results.PageloaderResults(results_string)
+        filters = talos.filter.ignore_first.prepare(1) + \
+            talos.filter.median.prepare()
+        filtered = results.filter('tsvgx', filters)
+        self.assertEqual(len(filtered), 12)
+
+        summary, page = filtered[0]
+        self.assertEqual(page, 'gearflowers.svg')
+        self.assertEqual(summary['filtered'], 65.5)
+        self.assertEqual(summary['median'], 65.5)
+        self.assertEqual(summary['min'], 62.)
+        self.assertEqual(summary['max'], 68.)
+        self.assertEqual(summary['mean'], 65.25)
+        self.assertEqual(summary['std'],
+                         talos.filter.stddev([65., 68., 66., 62.]))
+
+        # non summary filters are still applied to the data
+        filters = talos.filter.ignore_max.prepare() + \
+            talos.filter.geometric_mean.prepare()
+        filtered = results.filter('tsvgx', filters)
+        self.assertEqual(
+            filtered[-1][0]['filtered'],
+            talos.filter.geometric_mean([1623., 1623., 1617., 1622.]))
+
+
+class TestTestResults(unittest.TestCase):
+
+    def test_converged(self):
+        """test the convergence of the results across cycles"""
+
+        filters = talos.filter.ignore_first.prepare(1) + \
+            talos.filter.median.prepare()
+        test_results = talos.results.TestResults({'name': 'ts_paint',
+                                                  'filters': filters})
+        for value in (400., 402.):
+            test_results.add(
+                "__start_report%s__end_report\n"
+                "__startTimestamp1333663595953__endTimestamp\n"
+                "__startBeforeLaunchTimestamp1333663595557"
+                "__endBeforeLaunchTimestamp\n"
+                "__startAfterTerminationTimestamp1333663596551"
+                "__endAfterTerminationTimestamp\n" % value)
+        self.assertEqual(test_results.cycle_values(), [400., 402.])
+        # the interval of two values is very wide
+        self.assertFalse(test_results.converged(0.02))
+        self.assertTrue(test_results.converged(0.1))
+
 if __name__ == '__main__':
     unittest.main()
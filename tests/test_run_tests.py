@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+"""
+test the scheduling of the tests in talos' run_tests module
+"""
+
+import threading
+import time
+import unittest
+
+from talos.run_tests import TestScheduler, cpu_sets
+from talos.utils import TalosError
+
+
+class FakeScheduler(TestScheduler):
+    """runs fake tests, recording how many run at the same time"""
+
+    def __init__(self, *args, **kwargs):
+        TestScheduler.__init__(self, *args, **kwargs)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def _runner(self, test, browser_config):
+        def run():
+            with self.lock:
+                self.running += 1
+                self.max_running = max(self.max_running, self.running)
+            time.sleep(test.get('duration', 0.05))
+            with self.lock:
+                self.running -= 1
+            if test.get('fail'):
+                raise TalosError(test['name'])
+            return test['name']
+        return run
+
+
+class TestTestScheduler(unittest.TestCase):
+
+    browser_config = {'cpu_affinity': None}
+
+    def results(self, scheduler):
+        results = []
+        for test, run in scheduler:
+            try:
+                results.append(run())
+            except TalosError, e:
+                results.append('error: %s' % e)
+        return results
+
+    def test_sequential(self):
+        tests = [{'name': 'a'}, {'name': 'b'}]
+        scheduler = FakeScheduler(tests, self.browser_config)
+        self.assertEqual(self.results(scheduler), ['a', 'b'])
+        self.assertEqual(scheduler.max_running, 1)
+
+    def test_parallel(self):
+        """results come in the order of the tests"""
+        tests = [{'name': 'a', 'duration': 0.2}, {'name': 'b'},
+                 {'name': 'c', 'fail': True}, {'name': 'd'}]
+        scheduler = FakeScheduler(tests, self.browser_config, workers=2)
+        self.assertEqual(self.results(scheduler),
+                         ['a', 'b', 'error: c', 'd'])
+        self.assertEqual(scheduler.max_running, 2)
+
+    def test_unsafe_tests_run_alone(self):
+        tests = [{'name': 'a'}, {'name': 'b', 'mainthread': True},
+                 {'name': 'c'}]
+        scheduler = FakeScheduler(tests, self.browser_config, workers=4)
+        self.assertEqual(self.results(scheduler), ['a', 'b', 'c'])
+        self.assertEqual(scheduler.max_running, 1)
+
+    def test_shared_files_run_alone(self):
+        tests = [{'name': 'a'}, {'name': 'b', 'sps_profile': True},
+                 {'name': 'c'}, {'name': 'd'}]
+        scheduler = FakeScheduler(tests, self.browser_config, workers=4)
+        self.assertEqual(self.results(scheduler), ['a', 'b', 'c', 'd'])
+        self.assertEqual(scheduler.max_running, 2)
+
+        browser_config = dict(self.browser_config, output_log='out.gz')
+        scheduler = FakeScheduler(tests, browser_config, workers=4)
+        self.assertEqual(self.results(scheduler), ['a', 'b', 'c', 'd'])
+        self.assertEqual(scheduler.max_running, 1)
+
+    def test_stop(self):
+        """stopping waits for the running tests"""
+        tests = [{'name': 'a', 'fail': True}, {'name': 'b', 'duration': 0.3},
+                 {'name': 'c'}]
+        scheduler = FakeScheduler(tests, self.browser_config, workers=2)
+        for test, run in scheduler:
+            self.assertRaises(TalosError, run)
+            break
+        scheduler.stop()
+        scheduler.join()
+        self.assertEqual(scheduler.running, 0)
+
+    def test_cpu_sets(self):
+        sets = cpu_sets(2)
+        self.assertEqual(len(sets), 2)
+        if sets[0] is not None:
+            self.assertTrue(all(sets))
+            self.assertEqual(cpu_sets(2, [2, 3, 4, 5]), [[2, 3], [4, 5]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+"""
+test the profile archiving of talos.sps_profile
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from talos import sps_profile as sps_profile_module
+from talos.sps_profile import SpsProfile
+
+
+class TestSpsProfile(unittest.TestCase):
+
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.upload_dir)
+
+    def run_cycles(self, pipeline):
+        sps_profile = SpsProfile(self.upload_dir,
+                                 {'symbols_path': None,
+                                  'sps_profile_pipeline': pipeline},
+                                 {'name': 'tfoo'})
+        for cycle in range(3):
+            path = os.path.join(sps_profile.option('dir'), 'page.sps')
+            with open(path, 'w') as f:
+                json.dump({'meta': {'version': 3}, 'threads': [],
+                           'cycle': cycle}, f)
+            sps_profile.symbolicate(cycle)
+        sps_profile.clean()
+
+        with zipfile.ZipFile(sps_profile.profile_arcname) as arc:
+            names = sorted(arc.namelist())
+            self.assertEqual(names, ['profile_tfoo/page/cycle_%d.sps' % i
+                                     for i in range(3)])
+            for cycle, name in enumerate(names):
+                self.assertEqual(json.loads(arc.read(name))['cycle'], cycle)
+
+    def test_symbolicate(self):
+        self.run_cycles(pipeline=False)
+
+    def test_pipeline(self):
+        self.run_cycles(pipeline=True)
+
+    def test_pipeline_crash(self):
+        # the profiles are not lost when the pipeline process dies
+        worker = sps_profile_module._pipeline_worker
+        sps_profile_module._pipeline_worker = \
+            lambda sps_profile, jobs, cpus: os._exit(1)
+        try:
+            self.run_cycles(pipeline=True)
+        finally:
+            sps_profile_module._pipeline_worker = worker
+
+
+if __name__ == '__main__':
+    unittest.main()
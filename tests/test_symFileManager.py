@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+"""
+test the symbol file loading of talos.profiler.symFileManager
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from talos.profiler import symFileManager
+
+SYM_FILE = """MODULE Linux x86_64 0123456789ABCDEF0 libxul.so
+FILE 0 foo.cpp
+FUNC 1000 20 0 Foo::Bar()
+1000 10 12 0
+PUBLIC 2000 0 baz
+FUNC 3000 8 0 qux(int, char*)
+"""
+
+
+class TestSymFileManager(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'libxul.sym')
+        with open(self.path, 'w') as f:
+            f.write(SYM_FILE)
+        self.manager = symFileManager.SymFileManager({})
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def check_lookups(self, symbols):
+        self.assertEqual(symbols.GetEntryCount(), 3)
+        self.assertEqual(symbols.LookupMany([0x2004, 0x10, 0x1000]),
+                         ['baz', None, 'Foo::Bar()'])
+        self.assertEqual(symbols.Lookup(0x10), None)
+        self.assertEqual(symbols.Lookup(0x1000), 'Foo::Bar()')
+        self.assertEqual(symbols.Lookup(0x1fff), 'Foo::Bar()')
+        self.assertEqual(symbols.Lookup(0x2004), 'baz')
+        self.assertEqual(symbols.Lookup(0x90000), 'qux(int, char*)')
+
+    def test_index(self):
+        index_path = self.path + symFileManager.INDEX_EXTENSION
+        symbols = self.manager.FetchSymbolsFromFile(self.path)
+        self.assertTrue(isinstance(symbols, symFileManager.MappedSymbolInfo))
+        self.assertTrue(os.path.isfile(index_path))
+        self.check_lookups(symbols)
+
+        # a second fetch maps the existing index instead of parsing
+        os.utime(self.path, (0, 0))
+        with open(self.path, 'w') as f:
+            f.write('garbage')
+        os.utime(self.path, (0, 0))
+        self.check_lookups(self.manager.FetchSymbolsFromFile(self.path))
+
+    def test_bad_index(self):
+        index_path = self.path + symFileManager.INDEX_EXTENSION
+        with open(index_path, 'w') as f:
+            f.write('not an index')
+        self.check_lookups(self.manager.FetchSymbolsFromFile(self.path))
+
+    def test_unwritable_index(self):
+        os.mkdir(self.path + symFileManager.INDEX_EXTENSION)
+        symbols = self.manager.FetchSymbolsFromFile(self.path)
+        self.assertTrue(isinstance(symbols, symFileManager.SymbolInfo))
+        self.check_lookups(symbols)
+
+
+class FakeSymbolInfo(object):
+
+    def __init__(self, entries, bytes):
+        self.entries, self.bytes = entries, bytes
+
+    def GetEntryCount(self):
+        return self.entries
+
+    def GetMemoryUsage(self):
+        return self.bytes
+
+
+class TestSymbolCache(unittest.TestCase):
+
+    def test_lru(self):
+        cache = symFileManager.SymbolCache()
+        cache.SetLimits(maxEntries=10, maxBytes=1000)
+        cache.Put('a', FakeSymbolInfo(4, 100))
+        cache.Put('b', FakeSymbolInfo(4, 100))
+        self.assertTrue(cache.Get('a'))
+        # 'b' is the least recently used one
+        cache.Put('c', FakeSymbolInfo(4, 100))
+        self.assertFalse('b' in cache)
+        self.assertTrue('a' in cache and 'c' in cache)
+        # the memory budget is honoured as well
+        cache.Put('d', FakeSymbolInfo(1, 900))
+        self.assertEqual(list(cache.entries), ['c', 'd'])
+        self.assertEqual(cache.Get('b'), None)
+        self.assertEqual(cache.GetStats(), {
+            'libraries': 2, 'entries': 5, 'bytes': 1000,
+            'hits': 1, 'misses': 1, 'evictions': 2})
+
+    def test_replace(self):
+        cache = symFileManager.SymbolCache()
+        cache.Put('a', FakeSymbolInfo(4, 100))
+        cache.Put('a', FakeSymbolInfo(2, 50))
+        self.assertEqual((cache.entryCount, cache.byteCount), (2, 50))
+        cache.SetLimits(maxEntries=1)
+        self.assertEqual(len(cache), 0)
+
+    def test_shared(self):
+        cache = symFileManager.SymbolCache()
+        sCache = symFileManager.SymFileManager.sCache
+        symFileManager.SymFileManager.sCache = cache
+        try:
+            symFileManager.SymFileManager({"maxCacheEntries": 10})
+            symFileManager.SymFileManager({"maxCacheEntries": 5,
+                                           "maxCacheBytes": 1000})
+            self.assertEqual((cache.maxEntries, cache.maxBytes), (10, 1000))
+            # managers without limits don't make the cache unbounded
+            symFileManager.SymFileManager({})
+            self.assertEqual((cache.maxEntries, cache.maxBytes), (10, 1000))
+            symFileManager.SymFileManager({"maxCacheBytes": 2000})
+            self.assertEqual((cache.maxEntries, cache.maxBytes), (10, 2000))
+        finally:
+            symFileManager.SymFileManager.sCache = sCache
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+"""
+test the local symbolication service of talos.profiler.symbolServer
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import urllib2
+
+from talos.profiler import forwardingClient, symbolServer
+
+
+class TestSymbolServer(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        # SymFileManager caches are shared, use an id of our own
+        lib_dir = os.path.join(self.tempdir, 'libxul.so', 'SERVERID')
+        os.makedirs(lib_dir)
+        with open(os.path.join(lib_dir, 'libxul.so.sym'), 'w') as f:
+            f.write('MODULE Linux x86_64 SERVERID libxul.so\n'
+                    'FUNC 1000 20 0 nsFoo::Run()\n'
+                    'PUBLIC 2000 0 bar\n')
+        args = symbolServer.parse_args(['--symbolPath', self.tempdir,
+                                        '--port', '0'])
+        self.server = symbolServer.SymbolServer(
+            ('127.0.0.1', 0), symbolServer.get_options(args))
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.url = 'http://127.0.0.1:%d/' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tempdir)
+
+    def test_symbolicate(self):
+        client = forwardingClient.ForwardingClient(self.url, batchDelay=0)
+        modules = [['libxul.so', 'SERVERID'], ['libc.so', 'SERVERID']]
+        self.assertEqual(
+            client.Symbolicate(['FIREFOX', 'WINDOWS'], 1, modules,
+                               [[0, 0x1004], [0, 0x2100], [1, 0x10]]),
+            (['nsFoo::Run() (in libxul.so)', 'bar (in libxul.so)',
+              '0x10 (in libc.so)'], [True, False]))
+
+        stats = json.loads(urllib2.urlopen(self.url + 'stats').read())
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['pcs'], 3)
+        self.assertTrue(stats['cache']['libraries'] >= 1)
+
+    def test_invalid_request(self):
+        request = urllib2.Request(self.url, json.dumps({'version': 2}),
+                                  {'Content-Type': 'application/json'})
+        with self.assertRaises(urllib2.HTTPError) as e:
+            urllib2.urlopen(request)
+        self.assertEqual(e.exception.code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+
+"""
+test the profile symbolication of talos.profiler.symbolication
+"""
+
+import copy
+import cStringIO
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+
+from talos.profiler import symbolication
+
+
+class FakeSymbolDumper(object):
+
+    def __init__(self):
+        self.threads = set()
+        self.dumped = []
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def store_symbols(self, lib_path, breakpad_id,
+                      output_filename_without_extension):
+        with self.lock:
+            self.threads.add(threading.current_thread().name)
+            self.dumped.append(lib_path)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        # give the other dumps time to start
+        time.sleep(0.05)
+        with self.lock:
+            self.running -= 1
+        output_filename = output_filename_without_extension + ".nmsym"
+        with open(output_filename, "w") as f:
+            f.write("0000000000001000 T %s\n" % os.path.basename(lib_path))
+        return output_filename
+
+
+class TestSymbolDumping(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.symbol_dir = os.path.join(self.tempdir, 'symbols')
+        self.zip_path = os.path.join(self.tempdir, 'missingsymbols.zip')
+        self.libs = []
+        for i in range(4):
+            lib_path = os.path.join(self.tempdir, 'lib%d.so' % i)
+            open(lib_path, 'w').close()
+            self.libs.append({'name': lib_path, 'breakpadId': 'ID%d' % i,
+                              'start': i * 100, 'end': i * 100 + 50})
+        self.symbolicator = symbolication.ProfileSymbolicator({
+            'symbolPaths': {'FIREFOX': self.symbol_dir}
+        })
+        self.symbolicator.symbol_dumper = FakeSymbolDumper()
+        self.symbolicator.get_unknown_modules_in_profile = \
+            lambda profile: self.libs
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_dump_missing_symbols(self):
+        # the libraries of another process
+        self.libs += [dict(lib, start=lib['start'] + 1000,
+                           end=lib['end'] + 1000) for lib in self.libs]
+        # dump with several threads, even on a single cpu
+        cpu_count = multiprocessing.cpu_count
+        multiprocessing.cpu_count = lambda: 4
+        try:
+            self.symbolicator.dump_and_integrate_missing_symbols(
+                {}, self.zip_path)
+        finally:
+            multiprocessing.cpu_count = cpu_count
+        dumper = self.symbolicator.symbol_dumper
+        self.assertEqual(sorted(dumper.dumped),
+                         sorted(lib['name'] for lib in self.libs[:4]))
+        self.assertTrue(dumper.max_running > 1)
+        names = ['lib%d.so/ID%d/lib%d.so.nmsym' % (i, i, i) for i in range(4)]
+        with zipfile.ZipFile(self.zip_path) as zf:
+            self.assertEqual(sorted(zf.namelist()), names)
+        for name in names:
+            self.assertTrue(
+                os.path.isfile(os.path.join(self.symbol_dir, name)))
+
+        # dumped symbols are reused from the zip file
+        shutil.rmtree(self.symbol_dir)
+        self.symbolicator.symbol_dumper = FakeSymbolDumper()
+        self.symbolicator.dump_and_integrate_missing_symbols({},
+                                                             self.zip_path)
+        self.assertEqual(self.symbolicator.symbol_dumper.threads, set())
+        for name in names:
+            self.assertTrue(
+                os.path.isfile(os.path.join(self.symbol_dir, name)))
+
+
+class TestSymbolMemo(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        lib_dir = os.path.join(self.tempdir, 'libxul.so', 'ID')
+        os.makedirs(lib_dir)
+        with open(os.path.join(lib_dir, 'libxul.so.nmsym'), 'w') as f:
+            f.write('0000000000001000 T foo\n0000000000002000 T bar\n')
+        self.memo_path = os.path.join(self.tempdir, 'memo')
+        self.options = {'symbolPaths': {'FIREFOX': self.tempdir},
+                        'defaultApp': 'FIREFOX', 'defaultOs': 'WINDOWS',
+                        'remoteSymbolServer': None}
+        self.libs = [{'name': '/lib/libxul.so', 'breakpadId': 'ID',
+                      'start': 0x10000, 'end': 0x20000},
+                     {'name': '/lib/libc.so', 'breakpadId': 'ID',
+                      'start': 0x30000, 'end': 0x40000}]
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def resolve(self, memo, addresses):
+        symbolicator = symbolication.ProfileSymbolicator(self.options, memo)
+        libs = sorted(self.libs, key=lambda lib: lib['start'])
+        return symbolicator._resolve_symbols(
+            symbolicator._assign_symbols_to_libraries(addresses, libs))
+
+    def test_memo(self):
+        memo = symbolication.SymbolMemo(self.memo_path)
+        self.assertEqual(self.resolve(memo, ['0x11004', '0x30010']),
+                         {'0x11004': 'foo (in libxul.so)',
+                          '0x30010': '0x10 (in libc.so)'})
+        # only the symbols of libraries with symbols are remembered
+        self.assertEqual(memo.symbols,
+                         {('libxul.so', 'ID', 0x1004): 'foo (in libxul.so)'})
+
+        # a later profile loaded elsewhere reuses them, even from the file
+        self.libs[0]['start'] += 0x100000
+        self.libs[0]['end'] += 0x100000
+        memo = symbolication.SymbolMemo(self.memo_path)
+        request = symbolication.SymbolicationRequest
+        symbolication.SymbolicationRequest = None
+        try:
+            self.assertEqual(self.resolve(memo, ['0x111004']),
+                             {'0x111004': 'foo (in libxul.so)'})
+        finally:
+            symbolication.SymbolicationRequest = request
+
+
+class TestAssignSymbols(unittest.TestCase):
+
+    libs = [{'name': 'a', 'start': 0x100, 'end': 0x200},
+            {'name': 'b', 'start': 0x200, 'end': 0x280},
+            {'name': 'c', 'start': 0x1000, 'end': 0x2000}]
+    addresses = ['0x0', '0x100', '0x1ff', '0x200', '0x27f', '0x280',
+                 '0x1abc', '0xffffffffffffffff']
+
+    def assign(self):
+        symbolicator = symbolication.ProfileSymbolicator(
+            {'symbolPaths': {}})
+        return sorted(
+            (lib['library']['name'], sorted(zip(lib['symbols'],
+                                                lib['offsets'])))
+            for lib in symbolicator._assign_symbols_to_libraries(
+                set(self.addresses), self.libs))
+
+    def test_assign(self):
+        expected = [('a', [('0x100', 0), ('0x1ff', 0xff)]),
+                    ('b', [('0x200', 0), ('0x27f', 0x7f)]),
+                    ('c', [('0x1abc', 0xabc)])]
+        self.assertEqual(self.assign(), expected)
+        numpy = symbolication.numpy
+        symbolication.numpy = None
+        try:
+            self.assertEqual(self.assign(), expected)
+        finally:
+            symbolication.numpy = numpy
+
+
+class TestStreamingSymbolication(TestSymbolMemo):
+
+    def profile(self, version):
+        libs = json.dumps(self.libs)
+        if version == 3:
+            thread = {'name': 'Gecko',
+                      'stringTable': ['0x11004', 'js::RunScript', '0x12008',
+                                      '0x30010', u'\xe9\\"'],
+                      'samples': {'data': [[0, 1, 2.5, None]] * 3}}
+        else:
+            thread = {'samples': [
+                {'frames': [{'location': '0x11004', 'lr': '0x12008'},
+                            {'location': 'js::RunScript'}],
+                 'time': 1.5}] * 3}
+        # string-encoded threads are only supported for v3 profiles
+        nested = {'meta': {'version': version}, 'libs': libs,
+                  'threads': [copy.deepcopy(thread)]}
+        return {'meta': {'version': version}, 'libs': libs,
+                'threads': [thread, json.dumps(nested)][:version - 1]}
+
+    def check_stream(self, profile):
+        expected = copy.deepcopy(profile)
+        symbolicator = symbolication.ProfileSymbolicator(self.options)
+        symbolicator.symbolicate_profile(expected)
+
+        output = cStringIO.StringIO()
+        symbolicator.symbolicate_profile_stream(
+            cStringIO.StringIO(json.dumps(profile, indent=1)), output)
+        result = json.loads(output.getvalue())
+        self.assertEqual(result['threads'][0], expected['threads'][0])
+        for thread, expected_thread in zip(result['threads'][1:],
+                                           expected['threads'][1:]):
+            self.assertEqual(json.loads(thread), json.loads(expected_thread))
+        return result
+
+    def test_v3(self):
+        result = self.check_stream(self.profile(3))
+        self.assertEqual(result['threads'][0]['stringTable'][:4],
+                         ['foo (in libxul.so)', 'js::RunScript',
+                          'bar (in libxul.so)', '0x10 (in libc.so)'])
+
+    def test_v2(self):
+        result = self.check_stream(self.profile(2))
+        self.assertEqual(result['threads'][0]['samples'][0]['frames'][0],
+                         {'location': 'foo (in libxul.so)', 'lr': '0x12008'})
+
+    def test_small_chunks(self):
+        profile = self.profile(3)
+
+        def length(raw):
+            return str(len(raw))
+
+        for schema in (None, {'threads': [{'stringTable': [length]}]}):
+            stream = symbolication.streaming.JSONStream(
+                cStringIO.StringIO(json.dumps(profile)), chunk_size=3)
+            output = cStringIO.StringIO()
+            symbolication.streaming.transform(stream, output, schema)
+            if schema:
+                profile['threads'][0]['stringTable'] = [
+                    len(json.dumps(s))
+                    for s in profile['threads'][0]['stringTable']]
+            self.assertEqual(json.loads(output.getvalue()), profile)
+
+    def test_multi_process_v3(self):
+        profile = self.profile(3)
+        # the content process loaded libxul elsewhere
+        nested = json.loads(profile['threads'][1])
+        libs = json.loads(nested['libs'])
+        libs[0]['start'] += 0x100000
+        libs[0]['end'] += 0x100000
+        nested['libs'] = json.dumps(libs)
+        nested['threads'][0]['stringTable'][0] = '0x111004'
+        nested['threads'][0]['stringTable'][2] = '0x112008'
+        profile['threads'][1] = json.dumps(nested)
+
+        symbolicator = symbolication.ProfileSymbolicator(self.options)
+        resolve = symbolicator._resolve_symbols
+        calls = []
+
+        def resolve_once(symbols_to_resolve):
+            symbols_to_resolve = list(symbols_to_resolve)
+            calls.append(symbols_to_resolve)
+            return resolve(symbols_to_resolve)
+
+        symbolicator._resolve_symbols = resolve_once
+        result = copy.deepcopy(profile)
+        symbolicator.symbolicate_profile(result)
+        # the same library offsets of both processes are resolved once
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(len(lib['offsets']) for lib in calls[0]),
+                         [1, 2])
+        stringTable = ['foo (in libxul.so)', 'js::RunScript',
+                       'bar (in libxul.so)', '0x10 (in libc.so)']
+        self.assertEqual(result['threads'][0]['stringTable'][:4],
+                         stringTable)
+        self.assertEqual(
+            json.loads(result['threads'][1])['threads'][0]['stringTable'][:4],
+            stringTable)
+
+        del calls[:]
+        output = cStringIO.StringIO()
+        symbolicator.symbolicate_profile_stream(
+            cStringIO.StringIO(json.dumps(profile)), output)
+        self.assertEqual(len(calls), 1)
+        streamed = json.loads(output.getvalue())
+        self.assertEqual(streamed['threads'][0], result['threads'][0])
+        self.assertEqual(json.loads(streamed['threads'][1]),
+                         json.loads(result['threads'][1]))
+
+    def test_no_libs(self):
+        output = cStringIO.StringIO()
+        symbolicator = symbolication.ProfileSymbolicator(self.options)
+        symbolicator.symbolicate_profile_stream(
+            cStringIO.StringIO('{"threads": []}'), output)
+        self.assertEqual(output.getvalue(), '{"threads": []}')
+
+
+if __name__ == '__main__':
+    unittest.main()
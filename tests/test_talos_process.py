@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+"""
+test the browser output reader of talos_process
+"""
+
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from threading import Event
+
+import psutil
+
+from talos.talos_process import Reader, isolate
+
+
+class TestReader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_output(self):
+        reader = Reader(Event())
+        for i in range(10):
+            reader('line %d' % i)
+        reader('JavaScript error: ignored')
+        self.assertEqual(list(reader.output), ['line %d' % i
+                                               for i in range(10)])
+
+    def test_output_lines(self):
+        """only the last lines are kept, the log has them all"""
+        log = os.path.join(self.tmpdir, 'browser_output.log.gz')
+        output_log = gzip.open(log, 'ab')
+        reader = Reader(Event(), output_lines=3, output_log=output_log)
+        for i in range(10):
+            reader('line %d' % i)
+        output_log.close()
+
+        self.assertEqual(list(reader.output), ['line 7', 'line 8', 'line 9'])
+        self.assertEqual(gzip.open(log).read().splitlines(),
+                         ['line %d' % i for i in range(10)])
+
+
+class FakeProcess(object):
+
+    def __init__(self, denied=False):
+        self.denied = denied
+        self.niceness = 0
+        self.cpus = None
+        self.child_processes = []
+
+    def children(self, recursive=False):
+        return self.child_processes
+
+    def cpu_affinity(self, cpus):
+        self.cpus = cpus
+
+    def nice(self, value):
+        if self.denied:
+            raise psutil.AccessDenied()
+        self.niceness = value
+
+
+class TestIsolate(unittest.TestCase):
+
+    def test_access_denied(self):
+        process = FakeProcess(denied=True)
+        process.child_processes = [FakeProcess(denied=True), FakeProcess()]
+        isolate(process, cpu_affinity=[2, 3], nice=-5)
+        # the allowed settings are still applied, to all the processes
+        self.assertEqual([proc.cpus for proc in
+                          [process] + process.child_processes],
+                         [[2, 3]] * 3)
+        self.assertEqual([proc.niceness for proc in
+                          [process] + process.child_processes], [0, 0, -5])
+
+
+if __name__ == '__main__':
+    unittest.main()